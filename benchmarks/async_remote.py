@@ -0,0 +1,88 @@
+import blesim
+from remote.aio import AsyncPoweredUPRemote
+from remote.control import PoweredUPColors
+from utime import ticks_us, ticks_diff
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Async front end on the simulated radio: connects,
+sets the color, also with a full write queue,
+streams button notifications and drains them with
+async for, reports the latency from the irq to the
+coroutine
+
+PYTHONPATH=host:. python3 benchmarks/async_remote.py
+"""
+
+PRESSES = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+)
+
+EVENTS = 2000
+RATE_HZ = 100
+
+
+async def radio(ble):
+    """
+    deliver the simulated events, one virtual ms per event loop turn
+
+    :param ble: simulated radio
+    :returns: nothing
+    """
+    while True:
+        ble.run(until_us=ble.now_us + 1000)
+        await asyncio.sleep(0)
+
+
+async def session():
+    """
+    run the session and print the results
+
+    :returns: nothing
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = AsyncPoweredUPRemote(ble=ble)
+    task = asyncio.create_task(radio(ble))
+
+    if not await remote.connect():
+        raise AssertionError("remote did not connect")
+    await remote.set_color(PoweredUPColors.RED)
+    if peripheral.writes[-1][1][-1] != PoweredUPColors.RED:
+        raise AssertionError("color not written")
+
+    # a full write queue drops the color, set_color must not wait for it
+    handler = remote._AsyncPoweredUPRemote__remote._PoweredUPRemote__handler
+    while handler.write_stats()["depth"] < 16:
+        handler.write(bytes([0x08, 0x00, 0x81, 0x34, 0x11, 0x51, 0x00, PoweredUPColors.RED]))
+    try:
+        await asyncio.wait_for(remote.set_color(PoweredUPColors.BLUE), 1)
+    except asyncio.TimeoutError:
+        raise AssertionError("set_color waits for a dropped write")
+
+    ble.stream(peripheral, 0x0B, (PRESSES[i % len(PRESSES)] for i in range(EVENTS)), RATE_HZ)
+    ble.schedule(EVENTS * 1000000 // RATE_HZ + 1000, ble.remove, peripheral)
+
+    count = 0
+    latency = 0
+    async for button in remote.buttons():
+        latency += ticks_diff(ticks_us(), ble.irq_ticks_us)
+        count += 1
+    task.cancel()
+
+    if count != EVENTS:
+        raise AssertionError("lost buttons: %d of %d, %d overruns" % (count, EVENTS, remote.overruns))
+    print("irq to coroutine latency: %.2f us avg" % (latency / count))
+
+
+asyncio.run(session())
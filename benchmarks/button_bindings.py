@@ -0,0 +1,238 @@
+import blesim
+from remote.control import PoweredUPRemote, PoweredUPButtons
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Button dispatch of the examples on the simulated radio:
+the if/elif chains of examples/driving and examples/dots
+against the same actions bound with remote.bind(). Both
+must call the same actions and the bindings must not be
+slower. The dispatch cost is the best time per notification
+in the irq above an empty button callback, the runs of
+the three remotes alternate.
+
+PYTHONPATH=host:. python3 benchmarks/button_bindings.py
+"""
+
+# left plus, both plus, left minus right plus, both minus, center, released
+PRESSES = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x7F]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+)
+
+_IRQ_GATTC_NOTIFY = 1 << 13
+
+EVENTS = 4400
+RATE_HZ = 200
+REPEAT = 15
+
+
+class MotorPair:
+    """
+    records the calls of spike.MotorPair
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def start(self, steering=0, speed=None):
+        self.calls.append((steering, speed))
+
+    def stop(self):
+        self.calls.append(None)
+
+
+class LightMatrix:
+    """
+    records the calls of the light matrix of spike.PrimeHub
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def off(self):
+        self.calls.append(None)
+
+    def set_pixel(self, x, y, brightness=100):
+        self.calls.append((x, y))
+
+
+def driving(motor_pair):
+    # on_button of examples/driving before the bindings
+    def on_button(button):
+        if button == PoweredUPButtons.RIGHT_PLUS:
+            motor_pair.start(speed=75)
+        elif button == PoweredUPButtons.RIGHT_MINUS:
+            motor_pair.start(speed=-75)
+        elif button == PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS:
+            motor_pair.start(steering=-45, speed=75)
+        elif button == PoweredUPButtons.LEFT_MINUS_RIGHT_PLUS:
+            motor_pair.start(steering=45, speed=75)
+        elif button == PoweredUPButtons.LEFT_MINUS_RIGHT_MINUS:
+            motor_pair.start(steering=45, speed=-75)
+        elif button == PoweredUPButtons.LEFT_PLUS_RIGHT_MINUS:
+            motor_pair.start(steering=-45, speed=-75)
+        elif button == PoweredUPButtons.RELEASED:
+            motor_pair.stop()
+        else:
+            motor_pair.stop()
+    return on_button
+
+
+def driving_bindings(motor_pair):
+    return {
+        PoweredUPButtons.RIGHT_PLUS: (motor_pair.start, 0, 75),
+        PoweredUPButtons.RIGHT_MINUS: (motor_pair.start, 0, -75),
+        PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS: (motor_pair.start, -45, 75),
+        PoweredUPButtons.LEFT_MINUS_RIGHT_PLUS: (motor_pair.start, 45, 75),
+        PoweredUPButtons.LEFT_MINUS_RIGHT_MINUS: (motor_pair.start, 45, -75),
+        PoweredUPButtons.LEFT_PLUS_RIGHT_MINUS: (motor_pair.start, -45, -75),
+    }, motor_pair.stop
+
+
+def dots(light_matrix):
+    # on_button of examples/dots
+    def on_button(button):
+        light_matrix.off()
+        if button == PoweredUPButtons.LEFT_PLUS:
+            light_matrix.set_pixel(0, 0, brightness=100)
+        elif button == PoweredUPButtons.LEFT_RED:
+            light_matrix.set_pixel(1, 0, brightness=100)
+        elif button == PoweredUPButtons.LEFT_MINUS:
+            light_matrix.set_pixel(2, 0, brightness=100)
+        elif button == PoweredUPButtons.RIGHT_PLUS:
+            light_matrix.set_pixel(3, 0, brightness=100)
+        elif button == PoweredUPButtons.RIGHT_RED:
+            light_matrix.set_pixel(4, 0, brightness=100)
+        elif button == PoweredUPButtons.RIGHT_MINUS:
+            light_matrix.set_pixel(0, 1, brightness=100)
+        elif button == PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS:
+            light_matrix.set_pixel(0, 2, brightness=100)
+        elif button == PoweredUPButtons.RELEASED:
+            light_matrix.off()
+        else:
+            light_matrix.off()
+    return on_button
+
+
+def dots_bindings(light_matrix):
+    def pixel(x, y):
+        light_matrix.off()
+        light_matrix.set_pixel(x, y, brightness=100)
+
+    def off():
+        light_matrix.off()
+        light_matrix.off()
+
+    return {
+        PoweredUPButtons.LEFT_PLUS: (pixel, 0, 0),
+        PoweredUPButtons.LEFT_RED: (pixel, 1, 0),
+        PoweredUPButtons.LEFT_MINUS: (pixel, 2, 0),
+        PoweredUPButtons.RIGHT_PLUS: (pixel, 3, 0),
+        PoweredUPButtons.RIGHT_RED: (pixel, 4, 0),
+        PoweredUPButtons.RIGHT_MINUS: (pixel, 0, 1),
+        PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS: (pixel, 0, 2),
+    }, off
+
+
+def connected(on_button=None, bindings=None):
+    """
+    a remote connected on the simulated radio
+
+    :param on_button: button callback
+    :param bindings: (bindings, default action) of remote.bind
+    :returns: (irq handler, notifications of the presses)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble)
+    if on_button:
+        remote.on_button(on_button)
+    if bindings:
+        remote.bind(bindings[0], default=bindings[1])
+    remote.connect()
+    ble.run()
+    notifications = [(peripheral.conn_handle, 0x0B, PRESSES[i % len(PRESSES)]) for i in range(EVENTS)]
+    return ble.handler, notifications
+
+
+def stream(irq, notifications):
+    # straight into the irq handler, the event queue of the radio would hide the dispatch
+    start = ticks_us()
+    for data in notifications:
+        irq(_IRQ_GATTC_NOTIFY, data)
+    return ticks_diff(ticks_us(), start) / EVENTS
+
+
+def sessions(remotes):
+    """
+    stream the presses to the remotes, the runs of the remotes alternate
+    so a busy host slows them alike
+
+    :param remotes: (irq handler, notifications) per remote
+    :returns: best host time per notification in us of REPEAT runs per remote
+    """
+    best = [None] * len(remotes)
+    for _ in range(REPEAT):
+        for i, (irq, notifications) in enumerate(remotes):
+            elapsed = stream(irq, notifications)
+            if best[i] is None or elapsed < best[i]:
+                best[i] = elapsed
+    return best
+
+
+def chord():
+    """
+    a raw chord without button code gets its own action
+
+    :returns: nothing
+    """
+    calls = []
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble)
+    remote.bind({PoweredUPButtons.LEFT_PLUS: (calls.append, "plus"), (0x01, 0x00, 0x01): (calls.append, "chord")})
+    remote.connect()
+    ble.run()
+    ble.stream(peripheral, 0x0B, (PRESSES[0], PRESSES[7], PRESSES[9], PRESSES[10]), RATE_HZ)
+    ble.run()
+    if calls != ["plus", "chord", "plus"]:
+        raise AssertionError("wrong chord actions: %s" % calls)
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    chord()
+    for name, chain, table, target in (("driving", driving, driving_bindings, MotorPair),
+                                       ("dots", dots, dots_bindings, LightMatrix)):
+        chained = target()
+        bound = target()
+        empty, elif_us, bind_us = sessions((connected(on_button=lambda button: None),
+                                            connected(on_button=chain(chained)),
+                                            connected(bindings=table(bound))))
+        if chained.calls != bound.calls:
+            raise AssertionError("%s: bindings call other actions" % name)
+        # the fastest run is the floor, so no cost is negative
+        floor = min(empty, elif_us, bind_us)
+        print("%-8s if/elif %.2f us, bindings %.2f us per notification above an empty callback" %
+              (name, elif_us - floor, bind_us - floor))
+        if bind_us > elif_us:
+            raise AssertionError("%s: bindings %.2f us slower than if/elif %.2f us" % (name, bind_us, elif_us))
+
+run()
@@ -0,0 +1,167 @@
+from remote.control import PoweredUPRemote
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Micro benchmark of the remote button decoding:
+replays a recorded stream of notifications through
+the button decoder and reports the decode cost per
+event for the previous comparison chain (before)
+and the table driven decoder (after), the table
+driven decoder must be faster
+
+run on the hub or on the host with the stand-in modules:
+PYTHONPATH=host:. python3 benchmarks/button_decode.py
+"""
+
+# recorded notifications of a driving session, button presses,
+# chords, center button and the port format acknowledgements
+RECORDED = (
+    bytes([0x0A, 0x00, 0x47, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x01]),
+    bytes([0x0A, 0x00, 0x47, 0x01, 0x00, 0x01, 0x00, 0x00, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x7F]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+)
+
+ROUNDS = 200
+REPEAT = 9
+
+
+class _LegacyDecoder:
+    """
+    Reference copy of the comparison chain decoder
+    """
+
+    def __init__(self, callback):
+        self.BUTTON_LEFT_PLUS = bytes([0x05, 0x00, 0x45, 0x00, 0x01])
+        self.BUTTON_LEFT_RED = bytes([0x05, 0x00, 0x45, 0x00, 0x7F])
+        self.BUTTON_LEFT_MINUS = bytes([0x05, 0x00, 0x45, 0x00, 0xFF])
+        self.BUTTON_LEFT_RELEASED = bytes([0x05, 0x00, 0x45, 0x00, 0x00])
+        self.BUTTON_RIGHT_PLUS = bytes([0x05, 0x00, 0x45, 0x01, 0x01])
+        self.BUTTON_RIGHT_RED = bytes([0x05, 0x00, 0x45, 0x01, 0x7F])
+        self.BUTTON_RIGHT_MINUS = bytes([0x05, 0x00, 0x45, 0x01, 0xFF])
+        self.BUTTON_RIGHT_RELEASED = bytes([0x05, 0x00, 0x45, 0x01, 0x00])
+        self.BUTTON_CENTER_GREEN = bytes([0x05, 0x00, 0x08, 0x02, 0x01])
+        self.BUTTON_CENTER_RELEASED = bytes([0x05, 0x00, 0x08, 0x02, 0x00])
+        self._LEFT_BUTTON = 0
+        self._RIGHT_BUTTON = 1
+        self._CENTER_BUTTON = 2
+        self.buttons = [self.BUTTON_LEFT_RELEASED, self.BUTTON_RIGHT_RELEASED, self.BUTTON_CENTER_RELEASED]
+        self.callback = callback
+
+    def on_notify(self, data):
+        if data == self.BUTTON_LEFT_PLUS:
+            self.buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_PLUS
+        if data == self.BUTTON_LEFT_RED:
+            self.buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_RED
+        if data == self.BUTTON_LEFT_MINUS:
+            self.buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_MINUS
+        if data == self.BUTTON_LEFT_RELEASED:
+            self.buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_RELEASED
+        if data == self.BUTTON_RIGHT_PLUS:
+            self.buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_PLUS
+        if data == self.BUTTON_RIGHT_RED:
+            self.buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_RED
+        if data == self.BUTTON_RIGHT_MINUS:
+            self.buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_MINUS
+        if data == self.BUTTON_RIGHT_RELEASED:
+            self.buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_RELEASED
+        if data == self.BUTTON_CENTER_GREEN:
+            self.buttons[self._CENTER_BUTTON] = self.BUTTON_CENTER_GREEN
+        if data == self.BUTTON_CENTER_RELEASED:
+            self.buttons[self._CENTER_BUTTON] = self.BUTTON_CENTER_RELEASED
+        self.on_button(self.buttons)
+
+    def on_button(self, buttons):
+        left = buttons[self._LEFT_BUTTON]
+        right = buttons[self._RIGHT_BUTTON]
+        center = buttons[self._CENTER_BUTTON]
+        if left == self.BUTTON_LEFT_RELEASED and right == self.BUTTON_RIGHT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 0
+        elif left == self.BUTTON_LEFT_PLUS and right == self.BUTTON_RIGHT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 1
+        elif left == self.BUTTON_LEFT_RED and right == self.BUTTON_RIGHT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 2
+        elif left == self.BUTTON_LEFT_MINUS and right == self.BUTTON_RIGHT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 3
+        elif right == self.BUTTON_RIGHT_PLUS and left == self.BUTTON_LEFT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 4
+        elif right == self.BUTTON_RIGHT_RED and left == self.BUTTON_LEFT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 5
+        elif right == self.BUTTON_RIGHT_MINUS and left == self.BUTTON_LEFT_RELEASED and center == self.BUTTON_CENTER_RELEASED:
+            button = 6
+        elif left == self.BUTTON_LEFT_PLUS and right == self.BUTTON_RIGHT_PLUS and center == self.BUTTON_CENTER_RELEASED:
+            button = 7
+        elif left == self.BUTTON_LEFT_MINUS and right == self.BUTTON_RIGHT_MINUS and center == self.BUTTON_CENTER_RELEASED:
+            button = 8
+        elif left == self.BUTTON_LEFT_PLUS and right == self.BUTTON_RIGHT_MINUS and center == self.BUTTON_CENTER_RELEASED:
+            button = 9
+        elif left == self.BUTTON_LEFT_MINUS and right == self.BUTTON_RIGHT_PLUS and center == self.BUTTON_CENTER_RELEASED:
+            button = 10
+        elif center == self.BUTTON_CENTER_GREEN and left == self.BUTTON_LEFT_RELEASED and right == self.BUTTON_RIGHT_RELEASED:
+            button = 11
+        else:
+            button = 0
+        self.callback(button)
+
+
+def replay(handlers):
+    """
+    replay the recorded notifications, the best of REPEAT runs, the runs
+    of the handlers alternate so a busy host slows them alike
+
+    :param handlers: notification handlers
+    :returns: decode time per event in us of each handler
+    """
+    best = [None] * len(handlers)
+    for _ in range(REPEAT):
+        for i, on_notify in enumerate(handlers):
+            start = ticks_us()
+            for _ in range(ROUNDS):
+                for data in RECORDED:
+                    on_notify(data)
+            elapsed = ticks_diff(ticks_us(), start)
+            if best[i] is None or elapsed < best[i]:
+                best[i] = elapsed
+    return [elapsed / (ROUNDS * len(RECORDED)) for elapsed in best]
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    before_buttons = []
+    after_buttons = []
+
+    legacy = _LegacyDecoder(before_buttons.append)
+    remote = PoweredUPRemote()
+    remote.on_button(after_buttons.append)
+
+    # the handler the remote registers for its notifications
+    before, after = replay((legacy.on_notify, remote._PoweredUPRemote__notify))
+
+    if before_buttons != after_buttons:
+        raise AssertionError("decoders disagree")
+    print("button decode before: %.2f us/event" % before)
+    print("button decode after:  %.2f us/event" % after)
+    if after >= before:
+        raise AssertionError("table decoder not faster: %.2f >= %.2f us/event" % (after, before))
+
+
+run()
@@ -0,0 +1,80 @@
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Inputs of the benchmark suite: advertisements as a
+hub sees them in a classroom (LEGO devices between
+phones, beacons, headphones and fitness trackers) and
+button notification streams of driving sessions.
+"""
+
+_LEGO_SERVICE = bytes([0x23, 0xD1, 0xBC, 0xEA, 0x5F, 0x78, 0x23, 0x16, 0xDE, 0xEF, 0x12, 0x12, 0x23, 0x16, 0x00, 0x00])
+
+
+def advertisement(*fields):
+    """
+    build an advertising payload
+
+    :param fields: (ad type, value bytes) per field
+    :returns: payload bytes
+    """
+    payload = bytearray()
+    for adv_type, value in fields:
+        payload += bytes((len(value) + 1, adv_type)) + value
+    return bytes(payload)
+
+
+def _lego(system_type):
+    return advertisement((0x01, b'\x06'), (0x07, _LEGO_SERVICE),
+                         (0xFF, bytes((0x97, 0x03, 0x00, system_type, 0x06, 0x00, 0x41, 0x00))))
+
+
+# (address, payload), LEGO devices, their scan responses and other devices
+ADVERTISEMENTS = (
+    (b'\x90\x84\x2b\x00\x00\x01', _lego(0x42)),
+    (b'\x90\x84\x2b\x00\x00\x01', advertisement((0x09, b'Handset'))),
+    (b'\x90\x84\x2b\x00\x00\x02', _lego(0x80)),
+    (b'\x90\x84\x2b\x00\x00\x02', advertisement((0x09, b'Technic Hub'))),
+    (b'\x90\x84\x2b\x00\x00\x03', _lego(0x41)),
+    (b'\x90\x84\x2b\x00\x00\x04', _lego(0x40)),
+    # iBeacon
+    (b'\x4c\x00\x00\x00\x00\x05', advertisement((0x01, b'\x06'), (0xFF, bytes([0x4C, 0x00, 0x02, 0x15]) + bytes(range(16))
+                                                                  + bytes([0x00, 0x01, 0x00, 0x02, 0xC5])))),
+    # phone with a name and 16 bit services
+    (b'\x7a\x11\x00\x00\x00\x06', advertisement((0x01, b'\x1a'), (0x03, b'\x0f\x18\x0a\x18\x05\x18'),
+                                                (0x09, b'Pixel 7'))),
+    # Microsoft swift pair headphones
+    (b'\x06\x00\x00\x00\x00\x07', advertisement((0x01, b'\x06'), (0xFF, bytes([0x06, 0x00, 0x03, 0x00, 0x80])),
+                                                (0x09, b'Surface Headphones'))),
+    # fitness tracker with heart rate and battery service, samsung data
+    (b'\x75\x00\x00\x00\x00\x08', advertisement((0x01, b'\x06'), (0x02, b'\x0d\x18\x0f\x18'),
+                                                (0xFF, bytes([0x75, 0x00, 0x42, 0x04, 0x01, 0x80, 0x60])))),
+    # sensor with 32 bit services
+    (b'\x59\x00\x00\x00\x00\x09', advertisement((0x01, b'\x06'), (0x05, b'\x01\x02\x03\x04\x05\x06\x07\x08'),
+                                                (0x08, b'Sens'))),
+    # Eddystone url
+    (b'\xaa\xfe\x00\x00\x00\x0a', advertisement((0x01, b'\x06'), (0x03, b'\xaa\xfe'),
+                                                (0x16, b'\xaa\xfe\x10\x00\x03lego\x07'))),
+    # services field longer than the received payload
+    (b'\x7a\x11\x00\x00\x00\x0b', bytes([0x05, 0x03, 0x0f, 0x18, 0x0a])),
+)
+
+# button notifications of a driving session: acknowledged port setups, presses, chords and the center button
+NOTIFICATIONS = (
+    bytes([0x0A, 0x00, 0x47, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x01]),
+    bytes([0x0A, 0x00, 0x47, 0x01, 0x00, 0x01, 0x00, 0x00, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x7F]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+)
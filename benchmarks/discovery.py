@@ -0,0 +1,95 @@
+import blesim
+from remote.control import PoweredUPRemote, PoweredUPDiscovery
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Pairing in a room with many LEGO devices on the simulated
+radio: a plain connect takes the first remote that advertises,
+the discovery collects every device for the full scan window
+and the remote connects to the nearest one without a new scan.
+Times are from connect() to usable on the virtual clock.
+
+PYTHONPATH=host:. python3 benchmarks/discovery.py
+"""
+
+# (address, name, rssi, system type), the nearest remote is the last to advertise
+ROOM = (
+    (b'\x90\x84\x2b\x00\x00\x01', "Handset", -82, 0x42),
+    (b'\x90\x84\x2b\x00\x00\x02', "Technic Hub", -50, 0x80),
+    (b'\x90\x84\x2b\x00\x00\x03', "Handset", -71, 0x42),
+    (b'\x90\x84\x2b\x00\x00\x04', "City Hub", -65, 0x41),
+    (b'\x90\x84\x2b\x00\x00\x05', "Move Hub", -77, 0x40),
+    (b'\x90\x84\x2b\x00\x00\x06', "Handset", -44, 0x42),
+)
+NEAREST = "90:84:2B:00:00:06"
+
+
+def room():
+    """
+    simulated radio with all devices of the room
+
+    :returns: (BLE, list of peripherals)
+    """
+    ble = blesim.BLE()
+    peripherals = [ble.add(blesim.remote(addr=addr, name=name, rssi=rssi, system_type=system_type))
+                   for addr, name, rssi, system_type in ROOM]
+    return ble, peripherals
+
+
+def connected(peripherals):
+    """
+    rssi of the connected devices
+
+    :returns: list of rssi
+    """
+    return [peripheral.rssi for peripheral in peripherals if peripheral.conn_handle is not None]
+
+
+def connect(ble, remote, address=None):
+    """
+    connect a remote and run the radio until it is usable
+
+    :returns: time to usable in ms
+    """
+    state = {'connected': None}
+
+    def on_connect():
+        state['connected'] = ble.now_us
+
+    start = ble.now_us
+    remote.on_connect(on_connect)
+    remote.connect(address=address)
+    ble.run()
+    return (state['connected'] - start) / 1000
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    ble, peripherals = room()
+    plain = connect(ble, PoweredUPRemote(ble=ble))
+    print("plain connect: %d dBm remote after %.1f ms" % (connected(peripherals)[0], plain))
+
+    ble, peripherals = room()
+    discovery = PoweredUPDiscovery(ble=ble)
+    discovery.start(3000)
+    ble.run()
+    for address, name, system_type, rssi, age in discovery.devices():
+        print("  %s %-12s type 0x%02X %d dBm" % (address, name, system_type, rssi))
+    if len(discovery.devices()) != len(ROOM) or discovery.nearest() != NEAREST:
+        raise AssertionError("discovery table is wrong")
+
+    start = ble.now_us
+    nearest = connect(ble, PoweredUPRemote(ble=ble), discovery.nearest())
+    print("discovery: %d dBm remote after %.1f ms scan and %.1f ms connect without a new scan" %
+          (connected(peripherals)[0], start / 1000, nearest))
+    if connected(peripherals) != [ROOM[-1][2]]:
+        raise AssertionError("not connected to the nearest remote")
+
+
+run()
@@ -0,0 +1,150 @@
+import blesim
+import micropython
+from remote.control import PoweredUPRemote, PoweredUPColors
+from remote.hub import PoweredUPHub
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+The remote and hub emulators of the simulated radio:
+connect time of a remote until its handshake is done,
+round trip of a color write, a write the busy stack
+refused while the schedule queue is full, detection of
+an invalid port setup, and button notifications at rising rates
+on a link which carries 4 notifications per 7.5 ms
+connection interval, up to and beyond saturation.
+
+PYTHONPATH=host:. python3 benchmarks/emulator.py
+"""
+
+PACKETS_PER_EVENT = 4
+RATES_HZ = (100, 250, 500, 1000, 2000)
+NOTIFICATIONS = 2000
+WRITES = 50
+
+
+def connected():
+    """
+    simulated radio with a connected remote
+
+    :returns: (BLE, Remote, PoweredUPRemote, virtual ms until connected)
+    """
+    ble = blesim.BLE(packets_per_event=PACKETS_PER_EVENT)
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble)
+    done = []
+    remote.on_connect(lambda: done.append(ble.now_us))
+    remote.connect()
+    ble.run()
+    if not done:
+        raise AssertionError("remote not connected")
+    if peripheral.errors:
+        raise AssertionError("invalid handshake: %s" % peripheral.errors)
+    if peripheral.inputs != {0x00: (0x00, 1, 1), 0x01: (0x00, 1, 1)}:
+        raise AssertionError("buttons not subscribed: %s" % peripheral.inputs)
+    return ble, peripheral, remote, done[0] / 1000
+
+
+def round_trip(ble, remote):
+    """
+    color writes until the remote acknowledged them
+
+    :returns: virtual ms per write
+    """
+    total = 0
+    for i in range(WRITES):
+        done = []
+        start = ble.now_us
+        remote.set_color(PoweredUPColors.RED if i % 2 else PoweredUPColors.GREEN,
+                         callback=lambda status: done.append(ble.now_us))
+        ble.run()
+        total += done[0] - start
+    return total / WRITES / 1000
+
+
+def busy_write(ble, peripheral, remote):
+    """
+    a color write the stack refuses while the schedule queue is full is sent from the next event
+
+    :returns: True if the remote got the color
+    """
+    try:
+        while True:
+            micropython.schedule(lambda _: None, None)
+    except RuntimeError:
+        pass
+    writes = len(peripheral.writes)
+    ble.busy = 1
+    remote.set_color(PoweredUPColors.BLUE)
+    micropython.run_scheduled()
+    peripheral.press(2, 0x01)
+    peripheral.press(2, 0x00, 10000)
+    ble.run()
+    return peripheral.writes[writes:] == [(0x0B, bytes([0x08, 0x00, 0x81, 0x34, 0x11, 0x51, 0x00,
+                                                       PoweredUPColors.BLUE]))]
+
+
+def invalid_setup():
+    """
+    a port setup with a mode the motor does not have is answered with a generic error
+
+    :returns: reason of the emulator
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.hub())
+    hub = PoweredUPHub(ble=ble)
+    hub.connect()
+    ble.run()
+    hub.subscribe(0x00, 0x09, lambda port, value: None, fmt="<b")
+    ble.run()
+    if len(peripheral.errors) != 1 or peripheral.inputs:
+        raise AssertionError("invalid setup not detected: %s" % peripheral.errors)
+    return peripheral.errors[0][1]
+
+
+def stream(rate_hz):
+    """
+    button notifications of a connected remote at a rate
+
+    :param rate_hz: notifications per second
+    :returns: (delivered per second, mean queueing ms, host us per notification)
+    """
+    ble, peripheral, remote, _ = connected()
+    received = []
+    remote.on_raw(lambda ticks, port, value: received.append(ble.now_us))
+    start = ble.now_us
+    period = 1000000 / rate_hz
+    count = peripheral.buttons(NOTIFICATIONS, rate_hz)
+    sent = [start + int(i * period) for i in range(count)]
+    host = ticks_us()
+    ble.run()
+    host = ticks_diff(ticks_us(), host) / count
+    if len(received) != count:
+        raise AssertionError("notifications lost: %d of %d" % (len(received), count))
+    rate = (count - 1) * 1000000 / (received[-1] - received[0])
+    delay = sum(r - s for r, s in zip(received, sent)) / count / 1000
+    return rate, delay, host
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    ble, peripheral, remote, connect_ms = connected()
+    print("connect %.1f ms, color write round trip %.1f ms (virtual)" % (connect_ms, round_trip(ble, remote)))
+    if not busy_write(ble, peripheral, remote):
+        raise AssertionError("write stalled after a busy stack: %s" % remote.write_stats())
+    print("busy stack with a full schedule queue: write sent from the next event")
+    print("invalid port setup detected: %s" % invalid_setup())
+    capacity = PACKETS_PER_EVENT * 1000000 / ble.conn_interval_us
+    for rate_hz in RATES_HZ:
+        rate, delay, host = stream(rate_hz)
+        print("%5d Hz offered: %4.0f/s delivered (link %.0f/s), %6.1f ms queued, %.1f us host" %
+              (rate_hz, rate, capacity, delay, host))
+
+
+run()
@@ -0,0 +1,114 @@
+import gc
+import sys
+
+try:
+    from gc import mem_free
+
+    def used():
+        return -mem_free()
+except ImportError:
+    import tracemalloc
+    tracemalloc.start()
+
+    def used():
+        return tracemalloc.get_traced_memory()[0]
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+RAM budget of the library: imports it fresh for every
+configuration and reports the retained heap after the
+import and the configuration. On the hub this uses
+gc.mem_free, on the host tracemalloc, the host numbers
+are only useful to compare configurations.
+
+PYTHONPATH=host:. python3 benchmarks/footprint.py
+"""
+
+MODULES = ("remote", "remote.control", "remote.aio", "remote.debug", "remote.companies")
+
+ADVERTISEMENT = bytes([0x02, 0x01, 0x06, 0x11, 0x07, 0x23, 0xD1, 0xBC, 0xEA, 0x5F, 0x78, 0x23, 0x16,
+                       0xDE, 0xEF, 0x12, 0x12, 0x23, 0x16, 0x00, 0x00, 0x09, 0xFF, 0x97, 0x03,
+                       0x00, 0x42, 0x06, 0x00, 0x41, 0x00])
+
+
+try:
+    import blesim
+except ImportError:
+    blesim = None
+
+
+def import_only(control, ble):
+    return None
+
+
+def remote(control, ble):
+    return control.PoweredUPRemote(ble=ble)
+
+
+def four_remotes(control, ble):
+    return [control.PoweredUPRemote(ble=ble) for _ in range(4)]
+
+
+def buffered(control, ble):
+    return control.PoweredUPRemote(ble=ble, buffer=16)
+
+
+def debug_logging(control, ble):
+    from remote.debug import log
+    return log
+
+
+def company_names(control, ble):
+    return control._Decoder().decode_manufacturer(ADVERTISEMENT)
+
+
+CONFIGURATIONS = (
+    ("import", import_only),
+    ("remote", remote),
+    ("4 remotes", four_remotes),
+    ("remote, buffer=16", buffered),
+    ("debug logging", debug_logging),
+    ("company names", company_names),
+)
+
+
+def measure(configuration):
+    """
+    import the library fresh and run a configuration
+
+    :param configuration: function to run with the imported module
+    :returns: (bytes after import, bytes after the configuration)
+    """
+    for name in MODULES:
+        sys.modules.pop(name, None)
+    # a new radio releases the remotes of the previous configuration
+    ble = blesim.BLE() if blesim else None
+    gc.collect()
+    before = used()
+    import remote.control as control
+    gc.collect()
+    imported = used()
+    keep = configuration(control, ble)
+    gc.collect()
+    after = used()
+    del keep
+    return imported - before, after - before
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    # load the dependencies of the library before the first measurement
+    measure(import_only)
+    measure(import_only)
+    for name, configuration in CONFIGURATIONS:
+        imported, total = measure(configuration)
+        print("%-18s import %6d bytes, total %6d bytes" % (name, imported, total))
+
+
+run()
@@ -0,0 +1,101 @@
+import blesim
+from remote.hub import PoweredUPHub
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Motor control of a Technic hub on the simulated radio:
+connects next to devices with the LEGO service and no
+or short manufacturer data, waits for the attached
+motors and sends speed updates for four motors, one
+write per command and batched. Reports the writes per
+update and the time until the hub has all commands on
+the virtual clock. A hub that fails the write of the
+notification descriptor is disconnected, not connected.
+
+PYTHONPATH=host:. python3 benchmarks/hub_control.py
+"""
+
+MOTORS = {0x00: 0x2E, 0x01: 0x2E, 0x02: 0x2F, 0x03: 0x30}
+UPDATES = 50
+
+
+def session(batched):
+    """
+    connect a hub and send motor updates
+
+    :param batched: send the four commands of an update in a batch
+    :returns: (writes per update, ms until the hub has an update)
+    """
+    ble = blesim.BLE()
+    for stranger in blesim.strangers():
+        ble.add(stranger)
+    peripheral = ble.add(blesim.hub(devices=MOTORS))
+    hub = PoweredUPHub(ble=ble)
+    attached = {}
+    hub.on_attach(lambda port, io_type: attached.__setitem__(port, io_type))
+    hub.connect()
+    ble.run()
+    if attached != MOTORS or hub.devices() != MOTORS:
+        raise AssertionError("attached devices not reported: %s" % attached)
+
+    writes = len(peripheral.writes)
+    elapsed = 0
+    for update in range(UPDATES):
+        speed = update * 4 - 100
+        start = ble.now_us
+        if batched:
+            with hub.batch():
+                for port in MOTORS:
+                    hub.start_speed(port, speed)
+        else:
+            for port in MOTORS:
+                hub.start_speed(port, speed)
+        ble.run()
+        elapsed += ble.now_us - start
+
+    expected = [bytes([0x09, 0x00, 0x81, port, 0x11, 0x07, (update * 4 - 100) & 0xFF, 100, 0x00])
+                for update in range(UPDATES) for port in MOTORS]
+    if peripheral.messages != expected:
+        raise AssertionError("hub received wrong commands")
+    return (len(peripheral.writes) - writes) / UPDATES, elapsed / UPDATES / 1000
+
+
+def failed_handshake():
+    """
+    connect a hub that rejects enabling the notifications
+
+    :returns: (connect callbacks, disconnect callbacks)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.hub(devices=MOTORS))
+    peripheral.failures[0x0C] = 0x03
+    hub = PoweredUPHub(ble=ble)
+    connects = []
+    disconnects = []
+    hub.on_connect(lambda: connects.append(ble.now_us))
+    hub.on_disconnect(lambda: disconnects.append(ble.now_us))
+    hub.connect()
+    ble.run()
+    return len(connects), len(disconnects)
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    for batched in (False, True):
+        writes, latency = session(batched)
+        print("%-9s %.1f writes per update, %.1f ms until the hub has it (virtual)" %
+              ("batched" if batched else "single", writes, latency))
+
+    connects, disconnects = failed_handshake()
+    if connects or disconnects != 1:
+        raise AssertionError("failed handshake: %d connects, %d disconnects" % (connects, disconnects))
+    print("notify enable failed: disconnected")
+
+
+run()
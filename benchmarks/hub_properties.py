@@ -0,0 +1,81 @@
+import blesim
+from remote.control import PoweredUPRemote
+from remote.hub import PoweredUPHub
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Battery and rssi of a fleet of remotes and a hub on the
+simulated radio: the devices push a property when it
+changes, the batteries drain 1 % per minute for half an
+hour. Checks the cached values, that property updates
+do not reach the button callback, and compares the link
+traffic with reading the battery once per second.
+
+PYTHONPATH=host:. python3 benchmarks/hub_properties.py
+"""
+
+REMOTES = 4
+MINUTES = 30
+POLL_MS = 1000
+QUERIES = 100000
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    ble = blesim.BLE()
+    peripherals = [ble.add(blesim.remote(addr=bytes([0x90, 0x84, 0x2B, 0x00, 0x00, i + 1]), rssi=-50 - i * 10))
+                   for i in range(REMOTES)]
+    hub_peripheral = ble.add(blesim.hub())
+    buttons = []
+    updates = []
+    remotes = []
+    for index in range(REMOTES):
+        remote = PoweredUPRemote(ble=ble, properties=True)
+        remote.on_button(buttons.append)
+        remote.on_property(lambda prop, value: updates.append((prop, value)))
+        remote.connect(address=":".join("%02X" % b for b in peripherals[index].addr))
+        remotes.append(remote)
+    hub = PoweredUPHub(ble=ble, properties=True)
+    hub.connect()
+    ble.run()
+
+    connected = ble.now_us
+    notifications = len(updates)
+    for minute in range(1, MINUTES + 1):
+        for index, peripheral in enumerate(peripherals + [hub_peripheral]):
+            ble.schedule(minute * 60000000 + index, peripheral.set_property, 0x06, 100 - minute - index)
+    ble.run()
+    pushed = len(updates) - notifications
+
+    for index, remote in enumerate(remotes):
+        if remote.battery() != 100 - MINUTES - index or remote.rssi() != -50 - index * 10:
+            raise AssertionError("remote %d: battery %s, rssi %s" % (index, remote.battery(), remote.rssi()))
+        value, age = remote.hub_property(0x06)
+        if age < 0:
+            raise AssertionError("negative age")
+    if hub.battery() != 100 - MINUTES - REMOTES or hub.rssi() != -60:
+        raise AssertionError("hub: battery %s, rssi %s" % (hub.battery(), hub.rssi()))
+    if buttons:
+        raise AssertionError("property updates reached the button callback: %s" % buttons)
+
+    remote = remotes[0]
+    start = ticks_us()
+    for _ in range(QUERIES):
+        remote.battery()
+    query = ticks_diff(ticks_us(), start) / QUERIES
+
+    minutes = (ble.now_us - connected) / 60000000
+    polled = REMOTES * int(minutes * 60000 / POLL_MS)
+    print("%d remotes, %.0f min: %d pushed updates, polling every %d ms would be %d reads" %
+          (REMOTES, minutes, pushed, POLL_MS, polled))
+    print("battery() %.2f us per query, hub battery %d %%, rssi %d dBm" % (query, hub.battery(), hub.rssi()))
+
+
+run()
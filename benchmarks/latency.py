@@ -0,0 +1,86 @@
+import blesim
+from remote.control import PoweredUPRemote, PoweredUPColors, profile, stats, _Histogram
+from remote.debug import dump
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Latency instrumentation on the simulated radio: streams
+button notifications and color writes with the profiler
+enabled, prints the histograms of every stage, and
+compares the notification cost with the profiler
+disabled against a run before it was ever enabled.
+Also checks that halving the buckets of a histogram
+keeps the buckets of single samples.
+
+PYTHONPATH=host:. python3 benchmarks/latency.py
+"""
+
+PRESSES = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+)
+
+EVENTS = 10000
+RATE_HZ = 200
+COLORS = 200
+
+
+def session(buffer=0):
+    """
+    stream notifications and writes
+
+    :param buffer: notification buffer of the remote
+    :returns: host time per notification in us
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, buffer=buffer)
+    remote.on_button(lambda button: None)
+    remote.connect()
+    ble.run()
+
+    for i in range(COLORS):
+        ble.schedule(i * 10000, remote.set_color, PoweredUPColors.RED if i % 2 else PoweredUPColors.GREEN)
+    ble.stream(peripheral, 0x0B, (PRESSES[i % len(PRESSES)] for i in range(EVENTS)), RATE_HZ)
+    start = ticks_us()
+    ble.run()
+    return ticks_diff(ticks_us(), start) / EVENTS
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    before = session()
+    profile()
+    enabled = session()
+    dump()
+    result = stats()
+    if result["callback"]["count"] != EVENTS or result["write"]["count"] < COLORS // 2:
+        raise AssertionError("stages not measured: %s" % result)
+    profile(False)
+    disabled = session()
+    if stats() is not None:
+        raise AssertionError("profiler still enabled")
+    print("per notification: %.2f us never enabled, %.2f us enabled, %.2f us disabled" %
+          (before, enabled, disabled))
+
+    # the window halves both single sample buckets, they keep their sample
+    histogram = _Histogram(window=2)
+    histogram.add(5)
+    histogram.add(900)
+    halved = histogram.stats()
+    empty = _Histogram().stats()
+    if halved["p50"] != 5 or halved["p99"] != 900 or empty["p50"] is not None:
+        raise AssertionError("wrong percentiles after halving: %s, empty %s" % (halved, empty))
+    dump({"halved": halved, "empty": empty})
+
+
+run()
@@ -0,0 +1,103 @@
+from remote.lwp3 import Encoder, Dispatcher, MessageType, HubProperty, HubAlert, header
+from utime import ticks_us, ticks_diff
+import struct
+import gc
+
+try:
+    from gc import mem_alloc
+    STRICT = True
+except ImportError:
+    from sys import getallocatedblocks as mem_alloc
+    STRICT = False
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Throughput of the LWP3 codec: encodes every message
+type into its preallocated buffer and dispatches a
+corpus of notifications by message type, compared with
+packing a new message from a byte list per call. On
+the hub the encoders and the dispatch must not grow
+the heap, on the host the block count is only reported.
+
+PYTHONPATH=host:. python3 benchmarks/lwp3_codec.py
+"""
+
+COUNT = 20000
+
+NOTIFICATIONS = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x06, 0x00, 0x01, 0x06, 0x06, 0x64]),
+    bytes([0x0F, 0x00, 0x04, 0x00, 0x01, 0x2E, 0x00, 0x00, 0x10, 0x00, 0x00, 0x00, 0x10, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x82, 0x00, 0x0A]),
+    bytes([0x06, 0x00, 0x03, 0x01, 0x04, 0x00]),
+)
+
+
+def legacy(byte_array):
+    return struct.pack('%sB' % len(byte_array), *byte_array)
+
+
+def measure(name, function):
+    """
+    time and heap growth of calling a function COUNT times
+
+    :param name: printed name
+    :param function: function without arguments
+    :returns: heap growth per call
+    """
+    function()
+    gc.collect()
+    gc.disable()
+    before = mem_alloc()
+    start = ticks_us()
+    for _ in range(COUNT):
+        function()
+    elapsed = ticks_diff(ticks_us(), start)
+    growth = (mem_alloc() - before) / COUNT
+    gc.enable()
+    print("%-26s %9d/s  %.3f heap per call" % (name, COUNT * 1000000 // elapsed, growth))
+    return growth
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    encoder = Encoder()
+    dispatcher = Dispatcher()
+    handled = [0]
+
+    def on_message(data, offset):
+        handled[0] += 1
+
+    for message_type in (MessageType.PORT_VALUE, MessageType.HW_NETWORK_COMMANDS, MessageType.HUB_PROPERTIES,
+                         MessageType.HUB_ATTACHED_IO, MessageType.PORT_OUTPUT_FEEDBACK, MessageType.HUB_ALERTS):
+        dispatcher.on(message_type, on_message)
+
+    growth = [
+        measure("port input format setup", lambda: encoder.port_input_format_setup(0x00, 0x00, 1)),
+        measure("start speed", lambda: encoder.start_speed(0x00, -75)),
+        measure("start power", lambda: encoder.start_power(0x01, 50)),
+        measure("goto absolute position", lambda: encoder.goto_absolute_position(0x02, -180, 50)),
+        measure("write direct mode data", lambda: encoder.write_direct_mode_data(0x34, 0x00, 0x09)),
+        measure("hub property", lambda: encoder.hub_property(HubProperty.BATTERY_VOLTAGE, HubProperty.ENABLE_UPDATES)),
+        measure("hub alert", lambda: encoder.hub_alert(HubAlert.LOW_VOLTAGE, HubAlert.ENABLE_UPDATES)),
+        measure("dispatch", lambda: dispatcher.dispatch(NOTIFICATIONS[handled[0] % len(NOTIFICATIONS)])),
+    ]
+    measure("header", lambda: header(NOTIFICATIONS[0]))
+    measure("legacy color message", lambda: legacy([0x08, 0x00, 0x81, 0x34, 0x11, 0x51, 0x00, 0x09]))
+
+    if bytes(encoder.write_direct_mode_data(0x34, 0x00, 0x09)) != legacy([0x08, 0x00, 0x81, 0x34, 0x11, 0x51, 0x00, 0x09]):
+        raise AssertionError("encoder differs from the legacy message")
+    if dispatcher.dropped:
+        raise AssertionError("dispatch dropped messages")
+    if STRICT and max(growth) > 0:
+        raise AssertionError("heap grows per call")
+
+
+run()
@@ -0,0 +1,72 @@
+import blesim
+from remote.control import PoweredUPRemote
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Notification throughput with several remotes connected
+to one radio: the cost per notification has to stay flat
+when the number of connections grows
+
+PYTHONPATH=host:. python3 benchmarks/multi_remote.py
+"""
+
+PRESSES = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+)
+
+EVENTS = 20000
+RATE_HZ = 100
+
+
+def session(count):
+    """
+    connect a number of remotes and stream notifications from all of them
+
+    :param count: number of remotes
+    :returns: handling time per notification in us
+    """
+    ble = blesim.BLE()
+    peripherals = [ble.add(blesim.remote(addr=bytes([0x90, 0x84, 0x2B, 0x00, 0x00, i + 1]))) for i in range(count)]
+    received = [0] * count
+
+    def counter(index):
+        def on_button(button):
+            received[index] += 1
+        return on_button
+
+    for index in range(count):
+        remote = PoweredUPRemote(ble=ble)
+        remote.on_button(counter(index))
+        remote.connect()
+    ble.run()
+
+    per_remote = EVENTS // count
+    for index, peripheral in enumerate(peripherals):
+        messages = (PRESSES[i % len(PRESSES)] for i in range(per_remote))
+        ble.stream(peripheral, 0x0B, messages, RATE_HZ, delay_us=index * 10)
+    start = ticks_us()
+    ble.run()
+    elapsed = ticks_diff(ticks_us(), start)
+
+    if received != [per_remote] * count:
+        raise AssertionError("notifications routed to the wrong remote: %s" % received)
+    return elapsed / (per_remote * count)
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    for count in (1, 2, 4, 8):
+        print("%d remotes: %.2f us/notification" % (count, session(count)))
+
+
+run()
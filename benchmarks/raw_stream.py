@@ -0,0 +1,119 @@
+import blesim
+from remote.control import PoweredUPRemote
+from remote.buttons import PoweredUPButtonReducer
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Raw button stream on the simulated radio: checks that
+chords the button codes can not express are streamed,
+that the timestamps are taken in the irq also when the
+notifications are buffered, and measures press durations
+with the reducer while the radio runs in real time.
+
+PYTHONPATH=host:. python3 benchmarks/raw_stream.py
+"""
+
+LEFT_PLUS = bytes([0x05, 0x00, 0x45, 0x00, 0x01])
+LEFT_RELEASED = bytes([0x05, 0x00, 0x45, 0x00, 0x00])
+CENTER = bytes([0x05, 0x00, 0x08, 0x02, 0x01])
+CENTER_RELEASED = bytes([0x05, 0x00, 0x08, 0x02, 0x00])
+
+EVENTS = 4000
+PRESS_MS = 250
+
+
+def connected(buffer=0):
+    """
+    simulated radio with a connected remote
+
+    :returns: (BLE, peripheral, PoweredUPRemote)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, buffer=buffer)
+    remote.connect()
+    ble.run()
+    return ble, peripheral, remote
+
+
+def chords():
+    """
+    left plus with center is no button code but two raw events
+
+    :returns: nothing
+    """
+    ble, peripheral, remote = connected()
+    raw = []
+    buttons = []
+    remote.on_raw(lambda ticks, port, value: raw.append((port, value)))
+    remote.on_button(buttons.append)
+    ble.stream(peripheral, 0x0B, (LEFT_PLUS, CENTER, CENTER_RELEASED, LEFT_RELEASED), 100)
+    ble.run()
+    if raw != [(0, 0x01), (2, 0x01), (2, 0x00), (0, 0x00)]:
+        raise AssertionError("raw events lost: %s" % raw)
+    print("chord left plus + center: raw %s, button codes %s" % (raw, buttons))
+
+
+def timestamps(buffer):
+    """
+    difference of the raw timestamps to the irq
+
+    :param buffer: notification buffer of the remote
+    :returns: (timestamp error, callback delay) in us avg
+    """
+    ble, peripheral, remote = connected(buffer)
+    state = {'error': 0, 'delay': 0, 'count': 0}
+
+    def on_raw(ticks, port, value):
+        state['error'] += abs(ticks_diff(ticks, ble.irq_ticks_us))
+        state['delay'] += ticks_diff(ticks_us(), ticks)
+        state['count'] += 1
+
+    remote.on_raw(on_raw)
+    ble.stream(peripheral, 0x0B, ((LEFT_PLUS, LEFT_RELEASED)[i % 2] for i in range(EVENTS)), 1000)
+    ble.run()
+    if state['count'] != EVENTS:
+        raise AssertionError("lost raw events")
+    return state['error'] / EVENTS, state['delay'] / EVENTS
+
+
+def durations():
+    """
+    press duration and hold measured by the reducer in real time
+
+    :returns: (release duration, hold duration) in ms
+    """
+    ble, peripheral, remote = connected()
+    reducer = PoweredUPButtonReducer(hold_ms=PRESS_MS // 2)
+    result = {}
+    reducer.on_hold(lambda port, value, duration: result.__setitem__('hold', duration))
+    reducer.on_release(lambda port, value, duration: result.__setitem__('release', duration))
+    remote.on_raw(reducer.event)
+
+    ble.notify(peripheral, 0x0B, LEFT_PLUS)
+    ble.schedule(PRESS_MS * 1000 // 2 + 10000, reducer.poll)
+    ble.notify(peripheral, 0x0B, LEFT_RELEASED, PRESS_MS * 1000)
+    ble.run(speed=1)
+    return result['release'] / 1000, result['hold'] / 1000
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    chords()
+    for buffer in (0, 16):
+        error, delay = timestamps(buffer)
+        print("buffer=%2d: timestamp %.2f us from the irq, callback %.2f us after it" % (buffer, error, delay))
+    release, hold = durations()
+    print("press of %d ms: measured %.1f ms, hold reported after %.1f ms" % (PRESS_MS, release, hold))
+    if abs(release - PRESS_MS) > 5:
+        raise AssertionError("press duration is off")
+
+
+run()
@@ -0,0 +1,145 @@
+import blesim
+from remote.control import PoweredUPRemote
+import remote.control as control
+import micropython
+import ubinascii
+import os
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Reconnect time on the simulated radio: the first connect
+scans and discovers the characteristic, later connects
+to a known remote skip both. Also checks the fallbacks,
+a stale cached handle is rediscovered and an unreachable
+cached remote is forgotten and scanned for again. A
+cache change while the schedule queue is full is saved
+later, not in the irq. A remote that fails to enable the
+notifications is dropped and retried with backoff.
+Times are from connect() to usable on the virtual clock.
+
+PYTHONPATH=host:. python3 benchmarks/reconnect.py
+"""
+
+CACHE = "/tmp/remotes.txt"
+ADDRESS = "90:84:2B:00:00:01"
+MISSING = "90:84:2B:00:00:02"
+
+
+def connect(ble, remote, address=None):
+    """
+    connect a remote and run the radio until it is usable
+
+    :param ble: simulated radio
+    :param remote: PoweredUPRemote
+    :param address: mac address to connect to
+    :returns: time to usable in ms, None if it did not connect
+    """
+    state = {'connected': None}
+
+    def on_connect():
+        state['connected'] = ble.now_us
+
+    start = ble.now_us
+    remote.on_connect(on_connect)
+    remote.connect(address=address)
+    ble.run()
+    if state['connected'] is None:
+        return None
+    return (state['connected'] - start) / 1000
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    if os.path.exists(CACHE):
+        os.remove(CACHE)
+
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, cache=CACHE)
+    cold = connect(ble, remote)
+    remote.disconnect()
+    ble.run()
+    warm = connect(ble, remote)
+    remote.disconnect()
+    ble.run()
+    print("scan + discovery: %.1f ms" % cold)
+    print("cached reconnect: %.1f ms" % warm)
+    if warm is None or warm >= cold:
+        raise AssertionError("cached reconnect is not faster")
+
+    # a new session loads the cache from the file
+    control._device_caches.clear()
+    ble = blesim.BLE()
+    ble.add(blesim.remote())
+    persisted = connect(ble, PoweredUPRemote(ble=ble, cache=CACHE), ADDRESS)
+    print("new session, cache file: %.1f ms" % persisted)
+
+    # the handle changed, the first write fails and the remote is rediscovered
+    with open(CACHE, 'w') as f:
+        f.write("%s,0,32\n" % ADDRESS.replace(':', '').lower())
+    control._device_caches.clear()
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    stale = connect(ble, PoweredUPRemote(ble=ble, cache=CACHE), ADDRESS)
+    if stale is None or peripheral.writes[0][0] != 0x0B:
+        raise AssertionError("stale handle not rediscovered")
+    print("stale handle fallback: %.1f ms" % stale)
+
+    # the cached remote is gone, the cache entry is dropped and a scan follows
+    with open(CACHE, 'w') as f:
+        f.write("%s,0,11\n" % MISSING.replace(':', '').lower())
+    control._device_caches.clear()
+    ble = blesim.BLE()
+    ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, cache=CACHE)
+    if connect(ble, remote, MISSING) is not None:
+        raise AssertionError("connected to a missing remote")
+    with open(CACHE) as f:
+        if f.read():
+            raise AssertionError("missing remote not removed from the cache")
+    print("unreachable remote: removed from cache")
+
+    # the schedule queue is full, the change is saved from the next get instead of in the irq
+    cache = control._device_cache(CACHE)
+    try:
+        while True:
+            micropython.schedule(lambda _: None, None)
+    except RuntimeError:
+        pass
+    cache.put(ubinascii.unhexlify(ADDRESS.replace(':', '')), 0, 11)
+    with open(CACHE) as f:
+        if f.read():
+            raise AssertionError("cache saved in the irq")
+    micropython.run_scheduled()
+    cache.get(None)
+    micropython.run_scheduled()
+    with open(CACHE) as f:
+        if not f.read():
+            raise AssertionError("cache change not saved later")
+    print("full schedule queue: cache saved later")
+    os.remove(CACHE)
+
+    # enabling the notifications fails, the remote is dropped and retried with backoff
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    peripheral.failures[0x0C] = 0x03
+    remote = PoweredUPRemote(ble=ble, reconnect=True)
+    connected = []
+    remote.on_connect(lambda: connected.append(ble.now_us))
+    remote.connect()
+    ble.run(until_us=ble.now_us + 5000000)
+    stats = remote.reconnect_stats()
+    remote.disconnect()
+    ble.run()
+    if connected or not stats["attempts"] or stats["recovered"]:
+        raise AssertionError("failed notification enable not retried: %s" % stats)
+    print("notify enable failed: dropped, %d attempts in 5 s" % stats["attempts"])
+
+
+run()
@@ -0,0 +1,75 @@
+import blesim
+from remote.control import PoweredUPRemote
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+End to end session on the simulated radio:
+scans past devices with the LEGO service and no or
+short manufacturer data, connects and streams button notifications
+from a scripted remote, reports the connect time on
+the virtual clock and the irq to callback latency
+and throughput of the notifications on the host
+
+PYTHONPATH=host:. python3 benchmarks/remote_session.py
+"""
+
+PRESSES = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+)
+
+EVENTS = 6000
+RATE_HZ = 100
+
+
+def run():
+    """
+    run the session and print the results
+
+    :returns: nothing
+    """
+    ble = blesim.BLE()
+    for stranger in blesim.strangers():
+        ble.add(stranger)
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble)
+
+    state = {'connected': None, 'latency': 0, 'worst': 0, 'buttons': 0}
+
+    def on_connect():
+        state['connected'] = ble.now_us
+
+    def on_button(button):
+        latency = ticks_diff(ticks_us(), ble.irq_ticks_us)
+        state['latency'] += latency
+        state['worst'] = max(state['worst'], latency)
+        state['buttons'] += 1
+
+    remote.on_connect(on_connect)
+    remote.on_button(on_button)
+    remote.connect()
+    ble.run()
+    if state['connected'] is None:
+        raise AssertionError("remote did not connect")
+
+    messages = (PRESSES[i % len(PRESSES)] for i in range(EVENTS))
+    ble.stream(peripheral, 0x0B, messages, RATE_HZ)
+    start = ticks_us()
+    ble.run()
+    elapsed = ticks_diff(ticks_us(), start)
+
+    if state['buttons'] != EVENTS:
+        raise AssertionError("lost notifications")
+    print("connect time (virtual): %d ms" % (state['connected'] // 1000))
+    print("notify latency: %.2f us avg, %d us worst" % (state['latency'] / EVENTS, state['worst']))
+    print("notify throughput: %d events/s" % (EVENTS * 1000000 // elapsed))
+
+
+run()
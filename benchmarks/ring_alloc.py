@@ -0,0 +1,114 @@
+import blesim
+from remote.control import PoweredUPRemote, _EventRing
+from utime import ticks_us
+import micropython
+import gc
+
+try:
+    from gc import mem_alloc
+    tracemalloc = None
+except ImportError:
+    import tracemalloc
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Memory test of the irq event ring: puts notifications
+into the ring in steady state, directly and through
+the irq handler of a buffered remote, and checks that
+the heap does not grow. The test runs as a scheduled
+function, so the drain the irq schedules waits until it
+returns, like it waits for the irq on the hub.
+
+On the hub gc.mem_alloc counts every allocated byte
+with the collector disabled. On the host tracemalloc
+counts the memory kept by the library, the stand-ins
+are left out, they keep ticks as ints above the small
+int cache of CPython and queue scheduled functions in
+a list. CPython frees a temporary object at once, so
+only the hub also sees those.
+
+PYTHONPATH=host:. python3 benchmarks/ring_alloc.py
+"""
+
+NOTIFY = bytes([0x05, 0x00, 0x45, 0x00, 0x01])
+EVENTS = 1000
+
+# ubluetooth irq event of a notification
+_IRQ_GATTC_NOTIFY = 1 << 13
+
+
+def measure(function, *args):
+    """
+    heap growth of calling a function repeatedly
+
+    :param function: function to call
+    :param args: arguments
+    :returns: heap growth in bytes
+    """
+    function(*args)
+    if tracemalloc is None:
+        gc.collect()
+        gc.disable()
+        before = mem_alloc()
+        for _ in range(EVENTS):
+            function(*args)
+        growth = mem_alloc() - before
+        gc.enable()
+        return growth
+
+    library = (tracemalloc.Filter(True, "*/remote/*"),)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(library)
+    for _ in range(EVENTS):
+        function(*args)
+    after = tracemalloc.take_snapshot().filter_traces(library)
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+
+
+def test(_):
+    """
+    run the memory test and print the results, scheduled
+
+    :returns: nothing
+    """
+    # on the host the ring keeps its head and high water above 256 as ints, once, not per event
+    limit = 0 if tracemalloc is None else EVENTS // 2
+    ring = _EventRing(EVENTS + 2)
+    direct = measure(ring.put, _IRQ_GATTC_NOTIFY, NOTIFY, ticks_us())
+    print("ring put: %d bytes in %d events, %s" % (direct, EVENTS, ring.stats()))
+
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, buffer=EVENTS + 2)
+    remote.connect()
+    ble.run()
+
+    # call the irq like the radio does with a preallocated event tuple
+    event = (peripheral.conn_handle, 0x0B, memoryview(NOTIFY))
+    path = measure(ble.handler, _IRQ_GATTC_NOTIFY, event)
+    print("irq handler: %d bytes in %d events, %s" % (path, EVENTS, remote.buffer_stats()))
+
+    buttons = []
+    remote.on_button(buttons.append)
+    remote.process()
+    if len(buttons) != EVENTS + 1:
+        raise AssertionError("lost notifications")
+    if max(direct, path) > limit:
+        raise AssertionError("heap grows per event")
+
+
+def run():
+    """
+    schedule the memory test, the host runs it right away
+
+    :returns: nothing
+    """
+    micropython.schedule(test, None)
+    if tracemalloc is not None:
+        micropython.run_scheduled()
+
+
+run()
@@ -0,0 +1,131 @@
+import blesim
+from remote import control
+from remote.control import PoweredUPRemote, PoweredUPScheduler
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Cooperative scheduler with slow user callbacks: a
+button callback busy for 3 ms under a notification
+stream. Compares the time spent in the BLE irq without
+and with the scheduler, runs the callbacks from a main
+loop in time slices, and checks that a disconnect runs
+before the queued buttons, which are dropped.
+
+PYTHONPATH=host:. python3 benchmarks/scheduler.py
+"""
+
+WORK_US = 3000
+NOTIFICATIONS = 120
+RATE_HZ = 100
+BURST = 3
+QUEUED = 8
+SLICE_MS = 5
+
+
+def work(button):
+    """
+    slow user callback
+    """
+    start = ticks_us()
+    while ticks_diff(ticks_us(), start) < WORK_US:
+        pass
+
+
+def connected(scheduler=None):
+    """
+    simulated radio with a connected remote and the slow button callback
+
+    :returns: (BLE, Remote, PoweredUPRemote)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, scheduler=scheduler)
+    remote.connect()
+    ble.run()
+    if scheduler:
+        scheduler.run()
+    remote.on_button(work)
+    return ble, peripheral, remote
+
+
+def irq_time(scheduler):
+    """
+    time in the BLE irq while streaming buttons
+
+    :param scheduler: PoweredUPScheduler or None to call back from the irq
+    :returns: irq statistics in us
+    """
+    ble, peripheral, remote = connected(scheduler)
+    control.profile()
+    peripheral.buttons(NOTIFICATIONS, RATE_HZ)
+    ble.run()
+    stats = control.stats()["irq"]
+    control.profile(False)
+    return stats
+
+
+def main_loop():
+    """
+    callbacks run from a main loop in time slices, BURST notifications arrive between two runs
+
+    :returns: (longest run in ms, scheduler statistics)
+    """
+    scheduler = PoweredUPScheduler(slots=48, slice_ms=SLICE_MS, budget_ms=2, auto=False)
+    ble, peripheral, remote = connected(scheduler)
+    peripheral.buttons(NOTIFICATIONS, RATE_HZ)
+    longest = 0
+    while ble.run(max_events=BURST) or scheduler.pending():
+        start = ticks_us()
+        scheduler.run()
+        longest = max(longest, ticks_diff(ticks_us(), start))
+    return longest / 1000, scheduler.stats()
+
+
+def disconnect_first():
+    """
+    buttons are queued, then the remote disconnects before the main loop runs
+
+    :returns: (order of the callbacks, scheduler statistics)
+    """
+    scheduler = PoweredUPScheduler(auto=False)
+    ble, peripheral, remote = connected(scheduler)
+    order = []
+    remote.on_button(lambda button: order.append("button"))
+    remote.on_disconnect(lambda: order.append("disconnect"))
+    peripheral.buttons(QUEUED, RATE_HZ)
+    ble.run()
+    remote.disconnect()
+    ble.run()
+    scheduler.run()
+    return order, scheduler.stats()
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    for name, scheduler in (("irq callbacks", None), ("scheduler", PoweredUPScheduler())):
+        stats = irq_time(scheduler)
+        print("%-14s irq p50 %5d us, max %5d us" % (name, stats["p50"], stats["max"]))
+
+    longest, stats = main_loop()
+    button = stats["button"]
+    if button["queued"] != NOTIFICATIONS or button["dropped"]:
+        raise AssertionError("callbacks lost: %s" % button)
+    if longest > SLICE_MS + 2 * WORK_US / 1000:
+        raise AssertionError("run of %.1f ms not sliced" % longest)
+    print("main loop      longest run %.1f ms (slice %d ms), %d runs cut, %d overruns, wait p50 %d us, max %d us" %
+          (longest, SLICE_MS, stats["slices"], stats["overruns"], button["wait"]["p50"], button["wait"]["max"]))
+
+    order, stats = disconnect_first()
+    if order != ["disconnect"]:
+        raise AssertionError("disconnect not first: %s" % order)
+    print("disconnect     ran first, %d queued buttons cancelled" % stats["button"]["cancelled"])
+
+
+run()
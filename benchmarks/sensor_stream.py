@@ -0,0 +1,165 @@
+import blesim
+import struct
+from remote.hub import PoweredUPHub
+from remote.lwp3 import Dispatcher, PortValues, MODE_FORMATS, header
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Sensor subscriptions of a Technic hub on the simulated
+radio: subscribes a motor position, the tilt of the hub
+and a combined speed, position and absolute position,
+checks the setup messages the hub receives and the
+decoded values of a stream of port values, truncated
+messages are dropped and unsubscribing disables the
+subscribed modes. Compares the decode with precomputed
+formats against parsing every message and looking up
+its format.
+
+PYTHONPATH=host:. python3 benchmarks/sensor_stream.py
+"""
+
+DEVICES = {0x00: 0x2E, 0x01: 0x2F, 0x63: 0x3B}
+VALUES = 3000
+RATE_HZ = 1000
+
+
+def position(value):
+    return struct.pack('<BBBBi', 0x08, 0x00, 0x45, 0x00, value)
+
+
+def tilt(value):
+    return struct.pack('<BBBBhhh', 0x0A, 0x00, 0x45, 0x63, value, -value, 0)
+
+
+def combined(value):
+    return struct.pack('<BBBBHbih', 0x0D, 0x00, 0x46, 0x01, 0x0007, value % 100, value, value % 180)
+
+
+def parse(data, devices, modes):
+    # every message parsed from its header, the format looked up per message
+    length, hub_id, message_type, offset = header(data)
+    if message_type == 0x45:
+        port = data[offset]
+        fmt = MODE_FORMATS[(devices[port], modes[port])]
+        return port, struct.unpack(fmt, bytes(data[offset + 1:length]))
+    elif message_type == 0x46:
+        port = data[offset]
+        pointer = data[offset + 1] | data[offset + 2] << 8
+        fmt = "<"
+        for index, mode in enumerate((1, 2, 3)):
+            if pointer & (1 << index):
+                fmt += MODE_FORMATS[(devices[port], mode)][1:]
+        return port, struct.unpack(fmt, bytes(data[offset + 3:length]))
+    return None
+
+
+def session():
+    """
+    subscribe three ports and stream their values
+
+    :returns: (streamed messages, real us per value)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.hub(devices=DEVICES))
+    hub = PoweredUPHub(ble=ble)
+    hub.connect()
+    ble.run()
+    if hub.devices() != DEVICES:
+        raise AssertionError("attached devices not reported")
+
+    received = {0x00: [], 0x01: [], 0x63: []}
+    hub.subscribe(0x00, 0x02, lambda port, value: received[port].append(value), delta=5)
+    hub.subscribe(0x63, 0x00, lambda port, value: received[port].append(value))
+    hub.subscribe_combined(0x01, (0x01, 0x02, 0x03), lambda port, value: received[port].append(value))
+    ble.run()
+    if peripheral.inputs != {0x00: (0x02, 5, 1), 0x63: (0x00, 1, 1), 0x01: (0x03, 1, 1)}:
+        raise AssertionError("wrong input format setups: %s" % peripheral.inputs)
+    if [message[2] for message in peripheral.messages][-6:] != [0x42, 0x41, 0x41, 0x41, 0x42, 0x42]:
+        raise AssertionError("wrong combined setup: %s" % peripheral.messages)
+    if peripheral.messages[-2] != bytes([0x09, 0x00, 0x42, 0x01, 0x01, 0x00, 0x10, 0x20, 0x30]):
+        raise AssertionError("wrong mode datasets: %s" % peripheral.messages[-2])
+
+    messages = []
+    for value in range(VALUES // 3):
+        messages += (position(value * 10), tilt(value), combined(value))
+    ble.stream(peripheral, 0x0B, messages, RATE_HZ)
+    start = ticks_us()
+    ble.run()
+    elapsed = ticks_diff(ticks_us(), start)
+
+    count = VALUES // 3
+    if received[0x00] != [value * 10 for value in range(count)]:
+        raise AssertionError("wrong positions")
+    if received[0x63] != [(value, -value, 0) for value in range(count)]:
+        raise AssertionError("wrong tilt")
+    if received[0x01] != [(value % 100, value, value % 180) for value in range(count)]:
+        raise AssertionError("wrong combined values")
+
+    # the subscribed modes are disabled, the combined port leaves the combined mode
+    hub.unsubscribe(0x00)
+    hub.unsubscribe(0x01)
+    ble.run()
+    if peripheral.inputs[0x00] != (0x02, 1, 0) or peripheral.inputs[0x01][2]:
+        raise AssertionError("subscribed modes not disabled: %s" % peripheral.inputs)
+    if [message[2] for message in peripheral.messages][-4:] != [0x42, 0x41, 0x41, 0x41] or \
+            peripheral.messages[-4][4] != 0x06:
+        raise AssertionError("combined mode not reset: %s" % peripheral.messages[-4:])
+    return messages, elapsed / len(messages)
+
+
+def decode(messages):
+    """
+    decode the messages with the subscriptions and by parsing every message
+
+    :param messages: port value messages
+    :returns: (us per message with subscriptions, us per message parsed)
+    """
+    dispatcher = Dispatcher()
+    dispatch = dispatcher.dispatch
+    values = PortValues(dispatcher)
+    sink = []
+    values.add(0x00, MODE_FORMATS[(0x2E, 0x02)], lambda port, value: sink.append(value))
+    values.add(0x63, MODE_FORMATS[(0x3B, 0x00)], lambda port, value: sink.append(value))
+    values.add_combined(0x01, ("<b", "<i", "<h"), lambda port, value: sink.append(value))
+
+    start = ticks_us()
+    for data in messages:
+        dispatch(data)
+    subscribed = ticks_diff(ticks_us(), start) / len(messages)
+
+    modes = {0x00: 0x02, 0x63: 0x00}
+    parsed = []
+    start = ticks_us()
+    for data in messages:
+        port, value = parse(data, DEVICES, modes)
+        parsed.append(value[0] if len(value) == 1 else value)
+    parsing = ticks_diff(ticks_us(), start) / len(messages)
+    if parsed != sink:
+        raise AssertionError("decoders differ")
+
+    # values cut short by the link are dropped instead of raising in the irq
+    dropped = values.dropped
+    for data in (position(1)[:6], tilt(1)[:9], combined(1)[:10], combined(1)[:5], bytes([0x04, 0x00, 0x45, 0x00])):
+        dispatch(data)
+    if values.dropped - dropped != 5 or len(sink) != len(messages):
+        raise AssertionError("truncated values not dropped")
+    return subscribed, parsing
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    messages, radio = session()
+    subscribed, parsing = decode(messages)
+    print("%d port values at %d Hz decoded, %.1f us per value through the radio (real)" %
+          (len(messages), RATE_HZ, radio))
+    print("decode with subscriptions %.2f us, parsed per message %.2f us" % (subscribed, parsing))
+
+
+run()
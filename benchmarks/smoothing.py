@@ -0,0 +1,97 @@
+import blesim
+from remote.control import PoweredUPRemote, PoweredUPButtons
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Input smoothing of a driving session: chords pressed
+a few ms apart, a bouncing and repeated button and
+steering changes, played on the simulated radio with
+the ticks in ms on its virtual clock. Counts the motor
+commands of the bound actions without smoothing, with
+deduplication, with a settle window and with a rate
+limit, and checks the added delay against its bound.
+Every configuration must end with a stop.
+
+PYTHONPATH=host:. python3 benchmarks/smoothing.py
+"""
+
+LEFT = 0
+RIGHT = 1
+PLUS = 0x01
+MINUS = 0xFF
+RELEASED = 0x00
+
+# (ms, port, value) of a gesture
+GESTURES = (
+    # both plus, the right one 4 ms later, released 3 ms apart
+    ((0, LEFT, PLUS), (4, RIGHT, PLUS), (150, LEFT, RELEASED), (153, RIGHT, RELEASED)),
+    # bouncing right plus, reported again while held
+    ((0, RIGHT, PLUS), (1, RIGHT, RELEASED), (2, RIGHT, PLUS), (80, RIGHT, PLUS), (150, RIGHT, RELEASED)),
+    # forward, then steering left and back
+    ((0, RIGHT, PLUS), (60, LEFT, MINUS), (62, LEFT, RELEASED), (63, LEFT, MINUS), (120, LEFT, RELEASED),
+     (150, RIGHT, RELEASED)),
+)
+GAP_MS = 30
+REPEAT = 4
+
+# (name, smooth arguments), None without smoothing
+CONFIGURATIONS = (
+    ("off", None),
+    ("dedupe", {}),
+    ("settle 20 ms", {"settle": 20}),
+    ("settle 20 ms, 10 Hz", {"settle": 20, "rate": 10}),
+)
+
+
+def session(smoothing):
+    """
+    play the gestures into a connected remote
+
+    :param smoothing: arguments of smooth() or None
+    :returns: (commands, transient single button commands, last command, smooth_stats())
+    """
+    ble = blesim.BLE(virtual_ms=True)
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble)
+    commands = []
+    remote.bind({
+        PoweredUPButtons.RIGHT_PLUS: (commands.append, "forward"),
+        PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS: (commands.append, "fast"),
+        PoweredUPButtons.LEFT_MINUS_RIGHT_PLUS: (commands.append, "left"),
+        PoweredUPButtons.LEFT_PLUS: (commands.append, "turn"),
+    }, default=(commands.append, "stop"))
+    if smoothing is not None:
+        remote.smooth(**smoothing)
+    remote.connect()
+    ble.run()
+    del commands[:]
+
+    start = 0
+    for _ in range(REPEAT):
+        for gesture in GESTURES:
+            for ms, port, value in gesture:
+                peripheral.press(port, value, (start + ms) * 1000)
+            start += gesture[-1][0] + GAP_MS
+    ble.run()
+    return len(commands), commands.count("turn"), commands[-1], remote.smooth_stats()
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    for name, smoothing in CONFIGURATIONS:
+        count, transient, last, stats = session(smoothing)
+        if last != "stop":
+            raise AssertionError("%s: session ends with %s" % (name, last))
+        if smoothing is not None and stats["max_ms"] > stats["bound_ms"]:
+            raise AssertionError("%s: delay %d ms above the bound %d ms" % (name, stats["max_ms"], stats["bound_ms"]))
+        print("%-20s %3d commands, %2d transient, delay max %3d ms (bound %3d ms)" %
+              (name, count, transient, stats["max_ms"], stats["bound_ms"]))
+
+
+run()
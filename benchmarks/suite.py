@@ -0,0 +1,261 @@
+import gc
+import sys
+from remote.control import PoweredUPRemote, _Decoder
+from remote.lwp3 import Encoder
+from utime import ticks_us, ticks_diff
+from corpora import ADVERTISEMENTS, NOTIFICATIONS
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+# heap is bytes on the hub (gc.mem_alloc), allocated blocks on the host
+try:
+    from gc import mem_alloc as allocated
+    HEAP_UNIT = "bytes"
+except ImportError:
+    from sys import getallocatedblocks as allocated
+    HEAP_UNIT = "blocks"
+
+try:
+    import blesim
+except ImportError:
+    blesim = None
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Benchmark suite of the hot paths with machine readable
+results: advertisement decoding over a classroom corpus,
+the notification path, message construction and connect
+handshakes. Prints one JSON object, with a baseline the
+cases slower by more than the tolerance are reported and
+the exit code is 1. On the host it can also run the
+scenario benchmarks and report which ones fail.
+
+on the hub: import suite; suite.run()
+PYTHONPATH=host:. python3 benchmarks/suite.py [--out results.json] [--baseline results.json]
+                                              [--tolerance 0.25] [--scripts]
+"""
+
+ROUNDS = 200
+REPEAT = 3
+HANDSHAKES = 20
+
+# compared with the baseline, timings may grow by the tolerance, the heap by half a unit per call
+TIMINGS = ("us", "ms", "virtual_ms")
+
+# scenario benchmarks run by --scripts
+SCRIPTS = ("button_decode", "remote_session", "multi_remote", "async_remote", "ring_alloc", "reconnect",
+           "supervisor", "footprint", "discovery", "lwp3_codec", "hub_control", "raw_stream", "latency",
+           "sensor_stream", "hub_properties", "button_bindings", "trace_replay", "emulator", "smoothing",
+           "scheduler")
+
+
+def measure(function, items, rounds=ROUNDS):
+    """
+    time and heap growth of calling a function for every item, the best of REPEAT runs
+
+    :param function: function with one argument
+    :param items: arguments
+    :param rounds: passes over the items
+    :returns: dict with us and heap per call
+    """
+    for item in items:
+        function(item)
+    calls = rounds * len(items)
+    best = None
+    for _ in range(REPEAT):
+        gc.collect()
+        gc.disable()
+        before = allocated()
+        start = ticks_us()
+        for _ in range(rounds):
+            for item in items:
+                function(item)
+        elapsed = ticks_diff(ticks_us(), start)
+        heap = allocated() - before
+        gc.enable()
+        if best is None or elapsed < best[0]:
+            best = (elapsed, heap)
+    return {"us": round(best[0] / calls, 3), "heap": round(best[1] / calls, 3)}
+
+
+def decoder_cases():
+    """
+    advertisement decoding over the corpus
+
+    :returns: dict of case -> metrics
+    """
+    decoder = _Decoder()
+    payloads = [payload for addr, payload in ADVERTISEMENTS]
+    return {
+        "decode_services": measure(decoder.decode_services, payloads),
+        "decode_manufacturer": measure(decoder.decode_manufacturer, payloads),
+        "decode_name": measure(decoder.decode_name, payloads),
+        "decode_lego": measure(lambda item: decoder.decode_lego(item[0], item[1]), ADVERTISEMENTS),
+    }
+
+
+def notify_cases():
+    """
+    button notifications through the decoding and the button callback
+
+    :returns: dict of case -> metrics
+    """
+    remote = PoweredUPRemote(ble=blesim.BLE() if blesim else None)
+    remote.on_button(lambda button: None)
+    cases = {"notify_button": measure(remote._PoweredUPRemote__notify, NOTIFICATIONS)}
+    remote.bind({0x01: lambda: None, 0x04: lambda: None})
+    cases["notify_bindings"] = measure(remote._PoweredUPRemote__notify, NOTIFICATIONS)
+    return cases
+
+
+def message_cases():
+    """
+    construction of the outgoing messages
+
+    :returns: dict of case -> metrics
+    """
+    remote = PoweredUPRemote(ble=blesim.BLE() if blesim else None)
+    encoder = Encoder()
+    colors = list(range(11))
+    return {
+        "color_message": measure(remote._PoweredUPRemote__color_message, colors),
+        "encode_color": measure(lambda color: encoder.write_direct_mode_data(0x34, 0x00, color), colors),
+        "encode_speed": measure(lambda speed: encoder.start_speed(0x00, speed), list(range(-100, 101, 20))),
+    }
+
+
+def handshake(cached):
+    """
+    connect a remote on the simulated radio until the handshake is done
+
+    :param cached: connect a known remote by its address without scan and discovery
+    :returns: (virtual ms, host ms)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, cache="/tmp/suite-remotes.txt" if cached else None)
+    done = []
+    remote.on_connect(lambda: done.append(ble.now_us))
+    start = ticks_us()
+    remote.connect(address=":".join("%02X" % b for b in peripheral.addr) if cached else None)
+    ble.run()
+    elapsed = ticks_diff(ticks_us(), start)
+    if not done:
+        raise AssertionError("remote not connected")
+    remote.disconnect()
+    ble.run()
+    return done[0] / 1000, elapsed / 1000
+
+
+def handshake_cases():
+    """
+    full and cached connect handshakes, only with the simulated radio
+
+    :returns: dict of case -> metrics
+    """
+    if not blesim:
+        return {}
+    cases = {}
+    for name, cached in (("handshake", False), ("handshake_cached", True)):
+        if cached:
+            handshake(True)
+        runs = [handshake(cached) for _ in range(HANDSHAKES)]
+        cases[name] = {"virtual_ms": round(sum(run[0] for run in runs) / HANDSHAKES, 3),
+                       "ms": round(sum(run[1] for run in runs) / HANDSHAKES, 3)}
+    return cases
+
+
+def scripts():
+    """
+    run the scenario benchmarks, each in its own interpreter
+
+    :returns: dict of script -> metrics
+    """
+    import os
+    import subprocess
+    import time
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((os.path.join(here, "..", "host"), os.path.join(here, ".."))))
+    cases = {}
+    for name in SCRIPTS:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(here, name + ".py")], env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        cases["script_" + name] = {"ok": result.returncode == 0, "s": round(time.perf_counter() - start, 3)}
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """
+    cases of the results which are slower than the baseline or allocate more
+
+    :param results: results of this run
+    :param baseline: results of an earlier run
+    :param tolerance: allowed relative slowdown
+    :returns: list of (case, metric, baseline value, value)
+    """
+    regressions = []
+    for case, metrics in results["cases"].items():
+        before = baseline["cases"].get(case)
+        if not before:
+            continue
+        for metric, value in metrics.items():
+            old = before.get(metric)
+            if old is None:
+                continue
+            if metric == "ok":
+                worse = old and not value
+            elif metric == "heap":
+                worse = value > old + 0.5
+            else:
+                worse = metric in TIMINGS and value > old * (1 + tolerance)
+            if worse:
+                regressions.append((case, metric, old, value))
+    return regressions
+
+
+def run(args=()):
+    """
+    run the suite and print the results as JSON
+
+    :param args: command line arguments
+    :returns: number of regressions or failed scripts
+    """
+    options = {"--out": None, "--baseline": None, "--tolerance": "0.25"}
+    run_scripts = "--scripts" in args
+    for index, arg in enumerate(args):
+        if arg in options and index + 1 < len(args):
+            options[arg] = args[index + 1]
+
+    cases = {}
+    for group in (decoder_cases, notify_cases, message_cases, handshake_cases):
+        cases.update(group())
+    if run_scripts:
+        cases.update(scripts())
+    results = {"implementation": sys.implementation.name, "platform": sys.platform, "heap_unit": HEAP_UNIT,
+               "cases": cases}
+
+    failures = [case for case, metrics in cases.items() if metrics.get("ok") is False]
+    if options["--baseline"]:
+        with open(options["--baseline"]) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, float(options["--tolerance"]))
+        results["regressions"] = [{"case": case, "metric": metric, "baseline": old, "value": value}
+                                  for case, metric, old, value in regressions]
+        failures += [case for case, metric, old, value in regressions]
+
+    output = json.dumps(results)
+    if options["--out"]:
+        with open(options["--out"], "w") as f:
+            f.write(output)
+    print(output)
+    return len(failures)
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run(sys.argv[1:]) else 0)
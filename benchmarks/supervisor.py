@@ -0,0 +1,72 @@
+import blesim
+from remote.control import PoweredUPRemote
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Reconnect supervisor on the simulated radio: the remote
+drops out for a while and comes back, the supervisor
+reconnects with backoff and the registered callbacks
+keep working. Reports the time to recover on the virtual
+clock for several outage lengths.
+
+PYTHONPATH=host:. python3 benchmarks/supervisor.py
+"""
+
+PRESS = bytes([0x05, 0x00, 0x45, 0x00, 0x01])
+RELEASE = bytes([0x05, 0x00, 0x45, 0x00, 0x00])
+OUTAGES_MS = (0, 100, 1000, 5000, 20000)
+
+
+def outage(duration_ms):
+    """
+    drop the remote for a while and wait until it is usable again
+
+    :param duration_ms: time the remote is away
+    :returns: (time to recover in ms, reconnect stats)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble, reconnect=True)
+    state = {'connected': [], 'disconnected': [], 'buttons': 0}
+
+    def on_button(button):
+        state['buttons'] += 1
+
+    remote.on_connect(lambda: state['connected'].append(ble.now_us))
+    remote.on_disconnect(lambda: state['disconnected'].append(ble.now_us))
+    remote.on_button(on_button)
+    remote.connect()
+    ble.run()
+
+    ble.remove(peripheral)
+    ble.schedule(duration_ms * 1000, ble.add, peripheral)
+    ble.run(until_us=ble.now_us + duration_ms * 1000 + 60000000)
+
+    if len(state['connected']) != 2:
+        raise AssertionError("not recovered after %d ms" % duration_ms)
+    ble.stream(peripheral, 0x0B, (PRESS, RELEASE), 100)
+    ble.run(until_us=ble.now_us + 100000)
+    if state['buttons'] != 2:
+        raise AssertionError("button callback lost after the reconnect")
+
+    recovered = (state['connected'][1] - state['disconnected'][0]) / 1000
+    remote.disconnect()
+    ble.run()
+    return recovered, remote.reconnect_stats()
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    for duration in OUTAGES_MS:
+        recovered, stats = outage(duration)
+        print("outage %5d ms: recovered after %7.1f ms (virtual), %d attempts" %
+              (duration, recovered, stats['attempts']))
+
+
+run()
@@ -0,0 +1,182 @@
+import blesim
+import os
+from remote.control import PoweredUPRemote, PoweredUPColors
+from remote.trace import record, TracePlayer, TraceRecorder, ReplayBLE
+import struct
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Capture and replay of a session: records a remote on
+the simulated radio running in real time, then feeds
+the trace into a remote on a ReplayBLE as fast as
+possible, at the original and at ten times the speed.
+Every replay must produce the same button events as
+the recorded session. Also records the failed connect
+of a cached remote that is gone, its disconnect without
+a connection must replay unchanged. A trace longer
+than the wrap of the ticks keeps its pacing and record
+sizes the format cannot hold are rejected.
+
+PYTHONPATH=host:. python3 benchmarks/trace_replay.py
+"""
+
+PATH = "/tmp/session.trace"
+CACHE = "/tmp/trace_remotes.txt"
+MISSING = "90:84:2B:00:00:02"
+
+PRESSES = (
+    bytes([0x05, 0x00, 0x45, 0x00, 0x01]),
+    bytes([0x05, 0x00, 0x45, 0x00, 0x00]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0xFF]),
+    bytes([0x05, 0x00, 0x45, 0x01, 0x00]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x01]),
+    bytes([0x05, 0x00, 0x08, 0x02, 0x00]),
+)
+
+EVENTS = 120
+RATE_HZ = 100
+
+# ubluetooth irq events of a disconnect and a notification
+_IRQ_PERIPHERAL_DISCONNECT = 1 << 7
+_IRQ_GATTC_NOTIFY = 1 << 13
+
+# ticks of the stand-in and the hub wrap after 2 ** 30 us, about 537 s
+TICKS_MAX = (1 << 30) - 1
+GAP_US = 100000000
+LONG_SPEED = 100000
+
+
+def capture():
+    """
+    record a session on the simulated radio
+
+    :returns: (button events, recorder statistics)
+    """
+    ble = blesim.BLE()
+    peripheral = ble.add(blesim.remote())
+    remote = PoweredUPRemote(ble=ble)
+    buttons = []
+    remote.on_button(buttons.append)
+    recorder = record(PATH, ble, batch=16)
+    remote.connect()
+    ble.run()
+    for i in range(0, EVENTS, 20):
+        ble.schedule(i * 10000 + 5000, remote.set_color, PoweredUPColors.RED if i % 40 else PoweredUPColors.GREEN)
+    ble.stream(peripheral, 0x0B, (PRESSES[i % len(PRESSES)] for i in range(EVENTS)), RATE_HZ)
+    ble.run(speed=1)
+    recorder.stop()
+    return buttons, recorder.stats()
+
+
+def replay(speed):
+    """
+    replay the trace into a new remote
+
+    :param speed: replay speed, 0 as fast as possible
+    :returns: (button events, replayed events, real ms)
+    """
+    ble = ReplayBLE()
+    remote = PoweredUPRemote(ble=ble)
+    buttons = []
+    remote.on_button(buttons.append)
+    remote.connect()
+    start = ticks_us()
+    count = TracePlayer(PATH).play(ble, speed)
+    return buttons, count, ticks_diff(ticks_us(), start) / 1000
+
+
+def failed_connect():
+    """
+    record the failed connect of a missing cached remote and a disconnect with the largest one byte handle
+
+    :returns: (recorded, replayed) conn handles of the disconnects
+    """
+    with open(CACHE, 'w') as f:
+        f.write("%s,0,11\n" % MISSING.replace(':', '').lower())
+    ble = blesim.BLE()
+    remote = PoweredUPRemote(ble=ble, cache=CACHE)
+    recorder = record(PATH, ble, batch=16)
+    remote.connect(address=MISSING)
+    ble.run()
+    recorder.put(_IRQ_PERIPHERAL_DISCONNECT, (0xFF, 0, memoryview(b'\x90\x84\x2b\x00\x00\x03')))
+    recorder.stop()
+    os.remove(CACHE)
+    handles = [data[0] for _, event, data in TracePlayer(PATH) if event == _IRQ_PERIPHERAL_DISCONNECT]
+    return [0xFFFF, 0xFF], handles
+
+
+def long_trace():
+    """
+    replay a trace of notifications 100 s apart, the ticks of the later ones wrap
+
+    :returns: (trace us, replay us) from the first to the last notification
+    """
+    recorder = TraceRecorder(PATH, batch=8)
+    for i in range(8):
+        recorder.put(_IRQ_GATTC_NOTIFY, (0, 0x0B, memoryview(PRESSES[i % len(PRESSES)])))
+    recorder.stop()
+    # the recorder stamps the current ticks, spread them over 700 s
+    with open(PATH, 'r+b') as f:
+        for i in range(8):
+            f.seek(8 + i * 50)
+            f.write(struct.pack("<I", i * GAP_US & TICKS_MAX))
+
+    ble = ReplayBLE()
+    played = []
+    ble.handler = lambda event, data: played.append(ticks_us())
+    TracePlayer(PATH).play(ble, LONG_SPEED)
+    return 7 * GAP_US // LONG_SPEED, ticks_diff(played[-1], played[0])
+
+
+def sizes():
+    """
+    record sizes the file header or the fixed fields cannot hold
+
+    :returns: rejected sizes
+    """
+    rejected = []
+    for size in (18, 19, 255, 256):
+        try:
+            TraceRecorder(PATH, size=size)
+        except ValueError:
+            rejected.append(size)
+    return rejected
+
+
+def run():
+    """
+    run the benchmark and print the results
+
+    :returns: nothing
+    """
+    buttons, stats = capture()
+    size = os.stat(PATH)[6]
+    if stats["dropped"] or stats["truncated"]:
+        raise AssertionError("events lost while recording: %s" % stats)
+    print("recorded %d events in %d appends, %d bytes" % (stats["recorded"], stats["appends"], size))
+    for speed in (0, 1, 10):
+        replayed, count, elapsed = replay(speed)
+        if replayed != buttons:
+            raise AssertionError("replay at speed %d differs: %s" % (speed, replayed))
+        print("speed %-3d replayed %d events in %.0f ms" % (speed, count, elapsed))
+
+    recorded, replayed = failed_connect()
+    if replayed != recorded:
+        raise AssertionError("disconnect handles differ: %s, recorded %s" % (replayed, recorded))
+    print("failed connect replayed, disconnect handles %s" % ", ".join("0x%X" % handle for handle in replayed))
+
+    trace_us, replay_us = long_trace()
+    if replay_us < trace_us:
+        raise AssertionError("trace over the ticks wrap replayed in %d us, expected %d us" % (replay_us, trace_us))
+    print("700 s trace at speed %d replayed in %.1f ms" % (LONG_SPEED, replay_us / 1000))
+
+    rejected = sizes()
+    if rejected != [18, 256]:
+        raise AssertionError("record sizes rejected: %s" % rejected)
+    os.remove(PATH)
+
+
+run()
@@ -0,0 +1,51 @@
+from spike import PrimeHub, MotorPair
+from remote.aio import AsyncPoweredUPRemote
+from remote.control import PoweredUPColors, PoweredUPButtons
+import uasyncio
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+This is a basic example:
+This example let control a motor pair
+with the powered up remote, the buttons are
+handled in a coroutine instead of the ble irq,
+so event based motor functions can be used
+"""
+
+
+async def main():
+    """
+    connect and drive with the remote
+    """
+    if not await remote.connect():
+        hub.status_light.on("red")
+        return
+    hub.status_light.on("blue")
+    await remote.set_color(PoweredUPColors.GREEN)
+
+    async for button in remote.buttons():
+        if button == PoweredUPButtons.RIGHT_PLUS:
+            motor_pair.start(speed=75)
+        elif button == PoweredUPButtons.RIGHT_MINUS:
+            motor_pair.start(speed=-75)
+        elif button == PoweredUPButtons.CENTER:
+            motor_pair.move(10, 'cm', steering=100)
+        else:
+            motor_pair.stop()
+
+    hub.status_light.on("white")
+    motor_pair.stop()
+
+
+# set up hub
+hub = PrimeHub()
+
+# set up motors
+motor_pair = MotorPair('A', 'B')
+motor_pair.set_stop_action('coast')
+
+# create remote and run
+remote = AsyncPoweredUPRemote()
+uasyncio.run(main())
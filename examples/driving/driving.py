@@ -8,7 +8,8 @@ LEGO(R) SPIKE PRIME + POWERED UP
 
 This is a basic example:
 This example let control a motor pair
-with the powered up remote
+with the powered up remote, the buttons are
+bound to the motor actions once and smoothed
 """
 
 
@@ -27,30 +28,6 @@ def on_disconnect():
     motor_pair.stop()
 
 
-def on_button(button):
-    """
-    callback on button press
-
-    :param button: button id
-    """
-    if button == PoweredUPButtons.RIGHT_PLUS:
-        motor_pair.start(speed=75)
-    elif button == PoweredUPButtons.RIGHT_MINUS:
-        motor_pair.start(speed=-75)
-    elif button == PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS:
-        motor_pair.start(steering=-45, speed=75)
-    elif button == PoweredUPButtons.LEFT_MINUS_RIGHT_PLUS:
-        motor_pair.start(steering=45, speed=75)
-    elif button == PoweredUPButtons.LEFT_MINUS_RIGHT_MINUS:
-        motor_pair.start(steering=45, speed=-75)
-    elif button == PoweredUPButtons.LEFT_PLUS_RIGHT_MINUS:
-        motor_pair.start(steering=-45, speed=-75)
-    elif button == PoweredUPButtons.RELEASED:
-        motor_pair.stop()
-    else:
-        motor_pair.stop()
-
-
 # set up hub
 hub = PrimeHub()
 
@@ -62,5 +39,14 @@ motor_pair.set_stop_action('coast')
 remote = PoweredUPRemote()
 remote.on_connect(callback=on_connect)
 remote.on_disconnect(callback=on_disconnect)
-remote.on_button(callback=on_button)
+remote.bind({
+    PoweredUPButtons.RIGHT_PLUS: (motor_pair.start, 0, 75),
+    PoweredUPButtons.RIGHT_MINUS: (motor_pair.start, 0, -75),
+    PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS: (motor_pair.start, -45, 75),
+    PoweredUPButtons.LEFT_MINUS_RIGHT_PLUS: (motor_pair.start, 45, 75),
+    PoweredUPButtons.LEFT_MINUS_RIGHT_MINUS: (motor_pair.start, 45, -75),
+    PoweredUPButtons.LEFT_PLUS_RIGHT_MINUS: (motor_pair.start, -45, -75),
+}, default=motor_pair.stop)
+# chords pressed a few ms apart start the motors once
+remote.smooth(settle=20, rate=10)
 remote.connect()
\ No newline at end of file
@@ -0,0 +1,810 @@
+import heapq
+import struct
+import time
+import micropython
+import utime
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Simulated ubluetooth radio for the host. The simulation
+is deterministic: every event is scheduled on a virtual
+clock and delivered in order to the registered irq handler
+when run() is called, never from inside another ble call.
+Peripherals are scripted with advertisement data, a gatt
+table and notification streams at a configurable rate,
+the LEGO remote and hub emulators validate the written
+messages and notify like the devices.
+"""
+
+FLAG_READ = 0x0002
+FLAG_WRITE_NO_RESPONSE = 0x0004
+FLAG_WRITE = 0x0008
+FLAG_NOTIFY = 0x0010
+
+# irq events of the ubluetooth version running on the hub
+_IRQ_SCAN_RESULT = 1 << 4
+_IRQ_SCAN_COMPLETE = 1 << 5
+_IRQ_PERIPHERAL_CONNECT = 1 << 6
+_IRQ_PERIPHERAL_DISCONNECT = 1 << 7
+_IRQ_GATTC_SERVICE_RESULT = 1 << 8
+_IRQ_GATTC_CHARACTERISTIC_RESULT = 1 << 9
+_IRQ_GATTC_READ_RESULT = 1 << 11
+_IRQ_GATTC_WRITE_STATUS = 1 << 12
+_IRQ_GATTC_NOTIFY = 1 << 13
+
+# attached io of the remote: buttons, led, voltage and rssi
+_REMOTE_PORTS = {0x00: 0x37, 0x01: 0x37, 0x34: 0x17, 0x3B: 0x14, 0x3C: 0x38}
+
+# number of modes per io type, other io types have one mode
+_MODES = {0x37: 5, 0x17: 2, 0x14: 2, 0x38: 1, 0x25: 11, 0x26: 4, 0x27: 4, 0x28: 4,
+          0x2E: 6, 0x2F: 6, 0x30: 6, 0x31: 6, 0x3B: 3, 0x3D: 11, 0x3E: 3}
+
+# generic error code of invalid messages
+_ERROR_INVALID_USE = 0x06
+
+# advertising types
+_ADV_IND = 0x00
+_ADV_SCAN_RSP = 0x04
+
+LEGO_SERVICE_UUID = "00001623-1212-EFDE-1623-785FEABCD123"
+LEGO_SERVICE_CHAR = "00001624-1212-EFDE-1623-785FEABCD123"
+LEGO_COMPANY_ID = 0x0397
+
+
+class UUID:
+    """
+    Bluetooth UUID, compares like ubluetooth.UUID
+    """
+
+    def __init__(self, value):
+        """
+        create a uuid from an int, a uuid string or little endian bytes
+
+        :param value: uuid value
+        """
+        if isinstance(value, int):
+            self.__value = struct.pack('<H', value) if value <= 0xFFFF else struct.pack('<I', value)
+        elif isinstance(value, str):
+            self.__value = bytes(reversed(bytes.fromhex(value.replace('-', ''))))
+        else:
+            self.__value = bytes(value)
+        if len(self.__value) not in (2, 4, 16):
+            raise ValueError("invalid UUID")
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self.__value == other.__value
+
+    def __hash__(self):
+        return hash(self.__value)
+
+    def __bytes__(self):
+        return self.__value
+
+    def __repr__(self):
+        if len(self.__value) == 16:
+            h = bytes(reversed(self.__value)).hex().upper()
+            return "UUID('%s-%s-%s-%s-%s')" % (h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+        return "UUID(0x%x)" % int.from_bytes(self.__value, 'little')
+
+
+def advertisement(name=None, services=(), manufacturer=None, flags=0x06):
+    """
+    build an advertising payload
+
+    :param name: complete local name
+    :param services: service uuid strings or ints
+    :param manufacturer: (company id, data bytes)
+    :param flags: advertising flags, None to omit
+    :returns: payload bytes
+    """
+    payload = bytearray()
+
+    def field(adv_type, value):
+        payload.extend(bytes((len(value) + 1, adv_type)) + value)
+
+    if flags is not None:
+        field(0x01, bytes((flags,)))
+    for service in services:
+        value = bytes(UUID(service))
+        field({2: 0x03, 4: 0x05, 16: 0x07}[len(value)], value)
+    if manufacturer:
+        field(0xFF, struct.pack('<H', manufacturer[0]) + bytes(manufacturer[1]))
+    if name:
+        field(0x09, name.encode())
+    return bytes(payload)
+
+
+class Peripheral:
+    """
+    Scripted BLE peripheral
+    """
+
+    def __init__(self, addr, adv_data, resp_data=None, addr_type=0, rssi=-60, adv_interval_ms=100, services=()):
+        """
+        create a peripheral
+
+        :param addr: 6 byte mac address
+        :param adv_data: advertising payload
+        :param resp_data: scan response payload, only reported to active scans
+        :param addr_type: address type
+        :param rssi: signal strength reported with each advertisement
+        :param adv_interval_ms: advertising interval
+        :param services: ((start, end, uuid, ((def_handle, value_handle, properties, uuid), ...)), ...)
+        """
+        self.addr = bytes(addr)
+        self.addr_type = addr_type
+        self.adv_data = adv_data
+        self.resp_data = resp_data
+        self.rssi = rssi
+        self.adv_interval_ms = adv_interval_ms
+        self.services = tuple((start, end, UUID(uuid), tuple((d, v, p, UUID(u)) for d, v, p, u in chars))
+                              for start, end, uuid, chars in services)
+        self.values = {}
+        self.writes = []
+        # value handle -> status, writes to these handles fail
+        self.failures = {}
+        self.conn_handle = None
+
+    def on_write(self, value_handle, data):
+        """
+        called for every write of the central
+
+        :param value_handle: written handle
+        :param data: written bytes
+        :returns: write status, 0 on success, 0x01 (invalid handle) for unknown handles,
+                  the status in failures for failing handles
+        """
+        if value_handle in self.failures:
+            return self.failures[value_handle]
+        # characteristic values and their client configuration descriptor at value_handle + 1
+        for _, _, _, chars in self.services:
+            for _, handle, _, _ in chars:
+                if value_handle == handle or value_handle == handle + 1:
+                    self.writes.append((value_handle, bytes(data)))
+                    return 0
+        return 0x01
+
+    def on_read(self, value_handle):
+        """
+        called for every read of the central
+
+        :param value_handle: read handle
+        :returns: value bytes
+        """
+        return self.values.get(value_handle, b'')
+
+    def on_connect(self, ble):
+        """
+        called when the central connected
+
+        :param ble: the simulated radio
+        :returns: nothing
+        """
+        pass
+
+    def on_disconnect(self, ble):
+        """
+        called when the connection is closed
+
+        :param ble: the simulated radio
+        :returns: nothing
+        """
+        pass
+
+
+class Device(Peripheral):
+    """
+    Scripted LEGO(R) Powered UP(TM) device, splits writes into messages, checks every
+    byte of a message against the attached io and answers invalid ones with a generic
+    error, keeps the port input format setups as port -> (mode, delta, notify) and
+    pushes hub property updates (battery, rssi, button) when they are enabled
+    """
+
+    def __init__(self, addr, adv_data, resp_data=None, rssi=-60, services=(), battery=100, ports=None):
+        """
+        create a device
+
+        :param battery: battery level in %
+        :param ports: dict of port -> io type id of the attached io
+        """
+        super().__init__(addr, adv_data, resp_data, rssi=rssi, services=services)
+        self.ports = dict(ports or {})
+        self.messages = []
+        self.errors = []
+        self.inputs = {}
+        self.properties = {0x02: 0x00, 0x05: rssi, 0x06: battery}
+        self.updates = set()
+        self.ble = None
+
+    def on_write(self, value_handle, data):
+        status = super().on_write(value_handle, data)
+        if status == 0 and value_handle == 0x0B:
+            # a write may carry several messages, each starts with its length
+            data = bytes(data)
+            i = 0
+            while i < len(data):
+                message = data[i:i + max(data[i], 3)]
+                self.messages.append(message)
+                error = self.validate(message)
+                if error:
+                    self.errors.append((message, error))
+                    if self.ble:
+                        self.ble.notify(self, 0x0B, bytes((0x05, 0x00, 0x05, message[2] if len(message) > 2 else 0,
+                                                           _ERROR_INVALID_USE)))
+                else:
+                    self.on_message(message)
+                i += len(message)
+        return status
+
+    def validate(self, message):
+        """
+        check every byte of a message written by the central
+
+        :param message: message bytes
+        :returns: None if valid, else the reason
+        """
+        if len(message) < 3 or message[0] != len(message):
+            return "length"
+        if message[1] != 0x00:
+            return "hub id"
+        message_type = message[2]
+        if message_type == 0x01:
+            if len(message) != 5 or not 0x01 <= message[3] <= 0x0F or not 0x02 <= message[4] <= 0x05:
+                return "hub property"
+        elif message_type == 0x41:
+            if len(message) != 10:
+                return "length"
+            port, mode, delta, notify = struct.unpack_from('<BBIB', message, 3)
+            if port not in self.ports:
+                return "port"
+            if mode >= _MODES.get(self.ports[port], 1):
+                return "mode"
+            if notify > 1:
+                return "notify"
+        elif message_type == 0x42:
+            if len(message) < 5 or message[3] not in self.ports or message[4] not in (0x01, 0x02, 0x03, 0x04, 0x06):
+                return "combined setup"
+        elif message_type == 0x81:
+            if len(message) < 6 or message[3] not in self.ports:
+                return "port"
+            if message[4] & ~0x11:
+                return "startup"
+            if message[5] == 0x51 and (len(message) < 8 or message[6] >= _MODES.get(self.ports[message[3]], 1)):
+                return "mode"
+        else:
+            return "message type"
+        return None
+
+    def on_message(self, message):
+        """
+        called for every valid message written by the central
+
+        :param message: message bytes
+        :returns: nothing
+        """
+        if message[2] == 0x41:
+            port, mode, delta, notify = struct.unpack_from('<BBIB', message, 3)
+            self.inputs[port] = (mode, delta, notify)
+            return
+        if message[2] != 0x01 or message[3] not in self.properties:
+            return
+        prop, operation = message[3], message[4]
+        if operation == 0x02:
+            self.updates.add(prop)
+            self.update(prop)
+        elif operation == 0x03:
+            self.updates.discard(prop)
+        elif operation == 0x05:
+            self.update(prop, force=True)
+
+    def set_property(self, prop, value):
+        """
+        change a hub property, an update is pushed if updates are enabled
+
+        :param prop: hub property id, 0x02 button, 0x05 rssi, 0x06 battery
+        :param value: new value
+        :returns: nothing
+        """
+        self.properties[prop] = value
+        if self.ble and self.conn_handle is not None:
+            self.update(prop)
+
+    def update(self, prop, force=False):
+        """
+        send the update of a hub property
+
+        :param prop: hub property id
+        :param force: send it also when updates are disabled
+        :returns: nothing
+        """
+        if force or prop in self.updates:
+            self.ble.notify(self, 0x0B, bytes((0x06, 0x00, 0x01, prop, 0x06, self.properties[prop] & 0xFF)))
+
+    def on_connect(self, ble):
+        self.ble = ble
+
+    def on_disconnect(self, ble):
+        self.updates.clear()
+        self.inputs.clear()
+
+
+class Remote(Device):
+    """
+    Scripted LEGO(R) Powered UP(TM) remote, the left and right buttons
+    only notify after their port input format setup
+    """
+
+    def press(self, port, value, delay_us=0):
+        """
+        send a button notification
+
+        :param port: 0 left, 1 right, 2 center
+        :param value: raw value, 0x00 released, 0x01 plus, 0x7F red, 0xFF minus
+        :param delay_us: delay from now
+        :returns: True if the notification was sent
+        """
+        message = self.button(port, value)
+        if message is None:
+            return False
+        self.ble.notify(self, 0x0B, message, delay_us)
+        return True
+
+    def button(self, port, value):
+        """
+        notification of a button
+
+        :param port: 0 left, 1 right, 2 center
+        :param value: raw value
+        :returns: notification bytes or None if the port does not notify
+        """
+        if port == 2:
+            return bytes((0x05, 0x00, 0x08, 0x02, value))
+        setup = self.inputs.get(port)
+        if not setup or not setup[2]:
+            return None
+        return bytes((0x05, 0x00, 0x45, port, value))
+
+    def buttons(self, count, rate_hz, delay_us=0):
+        """
+        send presses and releases of the subscribed buttons at a fixed rate
+
+        :param count: number of notifications
+        :param rate_hz: notifications per second, above the capacity of the link they queue up
+        :param delay_us: delay of the first notification from now
+        :returns: number of scheduled notifications
+        """
+        sequence = []
+        for port in (0, 1, 2):
+            for value in ((0x01, 0x00, 0xFF, 0x00, 0x7F, 0x00) if port < 2 else (0x01, 0x00)):
+                message = self.button(port, value)
+                if message:
+                    sequence.append(message)
+        messages = (sequence[i % len(sequence)] for i in range(count))
+        return self.ble.stream(self, 0x0B, messages, rate_hz, delay_us)
+
+
+def remote(addr=b'\x90\x84\x2b\x00\x00\x01', name="Handset", rssi=-60, system_type=0x42):
+    """
+    create a peripheral advertising like a LEGO(R) Powered UP(TM) remote
+
+    :param addr: 6 byte mac address
+    :param name: advertised name
+    :param rssi: signal strength
+    :param system_type: system type and device number, 66 is the remote
+    :returns: Remote
+    """
+    adv_data = advertisement(services=(LEGO_SERVICE_UUID,),
+                             manufacturer=(LEGO_COMPANY_ID, bytes((0x00, system_type, 0x02, 0x00, 0x00, 0x00))))
+    resp_data = advertisement(name=name, flags=None)
+    services = ((0x09, 0xFFFF, LEGO_SERVICE_UUID, ((0x0A, 0x0B, FLAG_WRITE | FLAG_WRITE_NO_RESPONSE | FLAG_NOTIFY,
+                                                    LEGO_SERVICE_CHAR),)),)
+    return Remote(addr, adv_data, resp_data, rssi=rssi, services=services, ports=_REMOTE_PORTS)
+
+
+class Hub(Device):
+    """
+    Scripted LEGO(R) Powered UP(TM) hub, reports the attached devices
+    when notifications are enabled
+    """
+
+    def __init__(self, addr, adv_data, resp_data=None, rssi=-60, services=(), devices=None):
+        """
+        create a hub
+
+        :param devices: dict of port -> io type id of the attached devices
+        """
+        super().__init__(addr, adv_data, resp_data, rssi=rssi, services=services, ports=devices)
+        self.devices = dict(devices or {})
+
+    def on_write(self, value_handle, data):
+        status = super().on_write(value_handle, data)
+        if status == 0 and value_handle == 0x0C and bytes(data) == b'\x01\x00':
+            for port, io_type in self.devices.items():
+                self.ble.notify(self, 0x0B, struct.pack('<BBBBBH8x', 0x0F, 0x00, 0x04, port, 0x01, io_type))
+        return status
+
+
+def strangers():
+    """
+    create peripherals advertising the LEGO service without or with short manufacturer data
+
+    :returns: list of Peripheral
+    """
+    services = (LEGO_SERVICE_UUID,)
+    return [Peripheral(b'\x90\x84\x2b\x00\x02\x01', advertisement(services=services), adv_interval_ms=20),
+            Peripheral(b'\x90\x84\x2b\x00\x02\x02', advertisement(services=services,
+                                                                  manufacturer=(LEGO_COMPANY_ID, b'\x00')),
+                       adv_interval_ms=20)]
+
+
+def hub(addr=b'\x90\x84\x2b\x00\x01\x01', name="Technic Hub", rssi=-60, system_type=0x80, devices=None):
+    """
+    create a peripheral advertising like a LEGO(R) Powered UP(TM) hub
+
+    :param addr: 6 byte mac address
+    :param name: advertised name
+    :param rssi: signal strength
+    :param system_type: system type, 0x40 move hub, 0x41 city hub, 0x80 technic hub
+    :param devices: dict of port -> io type id, default are two motors on port A and B
+    :returns: Hub
+    """
+    adv_data = advertisement(services=(LEGO_SERVICE_UUID,),
+                             manufacturer=(LEGO_COMPANY_ID, bytes((0x00, system_type, 0x02, 0x00, 0x00, 0x00))))
+    resp_data = advertisement(name=name, flags=None)
+    services = ((0x09, 0xFFFF, LEGO_SERVICE_UUID, ((0x0A, 0x0B, FLAG_WRITE | FLAG_WRITE_NO_RESPONSE | FLAG_NOTIFY,
+                                                    LEGO_SERVICE_CHAR),)),)
+    return Hub(addr, adv_data, resp_data, rssi=rssi, services=services,
+               devices=devices if devices is not None else {0x00: 0x2E, 0x01: 0x2E})
+
+
+# the radio created last, its virtual clock drives the host timers
+_clock = None
+
+
+def clock():
+    """
+    the simulated radio created last
+
+    :returns: BLE
+    """
+    return _clock
+
+
+class BLE:
+    """
+    Simulated ubluetooth.BLE
+    """
+
+    def __init__(self, conn_interval_us=7500, packets_per_event=None, virtual_ms=False):
+        """
+        create a simulated radio
+
+        :param conn_interval_us: link latency for connect, discovery and write responses
+        :param packets_per_event: notifications a link carries per connection interval, the
+                                  following ones wait for the next interval, unlimited if None
+        :param virtual_ms: utime.ticks_ms follows the virtual clock instead of the host clock,
+                           so delays in ms of the library are measured without host latency
+        """
+        self.conn_interval_us = conn_interval_us
+        self.packets_per_event = packets_per_event
+        self.deferred = 0
+        self.delivered = 0
+        self.irq_ticks_us = 0
+        # gattc_write calls that fail with OSError(16) (EBUSY) like a busy stack
+        self.busy = 0
+        self.__active = False
+        self.__handler = None
+        self.__now = 0
+        self.__seq = 0
+        self.__queue = []
+        self.__peripherals = []
+        self.__connections = {}
+        self.__next_conn_handle = 0
+        self.__scan_id = 0
+        self.__scanning = False
+        self.__scan_active = False
+        self.__awaiting = {}
+        self.__links = {}
+
+        global _clock
+        _clock = self
+        utime._virtual = self if virtual_ms else None
+
+    """
+    ubluetooth api
+    --------------
+    """
+
+    def active(self, active=None):
+        if active is not None:
+            self.__active = bool(active)
+        return self.__active
+
+    def config(self, name):
+        if name == 'mac':
+            return 0, b'\x00\x00\x00\x00\x00\x00'
+        raise ValueError("unknown config param")
+
+    def irq(self, handler):
+        self.__handler = handler
+
+    def gap_scan(self, duration_ms, interval_us=1280000, window_us=11250, active=False):
+        if duration_ms is None:
+            if self.__scanning:
+                self.__stop_scan()
+            return
+        self.__scan_id += 1
+        self.__scanning = True
+        self.__scan_active = active
+        scan_id = self.__scan_id
+        for index, peripheral in enumerate(self.__peripherals):
+            self.__schedule(1000 * (index + 1), self.__advertise, scan_id, peripheral)
+        if duration_ms:
+            self.__schedule(duration_ms * 1000, self.__scan_timeout, scan_id)
+
+    def gap_connect(self, addr_type, addr, scan_duration_ms=2000):
+        peripheral = self.__find(addr)
+        if peripheral:
+            self.__schedule(self.conn_interval_us, self.__connected, peripheral)
+            return
+        # the stack waits for the device to advertise until scan_duration_ms
+        addr = bytes(addr)
+        self.__awaiting[addr] = addr_type
+        self.__schedule(scan_duration_ms * 1000, self.__connect_timeout, addr)
+
+    def gap_disconnect(self, conn_handle):
+        peripheral = self.__connections.get(conn_handle)
+        if not peripheral:
+            return False
+        self.__schedule(self.conn_interval_us, self.__disconnected, peripheral)
+        return True
+
+    def gattc_discover_services(self, conn_handle):
+        peripheral = self.__connection(conn_handle)
+        for start, end, uuid, _ in peripheral.services:
+            self.__schedule(self.conn_interval_us, self.__deliver, _IRQ_GATTC_SERVICE_RESULT,
+                            (conn_handle, start, end, uuid))
+
+    def gattc_discover_characteristics(self, conn_handle, start_handle, end_handle):
+        peripheral = self.__connection(conn_handle)
+        for _, _, _, chars in peripheral.services:
+            for def_handle, value_handle, properties, uuid in chars:
+                if start_handle <= def_handle <= end_handle:
+                    self.__schedule(self.conn_interval_us, self.__deliver, _IRQ_GATTC_CHARACTERISTIC_RESULT,
+                                    (conn_handle, def_handle, value_handle, properties, uuid))
+
+    def gattc_read(self, conn_handle, value_handle):
+        peripheral = self.__connection(conn_handle)
+        data = memoryview(bytes(peripheral.on_read(value_handle)))
+        self.__schedule(self.conn_interval_us, self.__deliver, _IRQ_GATTC_READ_RESULT,
+                        (conn_handle, value_handle, data))
+
+    def gattc_write(self, conn_handle, value_handle, data, mode=0):
+        peripheral = self.__connection(conn_handle)
+        if self.busy:
+            self.busy -= 1
+            raise OSError(16)  # EBUSY
+        status = peripheral.on_write(value_handle, data)
+        if mode == 1:
+            self.__schedule(self.conn_interval_us, self.__deliver, _IRQ_GATTC_WRITE_STATUS,
+                            (conn_handle, value_handle, status))
+
+    """
+    simulation api
+    --------------
+    """
+
+    @property
+    def now_us(self):
+        """
+        virtual time in us
+        """
+        return self.__now
+
+    @property
+    def handler(self):
+        """
+        the registered irq handler
+        """
+        return self.__handler
+
+    def add(self, peripheral):
+        """
+        make a peripheral visible to scans and connects
+
+        :param peripheral: Peripheral
+        :returns: the peripheral
+        """
+        self.__peripherals.append(peripheral)
+        if self.__awaiting.pop(peripheral.addr, None) is not None:
+            self.__schedule(self.conn_interval_us, self.__connected, peripheral)
+        return peripheral
+
+    def remove(self, peripheral):
+        """
+        remove a peripheral, an open connection is dropped
+
+        :param peripheral: Peripheral
+        :returns: nothing
+        """
+        self.__peripherals.remove(peripheral)
+        if peripheral.conn_handle is not None:
+            self.__schedule(0, self.__disconnected, peripheral)
+
+    def notify(self, peripheral, value_handle, data, delay_us=0):
+        """
+        send one notification of a connected peripheral
+
+        :param peripheral: Peripheral
+        :param value_handle: notifying handle
+        :param data: notification bytes
+        :param delay_us: delay from now
+        :returns: nothing
+        """
+        if self.packets_per_event:
+            delay_us = self.__link_slot(peripheral, self.__now + delay_us) - self.__now
+        self.__schedule(delay_us, self.__notify, peripheral, value_handle, bytes(data))
+
+    def stream(self, peripheral, value_handle, messages, rate_hz, delay_us=0):
+        """
+        send notifications of a connected peripheral at a fixed rate
+
+        :param peripheral: Peripheral
+        :param value_handle: notifying handle
+        :param messages: iterable of notification bytes
+        :param rate_hz: notifications per second
+        :param delay_us: delay of the first notification from now
+        :returns: number of scheduled notifications
+        """
+        period = 1000000 / rate_hz
+        count = 0
+        for count, data in enumerate(messages, 1):
+            self.notify(peripheral, value_handle, data, delay_us + int((count - 1) * period))
+        return count
+
+    def schedule(self, delay_us, function, *args):
+        """
+        call a function on the virtual clock
+
+        :param delay_us: delay from now
+        :param function: function to call
+        :param args: arguments of the function
+        :returns: nothing
+        """
+        self.__schedule(delay_us, function, *args)
+
+    def pending(self):
+        """
+        number of scheduled events
+        """
+        return len(self.__queue)
+
+    def run(self, until_us=None, speed=None, max_events=None):
+        """
+        deliver scheduled events in order
+
+        :param until_us: stop at this virtual time, run until idle if None,
+                         scans without duration need a stop time
+        :param speed: pace delivery in real time scaled by speed, as fast as possible if None
+        :param max_events: stop after this many events
+        :returns: number of delivered events
+        """
+        count = 0
+        start_virtual = self.__now
+        start_real = time.perf_counter()
+        micropython.run_scheduled()
+        while self.__queue:
+            if max_events is not None and count >= max_events:
+                break
+            due = self.__queue[0][0]
+            if until_us is not None and due > until_us:
+                break
+            _, _, function, args = heapq.heappop(self.__queue)
+            if speed:
+                wait = (due - start_virtual) / 1000000 / speed - (time.perf_counter() - start_real)
+                if wait > 0:
+                    time.sleep(wait)
+            self.__now = due
+            function(*args)
+            micropython.run_scheduled()
+            count += 1
+        if until_us is not None and until_us > self.__now:
+            self.__now = until_us
+        return count
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __schedule(self, delay_us, function, *args):
+        self.__seq += 1
+        heapq.heappush(self.__queue, (self.__now + delay_us, self.__seq, function, args))
+
+    def __deliver(self, event, data):
+        if self.__handler and self.__active:
+            self.delivered += 1
+            self.irq_ticks_us = utime.ticks_us()
+            self.__handler(event, data)
+
+    def __find(self, addr):
+        for peripheral in self.__peripherals:
+            if peripheral.addr == bytes(addr):
+                return peripheral
+        return None
+
+    def __connection(self, conn_handle):
+        peripheral = self.__connections.get(conn_handle)
+        if not peripheral:
+            raise OSError(107)  # ENOTCONN
+        return peripheral
+
+    def __advertise(self, scan_id, peripheral):
+        if scan_id != self.__scan_id or not self.__scanning or peripheral not in self.__peripherals:
+            return
+        self.__schedule(peripheral.adv_interval_ms * 1000, self.__advertise, scan_id, peripheral)
+        if peripheral.conn_handle is not None:
+            return
+        self.__deliver(_IRQ_SCAN_RESULT, (peripheral.addr_type, memoryview(peripheral.addr), _ADV_IND,
+                                          peripheral.rssi, memoryview(peripheral.adv_data)))
+        if self.__scanning and self.__scan_active and peripheral.resp_data:
+            self.__deliver(_IRQ_SCAN_RESULT, (peripheral.addr_type, memoryview(peripheral.addr), _ADV_SCAN_RSP,
+                                              peripheral.rssi, memoryview(peripheral.resp_data)))
+
+    def __scan_timeout(self, scan_id):
+        if scan_id == self.__scan_id and self.__scanning:
+            self.__stop_scan()
+
+    def __stop_scan(self):
+        self.__scanning = False
+        self.__deliver(_IRQ_SCAN_COMPLETE, ())
+
+    def __connect_timeout(self, addr):
+        addr_type = self.__awaiting.pop(addr, None)
+        if addr_type is None:
+            return
+        # the stack reports a failed connect as disconnect without handle
+        self.__deliver(_IRQ_PERIPHERAL_DISCONNECT, (0xFFFF, addr_type, memoryview(addr)))
+
+    def __connected(self, peripheral):
+        if peripheral.conn_handle is not None or peripheral not in self.__peripherals:
+            return
+        conn_handle = self.__next_conn_handle
+        self.__next_conn_handle += 1
+        peripheral.conn_handle = conn_handle
+        self.__connections[conn_handle] = peripheral
+        peripheral.on_connect(self)
+        self.__deliver(_IRQ_PERIPHERAL_CONNECT, (conn_handle, peripheral.addr_type, memoryview(peripheral.addr)))
+
+    def __disconnected(self, peripheral):
+        conn_handle = peripheral.conn_handle
+        if conn_handle is None:
+            return
+        del self.__connections[conn_handle]
+        peripheral.conn_handle = None
+        peripheral.on_disconnect(self)
+        self.__deliver(_IRQ_PERIPHERAL_DISCONNECT, (conn_handle, peripheral.addr_type, memoryview(peripheral.addr)))
+
+    def __link_slot(self, peripheral, due):
+        # notifications go out with the connection events, packets_per_event per event
+        interval = self.conn_interval_us
+        event = -(-due // interval)
+        link = self.__links.get(peripheral)
+        if link and link[0] >= event:
+            if link[1] >= self.packets_per_event:
+                link[0] += 1
+                link[1] = 0
+            if link[0] > event:
+                self.deferred += 1
+        else:
+            link = [event, 0]
+            self.__links[peripheral] = link
+        link[1] += 1
+        return link[0] * interval
+
+    def __notify(self, peripheral, value_handle, data):
+        if peripheral.conn_handle is None:
+            return
+        self.__deliver(_IRQ_GATTC_NOTIFY, (peripheral.conn_handle, value_handle, memoryview(data)))
@@ -0,0 +1,59 @@
+import blesim
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Host stand-in for the MicroPython machine module,
+virtual timers run on the clock of the simulated radio
+"""
+
+
+class Timer:
+    """
+    Virtual machine.Timer, fires while the simulated radio runs
+    """
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self.__generation = 0
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, callback=None):
+        """
+        start the timer, a running timer is restarted
+
+        :param mode: ONE_SHOT or PERIODIC
+        :param period: period in ms
+        :param callback: callback function, contains the timer
+        :returns: nothing
+        """
+        self.deinit()
+        self.__schedule(self.__generation, mode, period, callback)
+
+    def deinit(self):
+        """
+        stop the timer
+
+        :returns: nothing
+        """
+        self.__generation += 1
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __schedule(self, generation, mode, period, callback):
+        blesim.clock().schedule(period * 1000, self.__fire, generation, mode, period, callback)
+
+    def __fire(self, generation, mode, period, callback):
+        if generation != self.__generation:
+            return
+        if mode == self.PERIODIC:
+            self.__schedule(generation, mode, period, callback)
+        if callback:
+            callback(self)
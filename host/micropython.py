@@ -0,0 +1,50 @@
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Host stand-in for the MicroPython micropython module,
+only the parts used by the library are provided
+"""
+
+
+def const(value):
+    """
+    identity of micropython.const on the host
+
+    :param value: constant value
+    :returns: the value
+    """
+    return value
+
+
+# scheduled functions, the hub runs them between bytecodes,
+# the simulated radio runs them after every delivered event
+_SCHEDULER_DEPTH = 4
+_scheduled = []
+
+
+def schedule(function, arg):
+    """
+    schedule a function to run soon
+
+    :param function: function to call
+    :param arg: argument of the function
+    :returns: nothing
+    """
+    if len(_scheduled) >= _SCHEDULER_DEPTH:
+        raise RuntimeError("schedule queue full")
+    _scheduled.append((function, arg))
+
+
+def run_scheduled():
+    """
+    run all scheduled functions
+
+    :returns: number of functions run
+    """
+    count = 0
+    while _scheduled:
+        function, arg = _scheduled.pop(0)
+        function(arg)
+        count += 1
+    return count
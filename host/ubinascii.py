@@ -0,0 +1,8 @@
+from binascii import hexlify, unhexlify, a2b_base64, b2a_base64, crc32
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Host stand-in for the MicroPython ubinascii module
+"""
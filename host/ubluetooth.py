@@ -0,0 +1,9 @@
+from blesim import UUID, BLE, FLAG_READ, FLAG_WRITE, FLAG_NOTIFY, FLAG_WRITE_NO_RESPONSE
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Host stand-in for the MicroPython ubluetooth module,
+BLE is the simulated radio of the blesim module
+"""
@@ -0,0 +1,54 @@
+import time
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Host stand-in for the MicroPython utime module,
+ticks wrap around like on the hub
+"""
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD >> 1
+
+# simulated radio whose virtual clock ticks_ms follows, None for the host clock
+_virtual = None
+
+
+def ticks_us():
+    return time.perf_counter_ns() // 1000 & _TICKS_MAX
+
+
+def ticks_ms():
+    if _virtual:
+        return _virtual.now_us // 1000 & _TICKS_MAX
+    return time.perf_counter_ns() // 1000000 & _TICKS_MAX
+
+
+def ticks_cpu():
+    return time.perf_counter_ns() & _TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+def time_ns():
+    return time.time_ns()
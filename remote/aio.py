@@ -0,0 +1,167 @@
+from remote.control import PoweredUPRemote
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+uasyncio front end for the Powered UP Remote.
+The ubluetooth irq only stores button codes in a
+preallocated ring, a coroutine drains them, so user
+code runs outside of the irq and can use event loop
+based functions like run_for_degrees.
+"""
+
+
+class _Flag:
+    """
+    Replacement of uasyncio.ThreadSafeFlag for event loops without it
+    """
+
+    def __init__(self):
+        self.__event = asyncio.Event()
+
+    def set(self):
+        self.__event.set()
+
+    async def wait(self):
+        await self.__event.wait()
+        self.__event.clear()
+
+
+_Flag = getattr(asyncio, "ThreadSafeFlag", _Flag)
+
+
+class AsyncPoweredUPRemote:
+    """
+    Class to handle LEGO(R) PowerUP(TM) Remote with uasyncio
+    """
+
+    def __init__(self, ble=None, size=16):
+        """
+        Create a instance of the async PowerUP Remote
+
+        :param ble: BLE object to use, default is ubluetooth.BLE()
+        :param size: number of button events buffered between irq and coroutine
+        """
+        # class specific
+        self.__remote = PoweredUPRemote(ble)
+        self.__ring = bytearray(size)
+        self.__head = 0
+        self.__tail = 0
+        self.__connected = False
+        self.__color_sent = 0
+        self.__color_done = 0
+        self.overruns = 0
+
+        # flags set from the irq
+        self.__event_flag = _Flag()
+        self.__connect_flag = _Flag()
+        self.__color_flag = _Flag()
+
+        self.__remote.on_button(self.__on_button)
+        self.__remote.on_connect(self.__on_connect)
+        self.__remote.on_disconnect(self.__on_disconnect)
+
+    @property
+    def debug(self):
+        return self.__remote.debug
+
+    @debug.setter
+    def debug(self, value):
+        self.__remote.debug = value
+
+    @property
+    def connected(self):
+        return self.__connected
+
+    async def connect(self, timeout=3000, address=None, connect_timeout=5000):
+        """
+        connect to a powered up remote
+
+        :param timeout: time of scanning for devices in ms, default is 3000
+        :param address: mac address of device, connect to a specific device if set
+        :param connect_timeout: time for connecting after the scan in ms
+        :returns: True if connected
+        """
+        self.__remote.connect(timeout, address)
+        try:
+            await asyncio.wait_for(self.__connect_flag.wait(), (timeout + connect_timeout) / 1000)
+        except asyncio.TimeoutError:
+            pass
+        return self.__connected
+
+    def disconnect(self):
+        """
+        disconnect from a powered up remote
+
+        :returns: nothing
+        """
+        self.__remote.disconnect()
+
+    async def set_color(self, color):
+        """
+        set color of a connected remote and wait until the remote has it
+        or the write is dropped
+
+        :param color: color byte, use PoweredUPColors class
+        :returns: nothing
+        """
+        self.__color_sent += 1
+        sent = self.__color_sent
+        self.__remote.set_color(color, callback=lambda status: self.__on_color(sent))
+        # a newer color replaces a queued one, waiting for it is enough
+        while self.__connected and self.__color_done < sent:
+            await self.__color_flag.wait()
+
+    def buttons(self):
+        """
+        async iterator of button codes, ends when the remote is disconnected
+
+        :returns: async iterator, use PoweredUPButtons class for the values
+        """
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self.__head == self.__tail:
+            if not self.__connected:
+                raise StopAsyncIteration
+            await self.__event_flag.wait()
+        button = self.__ring[self.__tail]
+        self.__tail = (self.__tail + 1) % len(self.__ring)
+        return button
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __on_button(self, button):
+        # runs in the irq, only the irq moves the head and only the coroutine the tail
+        head = (self.__head + 1) % len(self.__ring)
+        if head == self.__tail:
+            self.overruns += 1
+        else:
+            self.__ring[self.__head] = button
+            self.__head = head
+        self.__event_flag.set()
+
+    def __on_connect(self):
+        self.__connected = True
+        self.__connect_flag.set()
+
+    def __on_disconnect(self):
+        self.__connected = False
+        self.__event_flag.set()
+        self.__color_flag.set()
+
+    def __on_color(self, sent):
+        self.__color_done = max(self.__color_done, sent)
+        self.__color_flag.set()
@@ -0,0 +1,126 @@
+from utime import ticks_us, ticks_diff
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Helpers on top of the raw button stream of the
+Powered UP Remote (PoweredUPRemote.on_raw), events
+are (ticks_us, port, raw value) with the timestamp
+taken in the irq.
+"""
+
+
+class PoweredUPButtonReducer:
+    """
+    Turns raw button events into presses, releases and holds with durations in us
+    """
+
+    # raw values of the ports
+    RELEASED = 0x00
+    PLUS = 0x01
+    RED = 0x7F
+    MINUS = 0xFF
+
+    def __init__(self, hold_ms=500):
+        """
+        create instance of PoweredUPButtonReducer, use its event method as raw callback
+
+        :param hold_ms: time a button is pressed until it counts as hold
+        """
+        self.__hold_us = hold_ms * 1000
+
+        # state per port (left, right, center)
+        self.__values = bytearray(3)
+        self.__since = [0, 0, 0]
+        self.__held = bytearray(3)
+
+        # callbacks
+        self.__press_callback = None
+        self.__release_callback = None
+        self.__hold_callback = None
+
+    def event(self, ticks, port, value):
+        """
+        feed a raw event, repeated values of a port are ignored
+
+        :param ticks: ticks_us of the event
+        :param port: port, 0 left, 1 right, 2 center
+        :param value: raw value
+        :returns: nothing
+        """
+        previous = self.__values[port]
+        if value == previous:
+            return
+        if previous:
+            self.__check_hold(port, ticks)
+            if self.__release_callback:
+                self.__release_callback(port, previous, ticks_diff(ticks, self.__since[port]))
+        self.__values[port] = value
+        self.__since[port] = ticks
+        self.__held[port] = 0
+        if value and self.__press_callback:
+            self.__press_callback(port, value, ticks)
+
+    def poll(self, ticks=None):
+        """
+        report holds of buttons which are still pressed, call it regularly
+
+        :param ticks: ticks_us of now, default is the current time
+        :returns: nothing
+        """
+        if ticks is None:
+            ticks = ticks_us()
+        for port in range(3):
+            if self.__values[port]:
+                self.__check_hold(port, ticks)
+
+    def pressed(self, port):
+        """
+        current raw value of a port
+
+        :param port: port, 0 left, 1 right, 2 center
+        :returns: raw value, 0 if released
+        """
+        return self.__values[port]
+
+    def on_press(self, callback):
+        """
+        create a callback for pressed buttons
+
+        :param callback: callback function, contains port, raw value and ticks_us
+        :returns: nothing
+        """
+        self.__press_callback = callback
+
+    def on_release(self, callback):
+        """
+        create a callback for released buttons
+
+        :param callback: callback function, contains port, raw value and press duration in us
+        :returns: nothing
+        """
+        self.__release_callback = callback
+
+    def on_hold(self, callback):
+        """
+        create a callback for buttons pressed longer than hold_ms, once per press
+
+        :param callback: callback function, contains port, raw value and press duration in us
+        :returns: nothing
+        """
+        self.__hold_callback = callback
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __check_hold(self, port, ticks):
+        if self.__held[port]:
+            return
+        duration = ticks_diff(ticks, self.__since[port])
+        if duration >= self.__hold_us:
+            self.__held[port] = 1
+            if self.__hold_callback:
+                self.__hold_callback(port, self.__values[port], duration)
@@ -0,0 +1,15 @@
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Bluetooth company identifiers of manufacturer data,
+only loaded when a company name is decoded.
+"""
+
+COMPANY_IDENTIFIER_CODES = {
+    "0006": "Microsoft",
+    "004c": "Apple, Inc.",
+    "0075": "Samsung Electronics Co. Ltd.",
+    "00e0": "Google",
+    "0397": "LEGO System A/S",
+}
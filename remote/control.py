@@ -1,8 +1,8 @@
-from micropython import const
-import utime
+from micropython import const, schedule
 import ubluetooth
 import ubinascii
 import struct
+from utime import ticks_ms, ticks_us, ticks_diff, ticks_add
 
 """
 LEGO(R) SPIKE PRIME + POWERED UP
@@ -14,6 +14,10 @@ Powered UP devices from Lego. Currently only the
 Powered UP Remote is fully implemented.
 """
 
+# build features, tools/build.py turns them off per variant and strips the code behind them
+_DEBUG = const(1)
+_COMPANY_NAMES = const(1)
+
 
 class PoweredUPButtons:
     """
@@ -56,54 +60,175 @@ class PoweredUPColors:
     WHITE = const(0x0A)
 
 
+# button state of the remote packed into one byte,
+# bits 0-1 left port, bits 2-3 right port, bit 4 center button
+_BUTTON_VALUES = bytearray(b'\xff' * 256)
+_BUTTON_VALUES[0x00] = 0x00  # released
+_BUTTON_VALUES[0x01] = 0x01  # plus
+_BUTTON_VALUES[0x7F] = 0x02  # red
+_BUTTON_VALUES[0xFF] = 0x03  # minus
+
+# valid state bits per port (left, right, center)
+_BUTTON_PORT_MASKS = (0x03, 0x03, 0x01)
+
+# packed button state -> PoweredUPButtons code, unknown chords are RELEASED
+_BUTTON_TABLE = bytearray(32)
+for _state, _button in (
+        (0x01, PoweredUPButtons.LEFT_PLUS),
+        (0x02, PoweredUPButtons.LEFT_RED),
+        (0x03, PoweredUPButtons.LEFT_MINUS),
+        (0x04, PoweredUPButtons.RIGHT_PLUS),
+        (0x08, PoweredUPButtons.RIGHT_RED),
+        (0x0C, PoweredUPButtons.RIGHT_MINUS),
+        (0x05, PoweredUPButtons.LEFT_PLUS_RIGHT_PLUS),
+        (0x0F, PoweredUPButtons.LEFT_MINUS_RIGHT_MINUS),
+        (0x0D, PoweredUPButtons.LEFT_PLUS_RIGHT_MINUS),
+        (0x07, PoweredUPButtons.LEFT_MINUS_RIGHT_PLUS),
+        (0x10, PoweredUPButtons.CENTER)):
+    _BUTTON_TABLE[_state] = _button
+del _state, _button
+
+# messages of the remote, shared by all instances
+_POWERED_UP_REMOTE_ID = const(66)
+_LED_PORT = const(0x34)
+_NOTIFY_HANDLE = const(0x0C)
+_LEFT_PORT_SETUP = b'\x0a\x00\x41\x00\x00\x01\x00\x00\x00\x01'
+_RIGHT_PORT_SETUP = b'\x0a\x00\x41\x01\x00\x01\x00\x00\x00\x01'
+_NOTIFY_ENABLE = b'\x01\x00'
+_COLOR_HEADER = b'\x08\x00\x81\x34\x11\x51\x00'
+
+# hub properties pushed by the device, battery in %, rssi in dBm and button
+_PROPERTY_SLOTS = const(16)
+_PROPERTY_BUTTON = const(0x02)
+_PROPERTY_RSSI = const(0x05)
+_PROPERTY_BATTERY = const(0x06)
+_PROPERTY_UPDATE = const(0x06)
+_PROPERTY_UPDATES = (b'\x05\x00\x01\x06\x02', b'\x05\x00\x01\x05\x02', b'\x05\x00\x01\x02\x02')
+
+# stages of the latency instrumentation, defined before their first use so mpy-cross folds them
+_STAGE_IRQ = const(0)
+_STAGE_QUEUE = const(1)
+_STAGE_DECODE = const(2)
+_STAGE_CALLBACK = const(3)
+_STAGE_WRITE = const(4)
+_STAGE_NAMES = ("irq", "irq_to_callback", "decode", "callback", "write")
+
+# priorities of the scheduler, connect and disconnect before the buttons
+_PRIORITY_CONNECTION = const(0)
+_PRIORITY_BUTTON = const(1)
+_PRIORITY_NAMES = ("connection", "button")
+
+
 class PoweredUPRemote:
     """
     Class to handle LEGO(R) PowerUP(TM) Remote
     """
 
-    def __init__(self):
+    # left buttons
+    BUTTON_LEFT_PLUS = b'\x05\x00\x45\x00\x01'
+    BUTTON_LEFT_RED = b'\x05\x00\x45\x00\x7f'
+    BUTTON_LEFT_MINUS = b'\x05\x00\x45\x00\xff'
+    BUTTON_LEFT_RELEASED = b'\x05\x00\x45\x00\x00'
+
+    # right buttons
+    BUTTON_RIGHT_PLUS = b'\x05\x00\x45\x01\x01'
+    BUTTON_RIGHT_RED = b'\x05\x00\x45\x01\x7f'
+    BUTTON_RIGHT_MINUS = b'\x05\x00\x45\x01\xff'
+    BUTTON_RIGHT_RELEASED = b'\x05\x00\x45\x01\x00'
+
+    # center button
+    BUTTON_CENTER_GREEN = b'\x05\x00\x08\x02\x01'
+    BUTTON_CENTER_RELEASED = b'\x05\x00\x08\x02\x00'
+
+    def __init__(self, ble=None, buffer=0, cache=None, reconnect=False, backoff=250, max_backoff=8000,
+                 properties=False, scheduler=None):
         """
         Create a instance of PowerUP Remote
+
+        :param ble: BLE object to use, default is ubluetooth.BLE()
+        :param buffer: number of notifications buffered by the irq, the button callback
+                       then runs from micropython.schedule or process() instead of the irq
+        :param cache: file to persist known remotes in, kept in memory only if not set
+        :param reconnect: reconnect automatically when the connection is lost
+        :param backoff: delay in ms before the second reconnect attempt, doubled for every further one
+        :param max_backoff: upper bound of the delay between reconnect attempts in ms
+        :param properties: let the remote push battery, rssi and button updates, read them with
+                           battery(), rssi() and hub_property()
+        :param scheduler: PoweredUPScheduler which runs the callbacks and bound actions outside the irq,
+                          can be shared by several remotes
         """
         # constants
         self.debug = False
-        self.__POWERED_UP_REMOTE_ID = 66
         self.__color = PoweredUPColors.BLUE
         self.__address = None
 
-        # left buttons
-        self.BUTTON_LEFT_PLUS = self.__create_message([0x05, 0x00, 0x45, 0x00, 0x01])
-        self.BUTTON_LEFT_RED = self.__create_message([0x05, 0x00, 0x45, 0x00, 0x7F])
-        self.BUTTON_LEFT_MINUS = self.__create_message([0x05, 0x00, 0x45, 0x00, 0xFF])
-        self.BUTTON_LEFT_RELEASED = self.__create_message([0x05, 0x00, 0x45, 0x00, 0x00])
-
-        # right buttons
-        self.BUTTON_RIGHT_PLUS = self.__create_message([0x05, 0x00, 0x45, 0x01, 0x01])
-        self.BUTTON_RIGHT_RED = self.__create_message([0x05, 0x00, 0x45, 0x01, 0x7F])
-        self.BUTTON_RIGHT_MINUS = self.__create_message([0x05, 0x00, 0x45, 0x01, 0xFF])
-        self.BUTTON_RIGHT_RELEASED = self.__create_message([0x05, 0x00, 0x45, 0x01, 0x00])
-
-        # center button
-        self.BUTTON_CENTER_GREEN = self.__create_message([0x05, 0x00, 0x08, 0x02, 0x01])
-        self.BUTTON_CENTER_RELEASED = self.__create_message([0x05, 0x00, 0x08, 0x02, 0x00])
-
-        # constants of buttons for class
-        self._LEFT_BUTTON = 0
-        self._RIGHT_BUTTON = 1
-        self._CENTER_BUTTON = 2
-
         # class specific
-        self.__handler = _PoweredUPHandler()
-        self.__buttons = [self.BUTTON_LEFT_RELEASED, self.BUTTON_RIGHT_RELEASED, self.BUTTON_CENTER_RELEASED]
+        self.__handler = _PoweredUPHandler(ble, buffer=buffer)
+        self.__cache = _device_cache(cache)
+        self.__last = None
+        self.__timeout = 3000
+        self.__buttons = 0x00
+        self.__properties = _HubProperties() if properties else None
+
+        # deferred callbacks, the bound methods are created once so queuing does not allocate
+        self.__scheduler = scheduler
+        self.__dispatch_callback = self.__dispatch
+        self.__property_callback = None
+
+        # bound actions and their arguments per packed button state, None without bindings
+        self.__actions = None
+        self.__arguments = None
+
+        # input smoothing, __pending is the button state waiting for its settle or rate window, -1 none,
+        # __first is the tick of the first change since the last delivered state while __unsettled
+        self.__smoothing = False
+        self.__dedupe = False
+        self.__settle = 0
+        self.__interval = 0
+        self.__smooth_timer = None
+        self.__flush_callback = self.__flush
+        self.__sent = -1
+        self.__pending = -1
+        self.__unsettled = False
+        self.__first = 0
+        self.__due = 0
+        self.__next = 0
+        self.__received = 0
+        self.__delivered = 0
+        self.__duplicates = 0
+        self.__merged = 0
+        self.__delay_ms = 0
+        self.__max_delay_ms = 0
+
+        # reconnect supervisor, __down is the tick of the lost connection while recovering
+        self.__reconnect = reconnect
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__delay = backoff
+        self.__timer = None
+        self.__stopped = False
+        self.__down = None
+        self.__lost = 0
+        self.__attempts = 0
+        self.__recovered = 0
+        self.__last_ms = 0
+        self.__max_ms = 0
+        self.__total_ms = 0
 
         # callbacks
         self.__button_callback = None
+        self.__raw_callback = None
         self.__connect_callback = None
         self.__disconnect_callback = None
 
+        # notification handler, the lean decoder unless a feature needs the full one
+        self.__notify = None
+        self.__select_notify()
+
     def connect(self, timeout=3000, address=None):
         """
-        connect to a powered up remote
+        connect to a powered up remote, a known remote (the address
+        is cached) is connected directly without scan and discovery
 
         :param timeout: time of scanning for devices in ms, default is 3000
         :param address: mac address of device, connect to a specific device if set
@@ -111,27 +236,134 @@ class PoweredUPRemote:
         """
         if address:
             self.__address = ubinascii.unhexlify(address.replace(':', ''))
+        self.__timeout = timeout
+        self.__stopped = False
         self.__handler.debug = self.debug
         self.__handler.on_connect(callback=self.__on_connect)
         self.__handler.on_disconnect(callback=self.__on_disconnect)
-        self.__handler.on_notify(callback=self.__on_notify)
-        self.__handler.scan_start(timeout, callback=self.__on_scan)
+        self.__handler.on_notify(callback=self.__notify)
+
+        addr = self.__address if self.__address else self.__last
+        known = self.__cache.get(addr) if addr else None
+        if known:
+            addr_type, value_handle = known
+            self.__handler.connect(addr_type, addr, value_handle, failed=self.__on_connect_failed)
+        else:
+            self.__handler.scan_start(timeout, callback=self.__on_scan)
 
     def disconnect(self):
         """
-        disconnect from a powered up remote
+        disconnect from a powered up remote, also stops reconnecting
         :returns: nothing
         """
+        self.__stopped = True
+        self.__down = None
+        if self.__timer:
+            self.__timer.deinit()
+        self.__cancel()
         self.__handler.disconnect()
 
-    def set_color(self, color):
+    def set_color(self, color, callback=None):
         """
         set color of a connected remote, use PoweredUPColors class
 
         :param color: color byte
+        :param callback: callback function, contains the write status
+        :returns: nothing
+        """
+        self.__color = color
+        self.__set_remote_color(color, callback)
+
+    def process(self):
+        """
+        handle buffered notifications, only needed with buffer when polling
+
+        :returns: number of handled notifications
+        """
+        return self.__handler.drain()
+
+    def buffer_stats(self):
+        """
+        statistics of the notification buffer
+
+        :returns: dict with depth, high water mark, overruns and truncated events or None without buffer
+        """
+        return self.__handler.buffer_stats()
+
+    def write_stats(self):
+        """
+        statistics of the outbound write queue
+
+        :returns: dict with queue depth, coalesced, dropped and retried writes
+        """
+        return self.__handler.write_stats()
+
+    def reconnect_stats(self):
+        """
+        statistics of the reconnect supervisor, times are from the lost
+        connection until the remote is usable again
+
+        :returns: dict with lost connections, reconnect attempts, recoveries and
+                  last, max and total time to recover in ms
+        """
+        return {"lost": self.__lost, "attempts": self.__attempts, "recovered": self.__recovered,
+                "recovering": self.__down is not None, "last_ms": self.__last_ms,
+                "max_ms": self.__max_ms, "total_ms": self.__total_ms}
+
+    def smooth_stats(self):
+        """
+        statistics of the input smoothing, delays are from the first change after
+        the last delivered button state until the actions and callback of the next run
+
+        :returns: dict with received, delivered, duplicate and merged button states,
+                  the waiting state, last and max added delay and its bound in ms
+        """
+        # a waiting state is delivered by a timer in whole ms, counted from a truncated tick
+        bound = self.__settle + self.__interval
+        if bound:
+            bound += 1
+        return {"received": self.__received, "delivered": self.__delivered, "duplicates": self.__duplicates,
+                "merged": self.__merged, "pending": self.__pending >= 0, "last_ms": self.__delay_ms,
+                "max_ms": self.__max_delay_ms, "bound_ms": bound}
+
+    def battery(self):
+        """
+        battery level pushed by the remote, needs properties=True
+
+        :returns: battery level in % or None if not reported yet
+        """
+        return self.__properties.value(_PROPERTY_BATTERY) if self.__properties else None
+
+    def rssi(self):
+        """
+        signal strength pushed by the remote, needs properties=True
+
+        :returns: rssi in dBm or None if not reported yet
+        """
+        return self.__properties.value(_PROPERTY_RSSI) if self.__properties else None
+
+    def hub_property(self, prop):
+        """
+        latest value of a hub property pushed by the remote, needs properties=True
+
+        :param prop: property id, use lwp3.HubProperty class (BUTTON, RSSI, BATTERY_VOLTAGE)
+        :returns: (value, age in ms) or None if not reported yet
+        """
+        return self.__properties.get(prop) if self.__properties else None
+
+    def on_property(self, callback):
+        """
+        create a callback for hub property updates, needs properties=True
+
+        :param callback: callback function, contains property id and value
         :returns: nothing
         """
-        self.__set_remote_color(color)
+        if not self.__properties:
+            return
+        if self.__scheduler and callback:
+            self.__property_callback = callback
+            callback = self.__defer_property
+        self.__properties.callback = callback
 
     def on_button(self, callback):
         """
@@ -142,6 +374,92 @@ class PoweredUPRemote:
         """
         self.__button_callback = callback
 
+    def bind(self, bindings, default=None):
+        """
+        bind buttons to actions, the bindings are compiled into a table indexed by the
+        button state, so a notification calls its action with a single lookup. replaces
+        the previous bindings, the button callback is still called after the action
+
+        :param bindings: dict of button -> action, a button is a PoweredUPButtons code or a
+                         raw chord (left, right, center) of raw values like (0x01, 0x00, 0x01),
+                         an action is a function or a tuple of a function and its arguments
+        :param default: action of button states without binding, None to ignore them
+        :returns: nothing
+        """
+        codes = {}
+        chords = {}
+        for button, action in bindings.items():
+            if isinstance(button, tuple):
+                left, right, center = (_BUTTON_VALUES[value] for value in button)
+                if left > 0x03 or right > 0x03 or center > 0x01:
+                    raise ValueError("invalid raw chord %s" % (button,))
+                chords[left | right << 2 | center << 4] = action
+            else:
+                codes[button] = action
+
+        # unknown chords have the code RELEASED, raw chords replace the action of their code
+        actions = [None] * len(_BUTTON_TABLE)
+        arguments = [()] * len(_BUTTON_TABLE)
+        for state in range(len(_BUTTON_TABLE)):
+            action = chords.get(state, codes.get(_BUTTON_TABLE[state], default))
+            if isinstance(action, tuple):
+                actions[state] = action[0]
+                arguments[state] = action[1:]
+            else:
+                actions[state] = action
+        self.__actions = actions
+        self.__arguments = arguments
+        self.__select_notify()
+
+    def unbind(self):
+        """
+        remove all bindings
+
+        :returns: nothing
+        """
+        self.__actions = None
+        self.__arguments = None
+        self.__select_notify()
+
+    def smooth(self, dedupe=True, settle=0, rate=0):
+        """
+        smooth the buttons before the bound actions and the button callback run. identical
+        consecutive button states are dropped, a changed state waits for the settle window
+        and is replaced by a state arriving within it, so a chord pressed a few ms apart does
+        not start with the single button. at most rate states per second are delivered, the
+        latest state wins. releasing all buttons skips the settle window. the added delay is
+        at most settle + 1000 / rate ms plus 1 ms of timer and ticks granularity, see
+        smooth_stats(). all zero turns smoothing off
+
+        :param dedupe: drop identical consecutive button states
+        :param settle: settle window of a changed button state in ms
+        :param rate: max button states per second, 0 unlimited
+        :returns: nothing
+        """
+        self.__cancel()
+        self.__dedupe = dedupe
+        self.__settle = settle
+        self.__interval = (1000 + rate - 1) // rate if rate else 0
+        self.__smoothing = bool(dedupe or settle or rate)
+        self.__sent = -1
+        self.__unsettled = False
+        self.__select_notify()
+        if (settle or rate) and not self.__smooth_timer:
+            from machine import Timer
+            self.__smooth_timer = Timer(-1)
+
+    def on_raw(self, callback):
+        """
+        create a callback for every button notification with its raw value,
+        the timestamp is taken in the irq, also when the notifications are buffered
+
+        :param callback: callback function, contains ticks_us, port (0 left, 1 right,
+                         2 center) and raw value (0x00, 0x01, 0x7F, 0xFF)
+        :returns: nothing
+        """
+        self.__raw_callback = callback
+        self.__select_notify()
+
     def on_connect(self, callback):
         """
         create a callback for on connect actions
@@ -165,393 +483,1880 @@ class PoweredUPRemote:
     -----------------
     """
 
-    def __create_message(self, byte_array):
-        message = struct.pack('%sb' % len(byte_array), *byte_array)
-        return message
+    def __color_message(self, color_byte):
+        return _COLOR_HEADER + bytes((color_byte,))
 
-    def __set_remote_color(self, color_byte):
-        color = self.__create_message([0x08, 0x00, 0x81, 0x34, 0x11, 0x51, 0x00, color_byte])
-        self.__handler.write(color)
+    def __set_remote_color(self, color_byte, callback=None):
+        # only the latest color matters, queued color writes are replaced
+        self.__handler.write(self.__color_message(color_byte), key=_LED_PORT, callback=callback)
 
     def __on_scan(self, addr_type, addr, man_data):
-        if not self.__address:
-            if addr and man_data[2][1] == self.__POWERED_UP_REMOTE_ID:
-                self.__handler.connect(addr_type, addr)
-        else:
-            if self.__address == addr and man_data[2][1] == self.__POWERED_UP_REMOTE_ID:
-                self.__handler.connect(addr_type, addr)
+        # a lost remote is only replaced by itself
+        address = self.__address if self.__address or self.__down is None else self.__last
+        if not addr:
+            self.__retry()
+        elif not man_data or len(man_data[2]) < 2 or man_data[2][1] != _POWERED_UP_REMOTE_ID:
+            # other devices with the LEGO service may send no or short manufacturer data
+            return
+        elif not address or address == addr:
+            self.__handler.connect(addr_type, addr, failed=self.__on_failed)
 
     def __on_connect(self):
-        left_port = self.__create_message([0x0A, 0x00, 0x41, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x01])
-        right_port = self.__create_message([0x0A, 0x00, 0x41, 0x01, 0x00, 0x01, 0x00, 0x00, 0x00, 0x01])
-        notifier = self.__create_message([0x01, 0x00])
-
+        # the write queue sends every write when the remote acknowledged
+        # the previous one, the handshake is done with the last write
         self.__set_remote_color(self.__color)
-        utime.sleep(0.1)
-        self.__handler.write(left_port)
-        utime.sleep(0.1)
-        self.__handler.write(right_port)
-        utime.sleep(0.1)
-        self.__handler.write(notifier, 0x0C)
+        self.__handler.write(_LEFT_PORT_SETUP)
+        self.__handler.write(_RIGHT_PORT_SETUP)
+        self.__handler.write(_NOTIFY_ENABLE, _NOTIFY_HANDLE, callback=self.__on_handshake)
+        if self.__properties:
+            # the remote pushes a property when it changes, no polling
+            for message in _PROPERTY_UPDATES:
+                self.__handler.write(message)
+
+    def __on_handshake(self, status):
+        addr_type, addr, value_handle = self.__handler.device()
+        if status != 0:
+            # notifications are not enabled, the remote is not usable, the
+            # disconnect retries through the reconnect path with backoff
+            self.__cache.remove(addr)
+            self.__handler.disconnect()
+            return
+        self.__last = addr
+        self.__cache.put(addr, addr_type, value_handle)
+        if self.__down is not None:
+            elapsed = ticks_diff(ticks_ms(), self.__down)
+            self.__down = None
+            self.__recovered += 1
+            self.__last_ms = elapsed
+            self.__max_ms = max(self.__max_ms, elapsed)
+            self.__total_ms += elapsed
         if self.__connect_callback:
-            self.__connect_callback()
+            if self.__scheduler:
+                self.__scheduler.put(self, _PRIORITY_CONNECTION, self.__connect_callback)
+            else:
+                self.__connect_callback()
+
+    def __on_connect_failed(self, addr):
+        # the cached remote is not reachable, fall back to scanning
+        self.__cache.remove(addr)
+        self.connect(self.__timeout)
+
+    def __on_failed(self, addr):
+        self.__retry()
 
     def __on_disconnect(self):
-        if self.__disconnect_callback:
+        self.__cancel()
+        if self.__scheduler:
+            # buttons pressed before the connection was lost must not run after the disconnect
+            self.__scheduler.cancel(self)
+            if self.__disconnect_callback:
+                self.__scheduler.put(self, _PRIORITY_CONNECTION, self.__disconnect_callback)
+        elif self.__disconnect_callback:
             self.__disconnect_callback()
+        if not self.__reconnect or self.__stopped:
+            return
+        if self.__down is None:
+            # first attempt right away, the cached remote needs no scan
+            self.__lost += 1
+            self.__down = ticks_ms()
+            self.__delay = self.__backoff
+            self.__attempt()
+        else:
+            self.__retry()
+
+    def __attempt(self, _=None):
+        if self.__stopped or self.__down is None:
+            return
+        self.__attempts += 1
+        self.connect(self.__timeout)
+
+    def __retry(self):
+        # next attempt after the backoff, the delay doubles up to max_backoff
+        if not self.__reconnect or self.__stopped or self.__down is None:
+            return
+        from machine import Timer
+        if not self.__timer:
+            self.__timer = Timer(-1)
+        self.__timer.init(mode=Timer.ONE_SHOT, period=self.__delay, callback=self.__attempt)
+        self.__delay = min(self.__delay << 1, self.__max_backoff)
+
+    def __select_notify(self):
+        # the checks of the features are made once here instead of for every notification
+        if self.__properties or self.__raw_callback or self.__smoothing or self.__scheduler:
+            self.__notify = self.__on_notify
+        else:
+            self.__notify = self.__on_actions if self.__actions else self.__on_buttons
+        self.__handler.on_notify(callback=self.__notify)
+
+    def __decode(self, data):
+        # button messages are [0x05, 0x00, type, port, value], left and right
+        # port report port values (0x45), the center button reports as 0x08,
+        # returns the port of a button message or -1
+        if len(data) == 5 and data[0] == 0x05 and data[1] == 0x00:
+            port = data[3]
+            if (data[2] == 0x45 and port < 2) or (data[2] == 0x08 and port == 2):
+                mask = _BUTTON_PORT_MASKS[port]
+                value = _BUTTON_VALUES[data[4]]
+                if value <= mask:
+                    shift = port << 1
+                    self.__buttons = (self.__buttons & ~(mask << shift)) | (value << shift)
+                return port
+        return -1
+
+    def __on_buttons(self, data):
+        # lean decoder of the buttons for the button callback only
+        if _profiler:
+            self.__on_notify(data)
+            return
+        self.__decode(data)
+        if self.__button_callback:
+            self.__button_callback(_BUTTON_TABLE[self.__buttons])
+
+    def __on_actions(self, data):
+        # lean dispatch of the bound actions, then the button callback
+        if _profiler:
+            self.__on_notify(data)
+            return
+        self.__decode(data)
+        buttons = self.__buttons
+        action = self.__actions[buttons]
+        if action:
+            action(*self.__arguments[buttons])
+        if self.__button_callback:
+            self.__button_callback(_BUTTON_TABLE[buttons])
 
     def __on_notify(self, data):
-        if data == self.BUTTON_LEFT_PLUS:
-            self.__buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_PLUS
-        if data == self.BUTTON_LEFT_RED:
-            self.__buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_RED
-        if data == self.BUTTON_LEFT_MINUS:
-            self.__buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_MINUS
-        if data == self.BUTTON_LEFT_RELEASED:
-            self.__buttons[self._LEFT_BUTTON] = self.BUTTON_LEFT_RELEASED
-        if data == self.BUTTON_RIGHT_PLUS:
-            self.__buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_PLUS
-        if data == self.BUTTON_RIGHT_RED:
-            self.__buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_RED
-        if data == self.BUTTON_RIGHT_MINUS:
-            self.__buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_MINUS
-        if data == self.BUTTON_RIGHT_RELEASED:
-            self.__buttons[self._RIGHT_BUTTON] = self.BUTTON_RIGHT_RELEASED
-        if data == self.BUTTON_CENTER_GREEN:
-            self.__buttons[self._CENTER_BUTTON] = self.BUTTON_CENTER_GREEN
-        if data == self.BUTTON_CENTER_RELEASED:
-            self.__buttons[self._CENTER_BUTTON] = self.BUTTON_CENTER_RELEASED
+        profiler = _profiler
+        if profiler:
+            start = ticks_us()
+            profiler.add(_STAGE_QUEUE, ticks_diff(start, self.__handler.ticks))
+
+        if self.__properties and len(data) == 6 and data[2] == 0x01:
+            self.__properties.update(data, 3)
+            return
 
+        port = self.__decode(data)
+        if port >= 0 and self.__raw_callback:
+            if self.__scheduler:
+                self.__scheduler.put(self, _PRIORITY_BUTTON, self.__raw_callback, 3,
+                                     self.__handler.ticks, port, data[4])
+            else:
+                self.__raw_callback(self.__handler.ticks, port, data[4])
+
+        if not profiler:
+            self.__on_button(self.__buttons)
+            return
+        decoded = ticks_us()
+        profiler.add(_STAGE_DECODE, ticks_diff(decoded, start))
         self.__on_button(self.__buttons)
+        profiler.add(_STAGE_CALLBACK, ticks_diff(ticks_us(), decoded))
 
     def __on_button(self, buttons):
-        if buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_RELEASED and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 0
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_PLUS and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 1
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_RED and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 2
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_MINUS and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 3
-        elif buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_PLUS and buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 4
-        elif buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_RED and buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 5
-        elif buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_MINUS and buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_RELEASED and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 6
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_PLUS and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_PLUS and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 7
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_MINUS and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_MINUS and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 8
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_PLUS and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_MINUS and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 9
-        elif buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_MINUS and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_PLUS and buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_RELEASED:
-            button = 10
-        elif buttons[self._CENTER_BUTTON] == self.BUTTON_CENTER_GREEN and buttons[self._LEFT_BUTTON] == self.BUTTON_LEFT_RELEASED and buttons[self._RIGHT_BUTTON] == self.BUTTON_RIGHT_RELEASED:
-            button = 11
+        if self.__smoothing:
+            self.__smooth(buttons)
+        else:
+            self.__deliver(buttons)
+
+    def __smooth(self, state):
+        now = ticks_ms()
+        self.__received += 1
+        pending = self.__pending
+        if state == pending:
+            self.__merged += 1
+            return
+        if pending < 0:
+            if state == self.__sent and self.__dedupe:
+                self.__duplicates += 1
+                return
+            # the settle window starts with the first change, later changes and a bounce
+            # back to the delivered state do not restart it until it has passed
+            if not self.__unsettled or ticks_diff(now, self.__first) >= self.__settle:
+                self.__unsettled = True
+                self.__first = now
+            due = ticks_add(self.__first, self.__settle) if state else now
+        else:
+            self.__merged += 1
+            if state == self.__sent and self.__dedupe:
+                # bounced back to the delivered state
+                self.__cancel()
+                return
+            due = self.__due if state else now
+        if self.__interval and ticks_diff(self.__next, due) > 0:
+            due = self.__next
+        wait = ticks_diff(due, now)
+        if wait <= 0:
+            if pending >= 0:
+                self.__cancel()
+            self.__send(state, now)
+            return
+        self.__pending = state
+        if pending < 0 or due != self.__due:
+            self.__due = due
+            self.__smooth_timer.init(mode=self.__smooth_timer.ONE_SHOT, period=wait, callback=self.__flush_callback)
+
+    def __flush(self, _=None):
+        state = self.__pending
+        if state < 0:
+            return
+        self.__pending = -1
+        self.__send(state, ticks_ms())
+
+    def __cancel(self):
+        self.__pending = -1
+        if self.__smooth_timer:
+            self.__smooth_timer.deinit()
+
+    def __send(self, state, now):
+        delay = ticks_diff(now, self.__first)
+        self.__unsettled = False
+        self.__sent = state
+        self.__delivered += 1
+        self.__delay_ms = delay
+        self.__max_delay_ms = max(self.__max_delay_ms, delay)
+        if self.__interval:
+            self.__next = ticks_add(now, self.__interval)
+        self.__deliver(state)
+
+    def __deliver(self, buttons):
+        if self.__scheduler:
+            if self.__actions or self.__button_callback:
+                self.__scheduler.put(self, _PRIORITY_BUTTON, self.__dispatch_callback, 1, buttons)
         else:
-            button = 0
+            self.__dispatch(buttons)
+
+    def __defer_property(self, prop, value):
+        self.__scheduler.put(self, _PRIORITY_BUTTON, self.__property_callback, 2, prop, value)
+
+    def __dispatch(self, buttons):
+        actions = self.__actions
+        if actions:
+            action = actions[buttons]
+            if action:
+                action(*self.__arguments[buttons])
+
+        button = _BUTTON_TABLE[buttons]
 
         # callback the button data
         if self.__button_callback:
             self.__button_callback(button)
 
 
-# Internal used helper classes
-# this are not for usage outside of this environment
-
-
-class _PoweredUPHandler:
+class PoweredUPDiscovery:
     """
-    Class to deal with LEGO(R) PowerUp(TM) over BLE
+    Class to discover LEGO(R) PowerUP(TM) devices nearby
     """
 
-    def __init__(self):
-        """
-        Create instance of _PoweredUPHandler
+    def __init__(self, ble=None):
         """
-        # constants
-        self.__IRQ_SCAN_RESULT = const(1 << 4)
-        self.__IRQ_SCAN_COMPLETE = const(1 << 5)
-        self.__IRQ_PERIPHERAL_CONNECT = const(1 << 6)
-        self.__IRQ_PERIPHERAL_DISCONNECT = const(1 << 7)
-        self.__IRQ_GATTC_SERVICE_RESULT = const(1 << 8)
-        self.__IRQ_GATTC_CHARACTERISTIC_RESULT = const(1 << 9)
-        self.__IRQ_GATTC_READ_RESULT = const(1 << 11)
-        self.__IRQ_GATTC_NOTIFY = const(1 << 13)
-
-        self.__LEGO_SERVICE_UUID = ubluetooth.UUID("00001623-1212-EFDE-1623-785FEABCD123")
-        self.__LEGO_SERVICE_CHAR = ubluetooth.UUID("00001624-1212-EFDE-1623-785FEABCD123")
+        Create a instance of the discovery, it shares the radio with the remotes
 
-        # class specific
-        self.__ble = ubluetooth.BLE()
-        self.__ble.active(True)
-        self.__ble.irq(handler=self.__irq)
-        self.__decoder = _Decoder()
-        self.__reset()
-        self.debug = False
+        :param ble: BLE object to use, default is ubluetooth.BLE()
+        """
+        self.__manager = _manager(ble)
+        self.scanning = False
 
         # callbacks
-        self.__scan_callback = None
-        self.__read_callback = None
-        self.__notify_callback = None
-        self.__connected_callback = None
-        self.__disconnected_callback = None
+        self.__device_callback = None
+        self.__complete_callback = None
 
-    def __reset(self):
+    def start(self, timeout=3000, callback=None):
         """
-        reset all necessary variables
-        """
-        # cached data
-        self.__addr = None
-        self.__addr_type = None
-        self.__adv_type = None
-        self.__services = None
-        self.__man_data = None
-        self.__name = None
-        self.__conn_handle = None
-        self.__value_handle = None
+        scan for the full timeout and collect all LEGO devices, joins a scan that is already running.
+        remotes connect to a device seen within the last 10 s without a new scan
 
-        # reserved callbacks
-        self.__scan_callback = None
-        self.__read_callback = None
-        self.__notify_callback = None
-        self.__connected_callback = None
-        self.__disconnected_callback = None
+        :param timeout: time of scanning for devices in ms, default is 3000
+        :param callback: callback function when the scan ended, contains the devices like devices()
+        :returns: nothing
+        """
+        self.scanning = True
+        self.__complete_callback = callback
+        self.__manager.scan(self, timeout, active=True)
 
-    def __log(self, *args):
+    def stop(self):
         """
-        log function if debug flag is set
+        stop scanning, the scan goes on while remotes wait for a device
 
-        :param args: arguments to log
         :returns: nothing
         """
-        if not self.debug:
-            return
-        print(args)
+        self.scanning = False
+        self.__manager.scan_cancel(self)
 
-    def scan_start(self, timeout, callback):
+    def devices(self, system_type=None, max_age=None):
         """
-        start scanning for devices
+        discovered devices, strongest signal (nearest) first
 
-        :param timeout: timeout in ms
-        :param callback: callback function, contains scan data
-        :returns: nothing
+        :param system_type: only devices of this system type, 66 is the remote
+        :param max_age: only devices seen within this time in ms
+        :returns: list of (address, name or None, system type, rssi, age in ms)
         """
-        self.__log("start scanning...")
-        self.__scan_callback = callback
-        self.__ble.gap_scan(timeout, 30000, 30000)
-
-    def scan_stop(self):
+        devices = []
+        for addr, addr_type, adv_type, rssi, age, result, name in self.__manager.devices(max_age):
+            kind = self.__system_type(result)
+            if system_type is None or kind == system_type:
+                devices.append((self.__address(addr), name, kind, rssi, age))
+        return devices
+
+    def nearest(self, system_type=_POWERED_UP_REMOTE_ID, max_age=None):
         """
-        stop scanning for devices
+        address of the device with the strongest signal
 
-        :returns: nothing
+        :param system_type: only devices of this system type, default is the remote
+        :param max_age: only devices seen within this time in ms
+        :returns: mac address for PoweredUPRemote.connect() or None
         """
-        self.__ble.gap_scan(None)
+        devices = self.devices(system_type, max_age)
+        return devices[0][0] if devices else None
 
-    def write(self, data, adv_value=None):
+    def on_device(self, callback):
         """
-        write data to gatt client
+        create a callback for every advertisement of a LEGO device
 
-        :param data: data to write
-        :param adv_value: advanced value to write
+        :param callback: callback function, contains address, name, system type and rssi
         :returns: nothing
         """
-        if not self.__is_connected():
-            return
-        if adv_value:
-            self.__ble.gattc_write(self.__conn_handle, adv_value, data)
-        else:
-            self.__ble.gattc_write(self.__conn_handle, self.__value_handle, data)
+        self.__device_callback = callback
 
-    def read(self, callback):
+    def offer(self, addr_type, addr, adv_type, result):
         """
-        read data from gatt client
+        called by the scan for every advertisement of a LEGO device
 
-        :param callback: callback function, contains readed data
         :returns: nothing
         """
-        if not self.__is_connected():
-            return
-        self.__read_callback = callback
-        self.__ble.gattc_read(self.__conn_handle, self.__value_handle)
+        if self.__device_callback:
+            device = self.__manager.device(addr)
+            self.__device_callback(self.__address(addr), device[5], self.__system_type(result), device[2])
 
-    def connect(self, addr_type, addr):
+    def scan_complete(self):
         """
-        connect to a ble device
+        called when the scan ended
 
-        :param addr_type: the address type of the device
-        :param addr: the devices mac a binary
         :returns: nothing
         """
-        self.__ble.gap_connect(addr_type, addr)
+        self.scanning = False
+        if self.__complete_callback:
+            self.__complete_callback(self.devices())
 
-    def disconnect(self):
-        """
-        disconnect from a ble device
+    """
+    private functions
+    -----------------
+    """
 
-        :returns: nothing
+    def __address(self, addr):
+        return ':'.join('%02X' % b for b in addr)
+
+    def __system_type(self, result):
+        man_data = result[2]
+        return man_data[2][1] if man_data and len(man_data[2]) > 1 else None
+
+
+class PoweredUPScheduler:
+    """
+    Cooperative scheduler of the user callbacks, the irq only queues a callback with
+    its arguments into preallocated slots and the callbacks run outside the irq in
+    time slices, connect and disconnect before buttons
+    """
+
+    def __init__(self, slots=16, slice_ms=10, budget_ms=5, auto=True, window=1000):
         """
-        if not self.__is_connected():
-            return
-        self.__ble.gap_disconnect(self.__conn_handle)
+        create instance of PoweredUPScheduler, pass it to the remotes with scheduler=
+
+        :param slots: queued callbacks per priority, one slot stays free
+        :param slice_ms: time of callbacks per run, the remaining callbacks wait for the next run
+                         so the BLE events in between are handled
+        :param budget_ms: time a single callback may take, longer callbacks count as overruns
+        :param auto: run from micropython.schedule, else call run() from the main loop
+        :param window: number of samples after which older latency samples count half
+        """
+        self.__queues = (_CallbackQueue(slots), _CallbackQueue(slots))
+        self.__slice = slice_ms
+        self.__budget = budget_ms * 1000
+        self.__auto = auto
+        self.__scheduled = False
+        self.__run_callback = self.run
+
+        # instrumentation, queue latency per priority and callback durations
+        self.__waits = (_Histogram(window), _Histogram(window))
+        self.__durations = _Histogram(window)
+        self.overruns = 0
+        self.slices = 0
+
+    def put(self, owner, priority, function, count=0, first=None, second=None, third=None):
+        """
+        queue a callback, does not allocate so it can be used in the irq
+
+        :param owner: remote of the callback, its button callbacks are cancelled on disconnect
+        :param priority: _PRIORITY_CONNECTION or _PRIORITY_BUTTON
+        :param function: callback function
+        :param count: number of arguments, up to three
+        :param first: first argument
+        :param second: second argument
+        :param third: third argument
+        :returns: True if the callback was queued
+        """
+        if not self.__queues[priority].put(owner, function, count, first, second, third, ticks_us()):
+            return False
+        if self.__auto and not self.__scheduled:
+            try:
+                schedule(self.__run_callback, None)
+                self.__scheduled = True
+            except RuntimeError:
+                pass
+        return True
+
+    def cancel(self, owner, priority=_PRIORITY_BUTTON):
+        """
+        drop the queued callbacks of a remote, a disconnected remote must not
+        start the motors with buttons pressed before the connection was lost
 
-    def on_notify(self, callback):
+        :param owner: remote of the callbacks
+        :param priority: priority of the dropped callbacks
+        :returns: number of dropped callbacks
         """
-        create a callback for on notification actions
+        return self.__queues[priority].cancel(owner)
 
-        :param callback: callback function, contains notify data
-        :returns: nothing
+    def run(self, _=None):
         """
-        self.__notify_callback = callback
+        call the queued callbacks, connect and disconnect first, until the time slice is used up
 
-    def on_connect(self, callback):
+        :returns: number of called callbacks
         """
-        create a callback for on connect actions
+        self.__scheduled = False
+        connections, buttons = self.__queues
+        start = ticks_ms()
+        count = 0
+        while len(connections) or len(buttons):
+            if count and ticks_diff(ticks_ms(), start) >= self.__slice:
+                # the rest waits for the next run, queued BLE events go first
+                self.slices += 1
+                if self.__auto:
+                    try:
+                        schedule(self.__run_callback, None)
+                        self.__scheduled = True
+                    except RuntimeError:
+                        pass
+                break
+            priority = _PRIORITY_CONNECTION if len(connections) else _PRIORITY_BUTTON
+            entry = self.__queues[priority].take()
+            if entry is None:
+                continue
+            function, arguments, first, second, third, ticks = entry
+            began = ticks_us()
+            self.__waits[priority].add(ticks_diff(began, ticks))
+            if arguments == 0:
+                function()
+            elif arguments == 1:
+                function(first)
+            elif arguments == 2:
+                function(first, second)
+            else:
+                function(first, second, third)
+            duration = ticks_diff(ticks_us(), began)
+            self.__durations.add(duration)
+            if duration > self.__budget:
+                self.overruns += 1
+            count += 1
+        return count
+
+    def pending(self):
+        """
+        number of queued callbacks
 
-        :param callback: callback function
-        :returns: nothing
+        :returns: number of callbacks
         """
-        self.__connected_callback = callback
+        return len(self.__queues[0]) + len(self.__queues[1])
 
-    def on_disconnect(self, callback):
+    def stats(self):
         """
-        create a callback for on disconnect actions
+        statistics of the scheduler, the wait is from queuing until the callback starts
 
-        :param callback: callback function
-        :returns: nothing
+        :returns: dict with queued, dropped, cancelled, high water mark and wait in us per priority,
+                  callback durations in us, budget overruns and runs cut at the end of a slice
         """
-        self.__disconnected_callback = callback
+        result = {"callback": self.__durations.stats(), "overruns": self.overruns, "slices": self.slices}
+        for priority, name in enumerate(_PRIORITY_NAMES):
+            queue = self.__queues[priority]
+            result[name] = {"queued": queue.queued, "dropped": queue.overruns, "cancelled": queue.cancelled,
+                            "high_water": queue.high_water, "wait": self.__waits[priority].stats()}
+        return result
+
+
+# Internal used helper classes
+# this are not for usage outside of this environment
+
+# ubluetooth irq events
+_IRQ_SCAN_RESULT = const(1 << 4)
+_IRQ_SCAN_COMPLETE = const(1 << 5)
+_IRQ_PERIPHERAL_CONNECT = const(1 << 6)
+_IRQ_PERIPHERAL_DISCONNECT = const(1 << 7)
+_IRQ_GATTC_SERVICE_RESULT = const(1 << 8)
+_IRQ_GATTC_CHARACTERISTIC_RESULT = const(1 << 9)
+_IRQ_GATTC_READ_RESULT = const(1 << 11)
+_IRQ_GATTC_WRITE_STATUS = const(1 << 12)
+_IRQ_GATTC_NOTIFY = const(1 << 13)
+
+# write status of a write dropped by a full queue, ENOBUFS
+_WRITE_DROPPED = const(105)
+
+# advertising type of scan responses
+_ADV_SCAN_RSP = const(0x04)
 
+# discovered devices, seen within _FRESH_MS they are connected without a new scan
+_MAX_DEVICES = const(16)
+_FRESH_MS = const(10000)
+
+
+# latency instrumentation, None when disabled
+_profiler = None
+
+
+def profile(enabled=True, window=1000):
     """
-    private functions
-    -----------------
+    enable the latency instrumentation of all remotes and hubs, measured stages are
+    irq (time in the ble irq), irq_to_callback (notification in the irq until decoding starts),
+    decode (button decoding), callback (button callback) and write (queued until acknowledged).
+    disabled the irq and write path take no timestamps
+
+    :param enabled: enable or disable the instrumentation, enabling again resets it
+    :param window: number of samples after which older samples count half
+    :returns: nothing
     """
+    global _profiler
+    _profiler = _Profiler(len(_STAGE_NAMES), window) if enabled else None
+    for manager in _managers:
+        manager.profile(enabled)
 
-    def __is_connected(self):
-        return self.__conn_handle is not None
 
-    def __irq(self, event, data):
-        if event == self.__IRQ_SCAN_RESULT:
-            addr_type, addr, adv_type, rssi, adv_data = data
-            self.__log("result with uuid:", self.__decoder.decode_services(adv_data))
-            if self.__LEGO_SERVICE_UUID in self.__decoder.decode_services(adv_data):
-                self.__addr_type = addr_type
-                self.__addr = bytes(addr)
-                self.__adv_type = adv_type
-                self.__name = self.__decoder.decode_name(adv_data)
-                self.__services = self.__decoder.decode_services(adv_data)
-                self.__man_data = self.__decoder.decode_manufacturer(adv_data)
-                self.scan_stop()
-
-        elif event == self.__IRQ_SCAN_COMPLETE:
-            if self.__addr:
-                if self.__scan_callback:
-                    self.__scan_callback(self.__addr_type, self.__addr, self.__man_data)
-                self.__scan_callback = None
-            else:
-                self.__scan_callback(None, None, None)
+def stats():
+    """
+    latency statistics of the instrumentation
 
-        elif event == self.__IRQ_PERIPHERAL_CONNECT:
-            conn_handle, addr_type, addr = data
-            self.__conn_handle = conn_handle
-            self.__ble.gattc_discover_services(self.__conn_handle)
+    :returns: dict of stage -> dict with count, min, p50, p99 and max in us, None if disabled
+    """
+    if not _profiler:
+        return None
+    return {name: _profiler.stats(stage) for stage, name in enumerate(_STAGE_NAMES)}
 
-        elif event == self.__IRQ_PERIPHERAL_DISCONNECT:
-            conn_handle, _, _ = data
-            self.__disconnected_callback()
-            if conn_handle == self.__conn_handle:
-                self.__reset()
 
-        elif event == self.__IRQ_GATTC_SERVICE_RESULT:
-            conn_handle, start_handle, end_handle, uuid = data
-            if conn_handle == self.__conn_handle and uuid == self.__LEGO_SERVICE_UUID:
-                self.__ble.gattc_discover_characteristics(self.__conn_handle, start_handle, end_handle)
+# one manager per BLE radio, shared by all handlers
+_managers = []
 
-        elif event == self.__IRQ_GATTC_CHARACTERISTIC_RESULT:
-            conn_handle, def_handle, value_handle, properties, uuid = data
-            if conn_handle == self.__conn_handle and uuid == self.__LEGO_SERVICE_CHAR:
-                self.__value_handle = value_handle
-                self.__connected_callback()
 
-        elif event == self.__IRQ_GATTC_READ_RESULT:
-            conn_handle, value_handle, char_data = data
-            if self.__read_callback:
-                self.__read_callback(char_data)
+def _manager(ble=None):
+    """
+    get the connection manager of a BLE radio
 
-        elif event == self.__IRQ_GATTC_NOTIFY:
-            conn_handle, value_handle, notify_data = data
-            if self.__notify_callback:
-                self.__notify_callback(notify_data)
+    :param ble: BLE object to use, default is ubluetooth.BLE()
+    :returns: _PoweredUPManager
+    """
+    if ble is None:
+        ble = ubluetooth.BLE()
+    for manager in _managers:
+        if manager.ble is ble:
+            return manager
+    manager = _PoweredUPManager(ble)
+    _managers.append(manager)
+    return manager
 
 
-class _Decoder:
+class _PoweredUPManager:
     """
-    Class to decode BLE adv_data
+    Class to share one BLE radio between handlers, scans once
+    for all pending handlers and routes events by conn_handle
     """
 
-    def __init__(self):
+    def __init__(self, ble):
         """
-        create instance of _Decoder
+        Create instance of _PoweredUPManager
+
+        :param ble: BLE object to use
         """
-        self.__COMPANY_IDENTIFIER_CODES = {"0397": "LEGO System A/S"}
+        self.ble = ble
+        self.ble.active(True)
+        self.__recorder = None
+        self.__irq_handler = self.__irq
+        self.profile(_profiler is not None)
+        self.__decoder = _Decoder()
 
-    def decode_manufacturer(self, payload):
+        # scanning
+        self.__scanning = False
+        self.__pending = []
+
+        # connecting, addresses are claimed by one handler until it disconnects
+        self.__claimed = {}
+        self.__connect_queue = []
+        self.__connecting = False
+
+        # connected, conn_handle -> handler
+        self.__connections = {}
+
+        # LEGO devices seen by the scans, addr -> [addr_type, adv_type, rssi, ticks_ms, result, name]
+        self.__devices = {}
+
+    def scan(self, handler, timeout, active=False):
         """
-        decode manufacturer information from ble data
+        add a handler to the running scan or start a new one
 
-        :param payload: payload data to decode
+        :param handler: _PoweredUPHandler waiting for a device
+        :param timeout: timeout in ms
+        :param active: request scan responses with the device names, if the firmware supports it
         :returns: nothing
         """
-        man_data = []
-        n = self.__decode_field(payload, const(0xFF))
-        if not n:
-            return []
-        company_identifier = ubinascii.hexlify(struct.pack('<h', *struct.unpack('>h', n[0])))
-        company_name = self.__COMPANY_IDENTIFIER_CODES.get(company_identifier.decode(), "?")
-        company_data = n[0][2:]
-        man_data.append(company_identifier.decode())
-        man_data.append(company_name)
-        man_data.append(company_data)
-        return man_data
+        # a device seen shortly before is connected without scanning again
+        for addr, addr_type, adv_type, rssi, age, result, name in self.devices(_FRESH_MS):
+            if addr not in self.__claimed:
+                handler.offer(addr_type, addr, adv_type, result)
+                if addr in self.__claimed:
+                    return
+        if handler not in self.__pending:
+            self.__pending.append(handler)
+        if not self.__scanning:
+            self.__scanning = True
+            if not active:
+                self.ble.gap_scan(timeout, 30000, 30000)
+                return
+            try:
+                self.ble.gap_scan(timeout, 30000, 30000, True)
+            except TypeError:
+                self.ble.gap_scan(timeout, 30000, 30000)
+
+    def scan_cancel(self, handler):
+        """
+        remove a handler from the running scan, the scan stops without handlers
 
-    def decode_name(self, payload):
+        :param handler: _PoweredUPHandler
+        :returns: nothing
         """
-        decode name information from ble data
+        if handler in self.__pending:
+            self.__pending.remove(handler)
+        if self.__scanning and not self.__pending:
+            self.ble.gap_scan(None)
 
-        :param payload: payload data to decode
+    def connect(self, handler, addr_type, addr):
+        """
+        claim a device for a handler and connect to it
+
+        :param handler: _PoweredUPHandler
+        :param addr_type: the address type of the device
+        :param addr: the devices mac as bytes
         :returns: nothing
         """
-        n = self.__decode_field(payload, const(0x09))
-        return str(n[0], "utf-8") if n else "parsing failed!"
+        self.__claimed[addr] = handler
+        self.__connect_queue.append((addr_type, addr))
+        self.__connect_next()
 
-    def decode_services(self, payload):
+    def connections(self):
         """
-        decode services information from ble data
+        number of connected devices
+        """
+        return len(self.__connections)
 
-        :param payload: payload data to decode
+    def profile(self, enabled):
+        """
+        register the irq handler with or without time measurement
+
+        :param enabled: measure the time spent in the irq
         :returns: nothing
         """
-        services = []
-        for u in self.__decode_field(payload, const(0x3)):
-            services.append(ubluetooth.UUID(struct.unpack("<h", u)[0]))
-        for u in self.__decode_field(payload, const(0x5)):
-            services.append(ubluetooth.UUID(struct.unpack("<d", u)[0]))
-        for u in self.__decode_field(payload, const(0x7)):
-            services.append(ubluetooth.UUID(u))
-        return services
+        self.__irq_handler = self.__irq_profiled if enabled else self.__irq
+        self.ble.irq(handler=self.__irq_recorded if self.__recorder else self.__irq_handler)
+
+    def trace(self, recorder):
+        """
+        record every event of the radio before it is handled
+
+        :param recorder: object with put(event, data), None to stop recording
+        :returns: nothing
+        """
+        self.__recorder = recorder
+        self.ble.irq(handler=self.__irq_recorded if recorder else self.__irq_handler)
+
+    def device(self, addr):
+        """
+        a LEGO device seen by the scans
+
+        :param addr: the devices mac as bytes
+        :returns: [addr_type, adv_type, rssi, ticks_ms, result, name] or None
+        """
+        return self.__devices.get(addr)
+
+    def devices(self, max_age=None):
+        """
+        LEGO devices seen by the scans, strongest signal first
+
+        :param max_age: only devices seen within this time in ms
+        :returns: list of (addr, addr_type, adv_type, rssi, age in ms, result, name)
+        """
+        now = ticks_ms()
+        devices = []
+        for addr, (addr_type, adv_type, rssi, seen, result, name) in self.__devices.items():
+            age = ticks_diff(now, seen)
+            if max_age is None or age <= max_age:
+                devices.append((addr, addr_type, adv_type, rssi, age, result, name))
+        devices.sort(key=lambda device: -device[3])
+        return devices
 
     """
     private functions
     -----------------
     """
 
-    def __decode_field(self, payload, adv_type):
+    def __connect_next(self):
+        # the radio connects one device at a time and not while scanning
+        if self.__connecting or self.__scanning or not self.__connect_queue:
+            return
+        addr_type, addr = self.__connect_queue.pop(0)
+        self.__connecting = True
+        self.ble.gap_connect(addr_type, addr)
+
+    def __seen(self, addr_type, addr, adv_type, rssi, result):
+        device = self.__devices.get(addr)
+        if device:
+            device[0] = addr_type
+            device[1] = adv_type
+            device[2] = rssi
+            device[3] = ticks_ms()
+            device[4] = result
+            return
+        name = result[0] if result[0] != "parsing failed!" else None
+        if len(self.__devices) >= _MAX_DEVICES:
+            now = ticks_ms()
+            oldest = max(self.__devices, key=lambda key: ticks_diff(now, self.__devices[key][3]))
+            del self.__devices[oldest]
+        self.__devices[addr] = [addr_type, adv_type, rssi, ticks_ms(), result, name]
+
+    def __named(self, addr, payload):
+        # the name of a LEGO device is sent in the scan response
+        device = self.__devices.get(bytes(addr))
+        if device and device[5] is None:
+            name = self.__decoder.decode_name(payload)
+            if name != "parsing failed!":
+                device[5] = name
+
+    def __irq_recorded(self, event, data):
+        self.__recorder.put(event, data)
+        self.__irq_handler(event, data)
+
+    def __irq_profiled(self, event, data):
+        start = ticks_us()
+        self.__irq(event, data)
+        if _profiler:
+            _profiler.add(_STAGE_IRQ, ticks_diff(ticks_us(), start))
+
+    def __irq(self, event, data):
+        if event == _IRQ_GATTC_NOTIFY:
+            handler = self.__connections.get(data[0])
+            if handler:
+                handler.dispatch(event, data)
+
+        elif event == _IRQ_SCAN_RESULT:
+            if not self.__pending:
+                return
+            addr_type, addr, adv_type, rssi, adv_data = data
+            result = self.__decoder.decode_lego(addr, adv_data)
+            if not result:
+                if adv_type == _ADV_SCAN_RSP and self.__devices:
+                    self.__named(addr, adv_data)
+                return
+            addr = bytes(addr)
+            self.__seen(addr_type, addr, adv_type, rssi, result)
+            if addr in self.__claimed:
+                return
+            for handler in self.__pending:
+                handler.offer(addr_type, addr, adv_type, result)
+                if addr in self.__claimed:
+                    self.__pending.remove(handler)
+                    break
+            if not self.__pending:
+                self.ble.gap_scan(None)
+
+        elif event == _IRQ_SCAN_COMPLETE:
+            self.__scanning = False
+            pending = self.__pending
+            self.__pending = []
+            for handler in pending:
+                handler.scan_complete()
+            self.__connect_next()
+
+        elif event == _IRQ_PERIPHERAL_CONNECT:
+            conn_handle, addr_type, addr = data
+            self.__connecting = False
+            handler = self.__claimed.get(bytes(addr))
+            if handler:
+                self.__connections[conn_handle] = handler
+                handler.dispatch(event, data)
+            self.__connect_next()
+
+        elif event == _IRQ_PERIPHERAL_DISCONNECT:
+            conn_handle, addr_type, addr = data
+            handler = self.__connections.pop(conn_handle, None)
+            if handler:
+                self.__claimed.pop(bytes(addr), None)
+                handler.dispatch(event, data)
+            elif self.__connecting:
+                # a failed connect is reported as disconnect of the connecting device
+                self.__connecting = False
+                self.__devices.pop(bytes(addr), None)
+                handler = self.__claimed.pop(bytes(addr), None)
+                if handler:
+                    handler.connect_failed()
+                self.__connect_next()
+
+        else:
+            handler = self.__connections.get(data[0])
+            if handler:
+                handler.dispatch(event, data)
+
+
+# LEGO service and characteristic uuid, created with the first use
+_uuids = None
+
+
+def _lego_uuids():
+    """
+    get the uuids of the LEGO service and characteristic
+
+    :returns: (service uuid, characteristic uuid)
+    """
+    global _uuids
+    if not _uuids:
+        _uuids = (ubluetooth.UUID("00001623-1212-EFDE-1623-785FEABCD123"),
+                  ubluetooth.UUID("00001624-1212-EFDE-1623-785FEABCD123"))
+    return _uuids
+
+
+def _company_name(company_identifier):
+    """
+    get the name of a bluetooth company, the table is only loaded when used
+
+    :param company_identifier: company identifier as hex string
+    :returns: name or "?"
+    """
+    try:
+        from remote.companies import COMPANY_IDENTIFIER_CODES
+    except ImportError:
+        return "?"
+    return COMPANY_IDENTIFIER_CODES.get(company_identifier, "?")
+
+
+class _PoweredUPHandler:
+    """
+    Class to deal with LEGO(R) PowerUp(TM) over BLE
+    """
+
+    def __init__(self, ble=None, queue_size=16, retries=3, buffer=0):
+        """
+        Create instance of _PoweredUPHandler
+
+        :param ble: BLE object to use, default is ubluetooth.BLE()
+        :param queue_size: maximum number of queued writes
+        :param retries: retries of a failed write before it is dropped
+        :param buffer: number of notifications buffered by the irq, 0 calls back from the irq
+        """
+        # class specific
+        self.__manager = _manager(ble)
+        self.__ble = self.__manager.ble
+        self.__reset()
+        self.debug = False
+
+        # irq timestamp in us of the notification in the notify callback
+        self.ticks = 0
+
+        # write queue, the pump is bound once to schedule it without allocation
+        self.__queue_size = queue_size
+        self.__retries = retries
+        self.__pump_callback = self.__pump
+        self.__coalesced = 0
+        self.__dropped = 0
+        self.__retried = 0
+
+        # notification buffer, drained from micropython.schedule or drain()
+        self.__ring = _EventRing(buffer) if buffer else None
+        self.__drain_callback = self.drain
+        self.__drain_event = self.__on_buffered
+        self.__drain_scheduled = False
+
+        # callbacks
+        self.__scan_callback = None
+        self.__read_callback = None
+        self.__notify_callback = None
+        self.__connected_callback = None
+        self.__disconnected_callback = None
+
+    def __reset(self):
+        """
+        reset all necessary variables
+        """
+        # cached data
+        self.__addr = None
+        self.__addr_type = None
+        self.__adv_type = None
+        self.__services = None
+        self.__man_data = None
+        self.__name = None
+        self.__conn_handle = None
+        self.__value_handle = None
+        self.__cached_handle = None
+        self.__ready = False
+
+        # write queue entries are [key, data, adv_value, callback, retries, ticks_us when profiled]
+        self.__queue = []
+        self.__in_flight = False
+        # a busy stack and a full schedule queue left the head unsent, the next event retries it
+        self.__stalled = False
+
+        # callbacks of one scan, read or connect, the others stay registered
+        self.__scan_callback = None
+        self.__read_callback = None
+        self.__failed_callback = None
+
+    def __log(self, *args):
+        """
+        log function if debug flag is set, the logger is only loaded when used
+
+        :param args: arguments to log
+        :returns: nothing
+        """
+        if not self.debug:
+            return
+        try:
+            from remote.debug import log
+        except ImportError:
+            log = print
+        log(args)
+
+    def scan_start(self, timeout, callback):
+        """
+        start scanning for devices, joins a scan that is already running
+
+        :param timeout: timeout in ms
+        :param callback: callback function, contains scan data
+        :returns: nothing
+        """
+        if _DEBUG and self.debug:
+            self.__log("start scanning...")
+        self.__scan_callback = callback
+        self.__manager.scan(self, timeout)
+
+    def scan_stop(self):
+        """
+        stop scanning for devices
+
+        :returns: nothing
+        """
+        self.__manager.scan_cancel(self)
+
+    def write(self, data, adv_value=None, key=None, callback=None):
+        """
+        queue data to write to gatt client, writes are sent one after the
+        other when the previous one is acknowledged, also before connected
+
+        :param data: data to write
+        :param adv_value: advanced value to write
+        :param key: a queued write with the same key is replaced by this one
+        :param callback: callback function, contains the write status, 105 (ENOBUFS) if the queue is full
+        :returns: nothing
+        """
+        if key is not None:
+            for i in range(1 if self.__in_flight else 0, len(self.__queue)):
+                entry = self.__queue[i]
+                if entry[0] == key:
+                    entry[1] = data
+                    entry[2] = adv_value
+                    entry[3] = callback
+                    self.__coalesced += 1
+                    return
+        if len(self.__queue) >= self.__queue_size:
+            self.__dropped += 1
+            if callback:
+                callback(_WRITE_DROPPED)
+            return
+        self.__queue.append([key, data, adv_value, callback, 0, ticks_us() if _profiler else 0])
+        self.__pump()
+
+    def write_stats(self):
+        """
+        statistics of the write queue
+
+        :returns: dict with queue depth, coalesced, dropped and retried writes
+        """
+        return {"depth": len(self.__queue), "coalesced": self.__coalesced,
+                "dropped": self.__dropped, "retried": self.__retried}
+
+    def read(self, callback):
+        """
+        read data from gatt client
+
+        :param callback: callback function, contains readed data
+        :returns: nothing
+        """
+        if not self.__is_connected():
+            return
+        self.__read_callback = callback
+        self.__ble.gattc_read(self.__conn_handle, self.__value_handle)
+
+    def connect(self, addr_type, addr, value_handle=None, failed=None):
+        """
+        connect to a ble device
+
+        :param addr_type: the address type of the device
+        :param addr: the devices mac a binary
+        :param value_handle: known handle of the LEGO characteristic, skips the discovery
+        :param failed: callback function if the connect fails, contains the address
+        :returns: nothing
+        """
+        self.__addr_type = addr_type
+        self.__addr = bytes(addr)
+        self.__cached_handle = value_handle
+        self.__failed_callback = failed
+        self.__manager.connect(self, addr_type, self.__addr)
+
+    def connect_failed(self):
+        """
+        called when the connect to the device failed
+
+        :returns: nothing
+        """
+        addr = self.__addr
+        callback = self.__failed_callback
+        self.__reset()
+        if callback:
+            callback(addr)
+
+    def device(self):
+        """
+        the connected device
+
+        :returns: (addr_type, addr, value_handle)
+        """
+        return self.__addr_type, self.__addr, self.__value_handle
+
+    def disconnect(self):
+        """
+        disconnect from a ble device
+
+        :returns: nothing
+        """
+        if not self.__is_connected():
+            return
+        self.__ble.gap_disconnect(self.__conn_handle)
+
+    def on_notify(self, callback):
+        """
+        create a callback for on notification actions
+
+        :param callback: callback function, contains notify data
+        :returns: nothing
+        """
+        self.__notify_callback = callback
+
+    def on_connect(self, callback):
+        """
+        create a callback for on connect actions
+
+        :param callback: callback function
+        :returns: nothing
+        """
+        self.__connected_callback = callback
+
+    def on_disconnect(self, callback):
+        """
+        create a callback for on disconnect actions
+
+        :param callback: callback function
+        :returns: nothing
+        """
+        self.__disconnected_callback = callback
+
+    def offer(self, addr_type, addr, adv_type, result):
+        """
+        offer a scanned LEGO device, the scan callback connects if it wants the device
+
+        :param addr_type: the address type of the device
+        :param addr: the devices mac as bytes
+        :param adv_type: advertising type
+        :param result: decoded (name, services, manufacturer)
+        :returns: nothing
+        """
+        if _DEBUG and self.debug:
+            self.__log("result with uuid:", result[1])
+        self.__adv_type = adv_type
+        self.__name, self.__services, self.__man_data = result
+        if self.__scan_callback:
+            self.__scan_callback(addr_type, addr, self.__man_data)
+        if self.__addr:
+            self.__scan_callback = None
+
+    def scan_complete(self):
+        """
+        called when the scan ended without a device for this handler
+
+        :returns: nothing
+        """
+        if self.__scan_callback:
+            self.__scan_callback(None, None, None)
+        self.__scan_callback = None
+
+    def drain(self, _=None):
+        """
+        handle all buffered notifications
+
+        :returns: number of handled notifications
+        """
+        self.__drain_scheduled = False
+        if self.__ring is None:
+            return 0
+        return self.__ring.drain(self.__drain_event)
+
+    def buffer_stats(self):
+        """
+        statistics of the notification buffer
+
+        :returns: dict with depth, high water mark, overruns and truncated events or None without buffer
+        """
+        return self.__ring.stats() if self.__ring is not None else None
+
+    def dispatch(self, event, data):
+        """
+        handle a BLE event of this handlers connection
+
+        :param event: irq event
+        :param data: irq data
+        :returns: nothing
+        """
+        if self.__stalled:
+            self.__stalled = False
+            self.__pump()
+
+        if event == _IRQ_GATTC_NOTIFY:
+            conn_handle, value_handle, notify_data = data
+            ticks = ticks_us()
+            if self.__ring is not None:
+                if self.__ring.put(event, notify_data, ticks) and not self.__drain_scheduled:
+                    try:
+                        schedule(self.__drain_callback, None)
+                        self.__drain_scheduled = True
+                    except RuntimeError:
+                        pass
+            elif self.__notify_callback:
+                self.ticks = ticks
+                self.__notify_callback(notify_data)
+
+        elif event == _IRQ_PERIPHERAL_CONNECT:
+            conn_handle, addr_type, addr = data
+            self.__conn_handle = conn_handle
+            if self.__cached_handle is None:
+                self.__ble.gattc_discover_services(self.__conn_handle)
+                return
+            # known device, the first write verifies the cached handle
+            self.__value_handle = self.__cached_handle
+            self.__pump()
+            self.__connected()
+
+        elif event == _IRQ_PERIPHERAL_DISCONNECT:
+            # reset first, the callback may connect again
+            self.__reset()
+            if self.__disconnected_callback:
+                self.__disconnected_callback()
+
+        elif event == _IRQ_GATTC_SERVICE_RESULT:
+            conn_handle, start_handle, end_handle, uuid = data
+            if uuid == _lego_uuids()[0]:
+                self.__ble.gattc_discover_characteristics(self.__conn_handle, start_handle, end_handle)
+
+        elif event == _IRQ_GATTC_CHARACTERISTIC_RESULT:
+            conn_handle, def_handle, value_handle, properties, uuid = data
+            if uuid == _lego_uuids()[1]:
+                self.__value_handle = value_handle
+                self.__pump()
+                self.__connected()
+
+        elif event == _IRQ_GATTC_WRITE_STATUS:
+            conn_handle, value_handle, status = data
+            if not self.__in_flight:
+                return
+            self.__in_flight = False
+            if status != 0 and self.__cached_handle is not None:
+                # the cached handle is invalid, discover it and resend the write
+                self.__cached_handle = None
+                self.__value_handle = None
+                self.__ble.gattc_discover_services(self.__conn_handle)
+                return
+            self.__cached_handle = None
+            self.__written(status)
+            self.__pump()
+
+        elif event == _IRQ_GATTC_READ_RESULT:
+            conn_handle, value_handle, char_data = data
+            if self.__read_callback:
+                self.__read_callback(char_data)
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __is_connected(self):
+        return self.__conn_handle is not None
+
+    def __connected(self):
+        if self.__ready:
+            return
+        self.__ready = True
+        if self.__connected_callback:
+            self.__connected_callback()
+
+    def __on_buffered(self, event, data, ticks):
+        self.ticks = ticks
+        if self.__notify_callback:
+            self.__notify_callback(data)
+
+    def __pump(self, _=None):
+        while self.__queue and not self.__in_flight and self.__value_handle is not None:
+            _, data, adv_value, _, _, _ = self.__queue[0]
+            try:
+                self.__ble.gattc_write(self.__conn_handle, adv_value if adv_value else self.__value_handle, data, 1)
+                self.__in_flight = True
+            except OSError as e:
+                # the stack is busy, retry soon
+                if self.__written(e.args[0]):
+                    try:
+                        schedule(self.__pump_callback, None)
+                    except RuntimeError:
+                        self.__stalled = True
+                    return
+
+    def __written(self, status):
+        """
+        complete the head of the write queue
+
+        :param status: write status, 0 on success
+        :returns: True if the write is retried
+        """
+        entry = self.__queue[0]
+        if status != 0 and entry[4] < self.__retries:
+            entry[4] += 1
+            self.__retried += 1
+            return True
+        self.__queue.pop(0)
+        if status != 0:
+            self.__dropped += 1
+        elif _profiler and entry[5]:
+            _profiler.add(_STAGE_WRITE, ticks_diff(ticks_us(), entry[5]))
+        if entry[3]:
+            entry[3](status)
+        return False
+
+
+# one cache per file, shared by all remotes
+_device_caches = {}
+
+
+def _device_cache(path=None):
+    """
+    get the device cache of a file
+
+    :param path: file to persist the cache in, None for a cache in memory
+    :returns: _DeviceCache
+    """
+    cache = _device_caches.get(path)
+    if not cache:
+        cache = _DeviceCache(path)
+        _device_caches[path] = cache
+    return cache
+
+
+class _DeviceCache:
+    """
+    Known devices for fast reconnects, address -> (addr_type, value_handle)
+    """
+
+    def __init__(self, path=None):
+        """
+        create instance of _DeviceCache, loads the file if it exists
+
+        :param path: file to persist the cache in, None for a cache in memory
+        """
+        self.__path = path
+        self.__devices = {}
+        self.__save_callback = self.save
+        # a save the full schedule queue refused, retried from the next get or change
+        self.__unsaved = False
+        if not path:
+            return
+        try:
+            with open(path) as f:
+                for line in f:
+                    addr, addr_type, value_handle = line.strip().split(',')
+                    self.__devices[ubinascii.unhexlify(addr)] = (int(addr_type), int(value_handle))
+        except (OSError, ValueError):
+            pass
+
+    def get(self, addr):
+        """
+        get a known device
+
+        :param addr: the devices mac as bytes
+        :returns: (addr_type, value_handle) or None
+        """
+        if self.__unsaved:
+            self.__schedule_save()
+        return self.__devices.get(addr)
+
+    def put(self, addr, addr_type, value_handle):
+        """
+        remember a device, the file is written from micropython.schedule
+
+        :param addr: the devices mac as bytes
+        :param addr_type: the address type of the device
+        :param value_handle: handle of the LEGO characteristic
+        :returns: nothing
+        """
+        if self.__devices.get(addr) == (addr_type, value_handle):
+            return
+        self.__devices[addr] = (addr_type, value_handle)
+        self.__schedule_save()
+
+    def remove(self, addr):
+        """
+        forget a device
+
+        :param addr: the devices mac as bytes
+        :returns: nothing
+        """
+        if self.__devices.pop(addr, None):
+            self.__schedule_save()
+
+    def save(self, _=None):
+        """
+        write the cache to its file
+
+        :returns: nothing
+        """
+        self.__unsaved = False
+        if not self.__path:
+            return
+        with open(self.__path, 'w') as f:
+            for addr, (addr_type, value_handle) in self.__devices.items():
+                f.write("%s,%d,%d\n" % (ubinascii.hexlify(addr).decode(), addr_type, value_handle))
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __schedule_save(self):
+        if not self.__path:
+            return
+        try:
+            schedule(self.__save_callback, None)
+            self.__unsaved = False
+        except RuntimeError:
+            # no file io in the irq, the save waits for the next chance to schedule it
+            self.__unsaved = True
+
+
+class _EventRing:
+    """
+    Preallocated ring of raw BLE events, put does not allocate
+    so it can be used in the irq
+    """
+
+    def __init__(self, slots=16, size=20):
+        """
+        create instance of _EventRing
+
+        :param slots: number of events, one slot stays free
+        :param size: maximum payload bytes of one event, longer payloads are truncated
+        """
+        # slot layout is [event, length, payload...]
+        self.__slots = slots
+        self.__size = size
+        self.__slot_size = size + 2
+        self.__buffer = bytearray(slots * self.__slot_size)
+        view = memoryview(self.__buffer)
+        self.__payloads = [view[i * self.__slot_size + 2: (i + 1) * self.__slot_size] for i in range(slots)]
+        self.__ticks = [0] * slots
+        self.__head = 0
+        self.__tail = 0
+
+        # instrumentation
+        self.overruns = 0
+        self.truncated = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return (self.__head - self.__tail) % self.__slots
+
+    def put(self, event, data, ticks=0):
+        """
+        copy an event into the ring, the newest event is dropped when the ring is full
+
+        :param event: event code, 0 - 255
+        :param data: payload bytes
+        :param ticks: timestamp of the event, a small int
+        :returns: True if the event was stored
+        """
+        head = self.__head
+        following = head + 1
+        if following == self.__slots:
+            following = 0
+        if following == self.__tail:
+            self.overruns += 1
+            return False
+
+        length = len(data)
+        if length > self.__size:
+            length = self.__size
+            self.truncated += 1
+        buffer = self.__buffer
+        offset = head * self.__slot_size
+        buffer[offset] = event & 0xFF
+        buffer[offset + 1] = length
+        offset += 2
+        # byte wise copy, slicing would allocate
+        for i in range(length):
+            buffer[offset + i] = data[i]
+        self.__ticks[head] = ticks
+        self.__head = following
+
+        depth = (following - self.__tail) % self.__slots
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def drain(self, callback):
+        """
+        hand all events to a callback in order, the payload is only valid during the callback
+
+        :param callback: callback function, contains event code, payload and timestamp
+        :returns: number of events
+        """
+        count = 0
+        while self.__tail != self.__head:
+            tail = self.__tail
+            offset = tail * self.__slot_size
+            callback(self.__buffer[offset], self.__payloads[tail][:self.__buffer[offset + 1]], self.__ticks[tail])
+            self.__tail = tail + 1 if tail + 1 < self.__slots else 0
+            count += 1
+        return count
+
+    def clear(self):
+        """
+        drop all events
+
+        :returns: nothing
+        """
+        self.__tail = self.__head
+
+    def stats(self):
+        """
+        statistics of the ring
+
+        :returns: dict with depth, high water mark, overruns and truncated events
+        """
+        return {"depth": len(self), "high_water": self.high_water,
+                "overruns": self.overruns, "truncated": self.truncated}
+
+
+class _CallbackQueue:
+    """
+    Preallocated ring of deferred callbacks with up to three arguments,
+    put does not allocate so it can be used in the irq
+    """
+
+    def __init__(self, slots=16):
+        """
+        create instance of _CallbackQueue
+
+        :param slots: number of callbacks, one slot stays free
+        """
+        self.__slots = slots
+        self.__owners = [None] * slots
+        self.__functions = [None] * slots
+        self.__counts = bytearray(slots)
+        self.__first = [None] * slots
+        self.__second = [None] * slots
+        self.__third = [None] * slots
+        self.__ticks = [0] * slots
+        self.__head = 0
+        self.__tail = 0
+
+        # instrumentation
+        self.queued = 0
+        self.overruns = 0
+        self.cancelled = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return (self.__head - self.__tail) % self.__slots
+
+    def put(self, owner, function, count, first, second, third, ticks):
+        """
+        queue a callback, the newest callback is dropped when the ring is full
+
+        :param owner: owner of the callback
+        :param function: callback function
+        :param count: number of arguments
+        :param first: first argument
+        :param second: second argument
+        :param third: third argument
+        :param ticks: timestamp of the callback, a small int
+        :returns: True if the callback was stored
+        """
+        head = self.__head
+        following = head + 1
+        if following == self.__slots:
+            following = 0
+        if following == self.__tail:
+            self.overruns += 1
+            return False
+        self.__owners[head] = owner
+        self.__functions[head] = function
+        self.__counts[head] = count
+        self.__first[head] = first
+        self.__second[head] = second
+        self.__third[head] = third
+        self.__ticks[head] = ticks
+        self.__head = following
+        self.queued += 1
+
+        depth = (following - self.__tail) % self.__slots
+        if depth > self.high_water:
+            self.high_water = depth
+        return True
+
+    def take(self):
+        """
+        remove the oldest callback, the slot is cleared
+
+        :returns: (function, count, first, second, third, ticks), None if it was cancelled or the ring is empty
+        """
+        tail = self.__tail
+        if tail == self.__head:
+            return None
+        function = self.__functions[tail]
+        entry = None
+        if function is not None:
+            entry = (function, self.__counts[tail], self.__first[tail], self.__second[tail], self.__third[tail],
+                     self.__ticks[tail])
+        self.__clear(tail)
+        self.__tail = tail + 1 if tail + 1 < self.__slots else 0
+        return entry
+
+    def cancel(self, owner):
+        """
+        cancel the queued callbacks of an owner, they stay in the ring until taken
+
+        :param owner: owner of the callbacks
+        :returns: number of cancelled callbacks
+        """
+        count = 0
+        index = self.__tail
+        while index != self.__head:
+            if self.__owners[index] is owner and self.__functions[index] is not None:
+                self.__clear(index)
+                count += 1
+            index = index + 1 if index + 1 < self.__slots else 0
+        self.cancelled += count
+        return count
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __clear(self, index):
+        # drop the references, the arguments may be large
+        self.__owners[index] = None
+        self.__functions[index] = None
+        self.__first[index] = None
+        self.__second[index] = None
+        self.__third[index] = None
+
+
+class _HubProperties:
+    """
+    Latest values of the hub properties pushed by a device (battery, rssi, button),
+    every value is kept with the tick of its update and is read in O(1)
+    """
+
+    def __init__(self):
+        """
+        create instance of _HubProperties
+        """
+        self.__values = [None] * _PROPERTY_SLOTS
+        self.__ticks = [0] * _PROPERTY_SLOTS
+        self.updates = 0
+        self.callback = None
+
+    def update(self, data, offset):
+        """
+        take the value of a hub property update message
+
+        :param data: message bytes
+        :param offset: offset of the payload, [property, operation, value]
+        :returns: True if the message was a property update
+        """
+        if len(data) < offset + 3 or data[offset + 1] != _PROPERTY_UPDATE:
+            return False
+        prop = data[offset]
+        if prop >= _PROPERTY_SLOTS:
+            return False
+        value = data[offset + 2]
+        if prop == _PROPERTY_RSSI and value > 127:
+            value -= 256
+        self.__values[prop] = value
+        self.__ticks[prop] = ticks_ms()
+        self.updates += 1
+        if self.callback:
+            self.callback(prop, value)
+        return True
+
+    def value(self, prop):
+        """
+        latest value of a property
+
+        :param prop: property id
+        :returns: value or None if never updated
+        """
+        return self.__values[prop]
+
+    def get(self, prop):
+        """
+        latest value of a property and its age
+
+        :param prop: property id
+        :returns: (value, age in ms) or None if never updated
+        """
+        value = self.__values[prop]
+        if value is None:
+            return None
+        return value, ticks_diff(ticks_ms(), self.__ticks[prop])
+
+
+class _Profiler:
+    """
+    Latency histograms of the instrumented stages
+    """
+
+    def __init__(self, stages, window=1000):
+        """
+        create instance of _Profiler
+
+        :param stages: number of stages
+        :param window: number of samples after which the histograms are halved
+        """
+        self.__histograms = [_Histogram(window) for _ in range(stages)]
+
+    def add(self, stage, us):
+        """
+        add a sample of a stage
+
+        :param stage: stage index
+        :param us: duration in us
+        :returns: nothing
+        """
+        self.__histograms[stage].add(us)
+
+    def stats(self, stage):
+        """
+        statistics of a stage
+
+        :param stage: stage index
+        :returns: dict with count, min, p50, p99 and max in us
+        """
+        return self.__histograms[stage].stats()
+
+
+class _Histogram:
+    """
+    Histogram of durations in fixed memory, buckets are exact up to 8 us
+    and then 4 per power of two (at most 25 % wide)
+    """
+
+    def __init__(self, window=1000):
+        """
+        create instance of _Histogram
+
+        :param window: number of samples after which all buckets are halved rounding up,
+                       so old samples fade out and a bucket with samples keeps one
+        """
+        self.__buckets = [0] * 128
+        self.__window = window
+        self.__samples = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, us):
+        """
+        add a sample, does not allocate
+
+        :param us: duration in us
+        :returns: nothing
+        """
+        if us < 0:
+            us = 0
+        self.count += 1
+        if self.min is None or us < self.min:
+            self.min = us
+        if self.max is None or us > self.max:
+            self.max = us
+        shift = 0
+        value = us
+        while value >= 8:
+            value >>= 1
+            shift += 1
+        index = (shift << 2) + value if shift else value
+        buckets = self.__buckets
+        buckets[index if index < 128 else 127] += 1
+        self.__samples += 1
+        if self.__samples >= self.__window:
+            self.__samples = 0
+            for i in range(128):
+                buckets[i] = (buckets[i] + 1) >> 1
+
+    def percentile(self, fraction):
+        """
+        upper bound of the bucket with the percentile
+
+        :param fraction: 0.5 for the median
+        :returns: duration in us or None without samples
+        """
+        total = sum(self.__buckets)
+        if not total:
+            return None
+        rank = total * fraction
+        seen = 0
+        for index in range(128):
+            seen += self.__buckets[index]
+            if seen >= rank and self.__buckets[index]:
+                if index < 8:
+                    upper = index
+                else:
+                    shift = (index >> 2) - 1
+                    upper = (((index & 3) | 4) + 1 << shift) - 1
+                return min(upper, self.max)
+        return None
+
+    def stats(self):
+        """
+        statistics of the samples
+
+        :returns: dict with count, min, p50, p99 and max in us
+        """
+        return {"count": self.count, "min": self.min, "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99), "max": self.max}
+
+
+class _Decoder:
+    """
+    Class to decode BLE adv_data
+    """
+
+    def __init__(self, cache_size=8):
+        """
+        create instance of _Decoder
+
+        :param cache_size: number of decoded advertisements to keep
+        """
+        # 128 bit LEGO service uuid as sent over the air (little endian)
+        self.__LEGO_SERVICE_BYTES = b'\x23\xd1\xbc\xea\x5f\x78\x23\x16\xde\xef\x12\x12\x23\x16\x00\x00'
+
+        # least recently used advertisements, address -> (payload, result)
+        self.__cache_size = cache_size
+        self.__cache = {}
+        self.__cache_order = []
+
+    def decode_lego(self, addr, payload):
+        """
+        decode an advertisement of a LEGO device, results are cached per address and payload
+
+        :param addr: address of the advertiser
+        :param payload: payload data to decode
+        :returns: (name, services, manufacturer) or None if it is not a LEGO device
+        """
+        payload = bytes(payload)
+        if self.__LEGO_SERVICE_BYTES not in payload:
+            return None
+
+        addr = bytes(addr)
+        cached = self.__cache.get(addr)
+        if cached and cached[0] == payload:
+            if self.__cache_order[-1] != addr:
+                self.__cache_order.remove(addr)
+                self.__cache_order.append(addr)
+            return cached[1]
+
+        result = self.decode(payload, False)
+        if _lego_uuids()[0] not in result[1]:
+            result = None
+        if cached:
+            self.__cache_order.remove(addr)
+        elif len(self.__cache_order) >= self.__cache_size:
+            del self.__cache[self.__cache_order.pop(0)]
+        self.__cache[addr] = (payload, result)
+        self.__cache_order.append(addr)
+        return result
+
+    def decode(self, payload, company_names=True):
+        """
+        decode name, services and manufacturer information from ble data in one pass
+
+        :param payload: payload data to decode
+        :param company_names: look up the company name, it is None if not set
+        :returns: (name, services, manufacturer)
+        """
+        name = None
+        services = []
+        man_data = None
         i = 0
-        result = []
         while i + 1 < len(payload):
-            if payload[i + 1] == adv_type:
-                result.append(payload[i + 2: i + payload[i] + 1])
+            adv_type = payload[i + 1]
+            start = i + 2
+            # a field longer than the payload is cut off at its end
+            end = min(i + payload[i] + 1, len(payload))
+            if adv_type == 0x03 or adv_type == 0x02:
+                for j in range(start, end - 1, 2):
+                    services.append(ubluetooth.UUID(payload[j] | payload[j + 1] << 8))
+            elif adv_type == 0x05 or adv_type == 0x04:
+                for j in range(start, end - 3, 4):
+                    services.append(ubluetooth.UUID(struct.unpack_from("<I", payload, j)[0]))
+            elif adv_type == 0x07 or adv_type == 0x06:
+                for j in range(start, end - 15, 16):
+                    services.append(ubluetooth.UUID(bytes(payload[j: j + 16])))
+            elif adv_type == 0x09 and name is None:
+                name = str(bytes(payload[start: end]), "utf-8")
+            elif adv_type == 0xFF and man_data is None and end - start >= 2:
+                company_identifier = "%04x" % (payload[start] | payload[start + 1] << 8)
+                company_name = _company_name(company_identifier) if _COMPANY_NAMES and company_names else None
+                man_data = [company_identifier, company_name, payload[start + 2: end]]
             i += 1 + payload[i]
-        return result
\ No newline at end of file
+        return name if name is not None else "parsing failed!", services, man_data if man_data else []
+
+    def decode_manufacturer(self, payload):
+        """
+        decode manufacturer information from ble data
+
+        :param payload: payload data to decode
+        :returns: [company identifier, company name, company data] or empty list
+        """
+        return self.decode(payload)[2]
+
+    def decode_name(self, payload):
+        """
+        decode name information from ble data
+
+        :param payload: payload data to decode
+        :returns: name
+        """
+        return self.decode(payload, False)[0]
+
+    def decode_services(self, payload):
+        """
+        decode services information from ble data
+
+        :param payload: payload data to decode
+        :returns: list of service uuids
+        """
+        return self.decode(payload, False)[1]
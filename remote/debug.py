@@ -0,0 +1,39 @@
+from utime import ticks_ms
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Debug output of the library, only loaded
+when the debug flag of a remote is set.
+"""
+
+
+def log(args):
+    """
+    print a debug message with the current tick
+
+    :param args: tuple of values to print
+    :returns: nothing
+    """
+    print(ticks_ms(), args)
+
+
+def dump(stats=None):
+    """
+    print the latency statistics of the instrumentation as a table
+
+    :param stats: statistics like remote.control.stats(), default are the current ones
+    :returns: nothing
+    """
+    if stats is None:
+        from remote.control import stats as current
+        stats = current()
+    if not stats:
+        print("instrumentation disabled, enable it with remote.control.profile()")
+        return
+    print("%-16s %8s %8s %8s %8s %8s" % ("stage (us)", "count", "min", "p50", "p99", "max"))
+    for name, stage in stats.items():
+        # values without samples are None
+        values = tuple("-" if stage[key] is None else "%d" % stage[key] for key in ("min", "p50", "p99", "max"))
+        print("%-16s %8d %8s %8s %8s %8s" % ((name, stage["count"]) + values))
@@ -0,0 +1,398 @@
+from micropython import const
+from remote.control import _PoweredUPHandler, _HubProperties
+from remote.lwp3 import Encoder, Dispatcher, MessageType, PortOutput, PortValues, CombinedSetup, HubProperty, \
+    MODE_FORMATS
+import ubinascii
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Powered UP hubs (Move hub, City hub, Technic hub)
+over the same BLE pipeline as the remote. Attached
+motors and sensors are reported by the hub, port
+output commands are queued per port or batched into
+one write. Sensor and motor values are subscribed
+per port and decoded with precomputed formats.
+"""
+
+# system type ids of the hubs
+_MOVE_HUB = const(0x40)
+_CITY_HUB = const(0x41)
+_TECHNIC_HUB = const(0x80)
+
+# attached io events
+_IO_DETACHED = const(0x00)
+
+_NOTIFY_ENABLE = b'\x01\x00'
+
+# the LWP3 service has a single characteristic, its only descriptor is the client
+# configuration right after the value handle (0x0B, 0x0C on the remote), a hub
+# that fails the write of it is disconnected by the handshake
+_CCCD_OFFSET = const(1)
+
+
+class PoweredUPHub:
+    """
+    Class to handle LEGO(R) PowerUP(TM) Hubs
+    """
+
+    # ports of the hubs
+    PORT_A = const(0x00)
+    PORT_B = const(0x01)
+    PORT_C = const(0x02)
+    PORT_D = const(0x03)
+
+    def __init__(self, ble=None, buffer=0, mtu=20, properties=False):
+        """
+        Create a instance of PowerUP Hub
+
+        :param ble: BLE object to use, default is ubluetooth.BLE()
+        :param buffer: number of notifications buffered by the irq, the callbacks
+                       then run from micropython.schedule or process() instead of the irq
+        :param mtu: maximum bytes of one write, a batch is split into writes of this size
+        :param properties: let the hub push battery, rssi and button updates, read them with
+                           battery(), rssi() and hub_property()
+        """
+        # constants
+        self.debug = False
+        self.__address = None
+        self.__system_types = (_MOVE_HUB, _CITY_HUB, _TECHNIC_HUB)
+
+        # class specific
+        self.__handler = _PoweredUPHandler(ble, buffer=buffer)
+        self.__encoder = Encoder()
+        self.__dispatcher = Dispatcher()
+        self.__dispatcher.on(MessageType.HUB_ATTACHED_IO, self.__on_attached_io)
+        self.__devices = {}
+        self.__values = PortValues(self.__dispatcher)
+        # port -> subscribed mode, a tuple of the modes of a combined subscription
+        self.__modes = {}
+        self.__properties = None
+        if properties:
+            self.__properties = _HubProperties()
+            self.__dispatcher.on(MessageType.HUB_PROPERTIES, self.__properties.update)
+
+        # batch of commands, sent as writes of up to mtu bytes
+        self.__mtu = mtu
+        self.__batch = bytearray(mtu * 4)
+        self.__batch_size = 0
+        self.__batching = False
+
+        # callbacks
+        self.__connect_callback = None
+        self.__disconnect_callback = None
+        self.__attach_callback = None
+
+    def connect(self, timeout=3000, address=None, system_type=None):
+        """
+        connect to a powered up hub
+
+        :param timeout: time of scanning for devices in ms, default is 3000
+        :param address: mac address of device, connect to a specific device if set
+        :param system_type: only connect to this kind of hub, 0x40 move, 0x41 city, 0x80 technic
+        :returns: nothing
+        """
+        if address:
+            self.__address = ubinascii.unhexlify(address.replace(':', ''))
+        if system_type is not None:
+            self.__system_types = (system_type,)
+        self.__handler.debug = self.debug
+        self.__handler.on_connect(callback=self.__on_connect)
+        self.__handler.on_disconnect(callback=self.__on_disconnect)
+        self.__handler.on_notify(callback=self.__dispatcher.dispatch)
+        self.__handler.scan_start(timeout, callback=self.__on_scan)
+
+    def disconnect(self):
+        """
+        disconnect from a powered up hub
+
+        :returns: nothing
+        """
+        self.__handler.disconnect()
+
+    def devices(self):
+        """
+        attached motors and sensors
+
+        :returns: dict of port -> io type id
+        """
+        return self.__devices
+
+    def start_speed(self, port, speed, max_power=100):
+        """
+        run a motor with speed control
+
+        :param port: port of the motor
+        :param speed: speed in % from -100 to 100, 0 brakes
+        :param max_power: maximum power in %
+        :returns: nothing
+        """
+        self.__send(port, self.__encoder.start_speed(port, speed, max_power))
+
+    def start_power(self, port, power):
+        """
+        run a motor or light with a fixed power
+
+        :param port: port of the device
+        :param power: power in % from -100 to 100, 0 floats, 127 brakes
+        :returns: nothing
+        """
+        self.__send(port, self.__encoder.start_power(port, power))
+
+    def goto_absolute_position(self, port, position, speed, max_power=100, end_state=PortOutput.BRAKE):
+        """
+        move a motor to an absolute position
+
+        :param port: port of the motor
+        :param position: position in degrees
+        :param speed: speed in % from 0 to 100
+        :param max_power: maximum power in %
+        :param end_state: state after the move, use PortOutput class
+        :returns: nothing
+        """
+        self.__send(port, self.__encoder.goto_absolute_position(port, position, speed, max_power, end_state))
+
+    def battery(self):
+        """
+        battery level pushed by the hub, needs properties=True
+
+        :returns: battery level in % or None if not reported yet
+        """
+        return self.__properties.value(HubProperty.BATTERY_VOLTAGE) if self.__properties else None
+
+    def rssi(self):
+        """
+        signal strength pushed by the hub, needs properties=True
+
+        :returns: rssi in dBm or None if not reported yet
+        """
+        return self.__properties.value(HubProperty.RSSI) if self.__properties else None
+
+    def hub_property(self, prop):
+        """
+        latest value of a hub property pushed by the hub, needs properties=True
+
+        :param prop: property id, use HubProperty class (BUTTON, RSSI, BATTERY_VOLTAGE)
+        :returns: (value, age in ms) or None if not reported yet
+        """
+        return self.__properties.get(prop) if self.__properties else None
+
+    def on_property(self, callback):
+        """
+        create a callback for hub property updates, needs properties=True
+
+        :param callback: callback function, contains property id and value
+        :returns: nothing
+        """
+        if self.__properties:
+            self.__properties.callback = callback
+
+    def subscribe(self, port, mode, handler, delta=1, fmt=None):
+        """
+        subscribe to the values of a mode of an attached device, replaces the
+        previous subscription of the port
+
+        :param port: port of the device
+        :param mode: mode of the device
+        :param handler: callback function, contains port and value, a tuple if the mode has several values
+        :param delta: change of the value which triggers a notification
+        :param fmt: struct format of the values, default is the known format of the device and mode
+        :returns: nothing
+        """
+        fmt = fmt or self.__format(port, mode)
+        self.__values.add(port, fmt, handler)
+        self.__modes[port] = mode
+        self.__handler.write(bytes(self.__encoder.port_input_format_setup(port, mode, delta)))
+
+    def subscribe_combined(self, port, modes, handler, delta=1, formats=None):
+        """
+        subscribe to the values of several modes of an attached device in one
+        notification, replaces the previous subscription of the port
+
+        :param port: port of the device
+        :param modes: modes of the device
+        :param handler: callback function, contains port and tuple of the values of all modes in order
+        :param delta: change of a value which triggers a notification
+        :param formats: struct formats of the values per mode, default are the known formats of the device
+        :returns: nothing
+        """
+        # every value of a mode is a dataset of its own
+        parts = []
+        mode_datasets = []
+        for index, mode in enumerate(modes):
+            fmt = formats[index] if formats else self.__format(port, mode)
+            for dataset, part in enumerate(fmt.lstrip("<")):
+                parts.append(part)
+                mode_datasets.append(mode << 4 | dataset)
+        self.__values.add_combined(port, parts, handler)
+        self.__modes[port] = tuple(modes)
+        encoder = self.__encoder
+        self.__handler.write(bytes(encoder.port_input_format_setup_combined(port, CombinedSetup.LOCK)))
+        for mode in modes:
+            self.__handler.write(bytes(encoder.port_input_format_setup(port, mode, delta)))
+        self.__handler.write(bytes(encoder.port_input_format_setup_combined(port, CombinedSetup.SET_MODE_DATASET,
+                                                                           mode_datasets)))
+        self.__handler.write(bytes(encoder.port_input_format_setup_combined(port, CombinedSetup.UNLOCK_ENABLED)))
+
+    def unsubscribe(self, port, mode=None):
+        """
+        stop the values of a port, a combined subscription leaves the combined mode
+
+        :param port: port of the device
+        :param mode: mode of the device to disable, default is the subscribed mode or 0
+        :returns: nothing
+        """
+        self.__values.remove(port)
+        modes = self.__modes.pop(port, 0)
+        encoder = self.__encoder
+        if isinstance(modes, tuple):
+            self.__handler.write(bytes(encoder.port_input_format_setup_combined(port, CombinedSetup.RESET)))
+        else:
+            modes = (modes,)
+        for subscribed in modes if mode is None else (mode,):
+            self.__handler.write(bytes(encoder.port_input_format_setup(port, subscribed, notify=False)))
+
+    def batch(self):
+        """
+        collect the following commands and send them together when the batch
+        ends, use it as `with hub.batch():` or call flush()
+
+        :returns: the hub
+        """
+        self.__batching = True
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def flush(self):
+        """
+        send the batched commands, as few writes as the mtu allows
+
+        :returns: nothing
+        """
+        self.__batching = False
+        batch = self.__batch
+        start = 0
+        end = 0
+        while end < self.__batch_size:
+            size = batch[end]
+            if end + size - start > self.__mtu and end > start:
+                self.__handler.write(batch[start:end])
+                start = end
+            end += size
+        if start < end:
+            self.__handler.write(batch[start:end])
+        self.__batch_size = 0
+
+    def process(self):
+        """
+        handle buffered notifications, only needed with buffer when polling
+
+        :returns: number of handled notifications
+        """
+        return self.__handler.drain()
+
+    def write_stats(self):
+        """
+        statistics of the outbound write queue
+
+        :returns: dict with queue depth, coalesced, dropped and retried writes
+        """
+        return self.__handler.write_stats()
+
+    def on_connect(self, callback):
+        """
+        create a callback for on connect actions
+
+        :param callback: callback function
+        :returns: nothing
+        """
+        self.__connect_callback = callback
+
+    def on_disconnect(self, callback):
+        """
+        create a callback for on disconnect actions
+
+        :param callback: callback function
+        :returns: nothing
+        """
+        self.__disconnect_callback = callback
+
+    def on_attach(self, callback):
+        """
+        create a callback for attached and detached devices
+
+        :param callback: callback function, contains port and io type id, None if detached
+        :returns: nothing
+        """
+        self.__attach_callback = callback
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __send(self, port, message):
+        # the encoder reuses its buffers, queued messages are copies
+        if not self.__batching:
+            self.__handler.write(bytes(message), key=port)
+            return
+        size = len(message)
+        if self.__batch_size + size > len(self.__batch):
+            self.flush()
+            self.__batching = True
+        self.__batch[self.__batch_size:self.__batch_size + size] = message
+        self.__batch_size += size
+
+    def __format(self, port, mode):
+        fmt = MODE_FORMATS.get((self.__devices.get(port), mode))
+        if fmt is None:
+            raise ValueError("unknown format of mode %d at port %d, pass fmt" % (mode, port))
+        return fmt
+
+    def __on_scan(self, addr_type, addr, man_data):
+        # other devices with the LEGO service may send no or short manufacturer data
+        if not addr or not man_data or len(man_data[2]) < 2 or man_data[2][1] not in self.__system_types:
+            return
+        if not self.__address or self.__address == addr:
+            self.__handler.connect(addr_type, addr)
+
+    def __on_connect(self):
+        # the hub reports the attached devices when notifications are enabled
+        addr_type, addr, value_handle = self.__handler.device()
+        self.__handler.write(_NOTIFY_ENABLE, value_handle + _CCCD_OFFSET, callback=self.__on_handshake)
+        if self.__properties:
+            # the hub pushes a property when it changes, no polling
+            for prop in (HubProperty.BATTERY_VOLTAGE, HubProperty.RSSI, HubProperty.BUTTON):
+                self.__handler.write(bytes(self.__encoder.hub_property(prop, HubProperty.ENABLE_UPDATES)))
+
+    def __on_handshake(self, status):
+        if status != 0:
+            # notifications are not enabled, the hub is not usable
+            self.__handler.disconnect()
+            return
+        if self.__connect_callback:
+            self.__connect_callback()
+
+    def __on_disconnect(self):
+        self.__devices = {}
+        self.__values.clear()
+        self.__modes = {}
+        if self.__disconnect_callback:
+            self.__disconnect_callback()
+
+    def __on_attached_io(self, data, offset):
+        port = data[offset]
+        if data[offset + 1] == _IO_DETACHED:
+            self.__devices.pop(port, None)
+            io_type = None
+        else:
+            io_type = data[offset + 2] | data[offset + 3] << 8
+            self.__devices[port] = io_type
+        if self.__attach_callback:
+            self.__attach_callback(port, io_type)
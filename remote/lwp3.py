@@ -0,0 +1,545 @@
+from micropython import const
+import struct
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Codec of the LEGO(R) Wireless Protocol 3.0 (LWP3).
+Encoders write into preallocated buffers with
+struct.pack_into, incoming messages are dispatched
+by message type through a table of callbacks.
+"""
+
+
+class MessageType:
+    """
+    LWP3 message types
+    """
+
+    def __init__(self):
+        pass
+
+    HUB_PROPERTIES = const(0x01)
+    HUB_ACTIONS = const(0x02)
+    HUB_ALERTS = const(0x03)
+    HUB_ATTACHED_IO = const(0x04)
+    GENERIC_ERROR = const(0x05)
+    HW_NETWORK_COMMANDS = const(0x08)
+    PORT_INFORMATION_REQUEST = const(0x21)
+    PORT_MODE_INFORMATION_REQUEST = const(0x22)
+    PORT_INPUT_FORMAT_SETUP = const(0x41)
+    PORT_INPUT_FORMAT_SETUP_COMBINED = const(0x42)
+    PORT_INFORMATION = const(0x43)
+    PORT_MODE_INFORMATION = const(0x44)
+    PORT_VALUE = const(0x45)
+    PORT_VALUE_COMBINED = const(0x46)
+    PORT_INPUT_FORMAT = const(0x47)
+    PORT_INPUT_FORMAT_COMBINED = const(0x48)
+    VIRTUAL_PORT_SETUP = const(0x61)
+    PORT_OUTPUT_COMMAND = const(0x81)
+    PORT_OUTPUT_FEEDBACK = const(0x82)
+
+
+class HubProperty:
+    """
+    LWP3 hub properties and their operations
+    """
+
+    def __init__(self):
+        pass
+
+    # properties
+    NAME = const(0x01)
+    BUTTON = const(0x02)
+    FW_VERSION = const(0x03)
+    HW_VERSION = const(0x04)
+    RSSI = const(0x05)
+    BATTERY_VOLTAGE = const(0x06)
+    BATTERY_TYPE = const(0x07)
+    MANUFACTURER_NAME = const(0x08)
+    RADIO_FW_VERSION = const(0x09)
+    LWP_VERSION = const(0x0A)
+    SYSTEM_TYPE_ID = const(0x0B)
+    HW_NETWORK_ID = const(0x0C)
+    PRIMARY_MAC = const(0x0D)
+    SECONDARY_MAC = const(0x0E)
+    HW_NETWORK_FAMILY = const(0x0F)
+
+    # operations, no const(): the names of const() are module wide and HubAlert has them with other values
+    SET = 0x01
+    ENABLE_UPDATES = 0x02
+    DISABLE_UPDATES = 0x03
+    RESET = 0x04
+    REQUEST_UPDATE = 0x05
+    UPDATE = 0x06
+
+
+class HubAlert:
+    """
+    LWP3 hub alerts and their operations
+    """
+
+    def __init__(self):
+        pass
+
+    # alerts
+    LOW_VOLTAGE = const(0x01)
+    HIGH_CURRENT = const(0x02)
+    LOW_SIGNAL = const(0x03)
+    OVER_POWER = const(0x04)
+
+    # operations, no const(), see HubProperty
+    ENABLE_UPDATES = 0x01
+    DISABLE_UPDATES = 0x02
+    REQUEST_UPDATE = 0x03
+    UPDATE = 0x04
+
+
+class PortOutput:
+    """
+    LWP3 port output sub commands, startup and completion flags and end states
+    """
+
+    def __init__(self):
+        pass
+
+    # sub commands
+    START_POWER_DUAL = const(0x02)
+    SET_ACC_TIME = const(0x05)
+    SET_DEC_TIME = const(0x06)
+    START_SPEED = const(0x07)
+    START_SPEED_DUAL = const(0x08)
+    START_SPEED_FOR_TIME = const(0x09)
+    START_SPEED_FOR_DEGREES = const(0x0B)
+    GOTO_ABSOLUTE_POSITION = const(0x0D)
+    WRITE_DIRECT = const(0x50)
+    WRITE_DIRECT_MODE_DATA = const(0x51)
+
+    # startup and completion information
+    BUFFER = const(0x00)
+    IMMEDIATELY = const(0x10)
+    FEEDBACK = const(0x01)
+
+    # end states
+    FLOAT = const(0)
+    HOLD = const(126)
+    BRAKE = const(127)
+
+
+class CombinedSetup:
+    """
+    LWP3 sub commands of the port input format setup (combined)
+    """
+
+    def __init__(self):
+        pass
+
+    SET_MODE_DATASET = const(0x01)
+    LOCK = const(0x02)
+    UNLOCK_ENABLED = const(0x03)
+    UNLOCK_DISABLED = const(0x04)
+    RESET = const(0x06)
+
+
+class IOType:
+    """
+    LWP3 io type ids of motors and sensors
+    """
+
+    def __init__(self):
+        pass
+
+    MOTOR = const(0x01)
+    TRAIN_MOTOR = const(0x02)
+    LIGHT = const(0x08)
+    VOLTAGE = const(0x14)
+    CURRENT = const(0x15)
+    RGB_LIGHT = const(0x17)
+    WEDO_TILT = const(0x22)
+    WEDO_DISTANCE = const(0x23)
+    COLOR_DISTANCE = const(0x25)
+    MEDIUM_LINEAR_MOTOR = const(0x26)
+    MOVE_HUB_MOTOR = const(0x27)
+    MOVE_HUB_TILT = const(0x28)
+    TECHNIC_LARGE_MOTOR = const(0x2E)
+    TECHNIC_XL_MOTOR = const(0x2F)
+    SPIKE_MEDIUM_MOTOR = const(0x30)
+    SPIKE_LARGE_MOTOR = const(0x31)
+    REMOTE_BUTTONS = const(0x37)
+    TECHNIC_HUB_TILT = const(0x3B)
+    TECHNIC_COLOR = const(0x3D)
+    TECHNIC_DISTANCE = const(0x3E)
+
+
+# header of messages shorter than 128 bytes: length, hub id, message type
+_HEADER_SIZE = const(3)
+
+# message formats after the length byte
+_PORT_INPUT_FORMAT_SETUP = "<BBBBIB"
+_START_SPEED = "<BBBBBbBB"
+_START_POWER = "<BBBBBBb"
+_GOTO_ABSOLUTE_POSITION = "<BBBBBiBBBB"
+_WRITE_DIRECT_MODE_DATA = "<BBBBBBB"
+_HUB_MESSAGE = "<BBBB"
+_COMBINED_SETUP = "<BBBB"
+_COMBINED_MAX_MODES = const(8)
+
+# struct format of the values of (io type, mode), little endian
+_MOTOR_MODES = ((0x01, "<b"), (0x02, "<i"), (0x03, "<h"))
+MODE_FORMATS = {
+    (IOType.VOLTAGE, 0x00): "<h",
+    (IOType.CURRENT, 0x00): "<h",
+    (IOType.WEDO_TILT, 0x00): "<bb",
+    (IOType.WEDO_DISTANCE, 0x00): "<b",
+    (IOType.COLOR_DISTANCE, 0x00): "<b",
+    (IOType.COLOR_DISTANCE, 0x01): "<b",
+    (IOType.COLOR_DISTANCE, 0x08): "<bbbb",
+    (IOType.MOVE_HUB_TILT, 0x00): "<bb",
+    (IOType.REMOTE_BUTTONS, 0x00): "<b",
+    (IOType.TECHNIC_HUB_TILT, 0x00): "<hhh",
+    (IOType.TECHNIC_COLOR, 0x00): "<b",
+    (IOType.TECHNIC_COLOR, 0x01): "<h",
+    (IOType.TECHNIC_DISTANCE, 0x00): "<h",
+}
+for _motor in (IOType.MEDIUM_LINEAR_MOTOR, IOType.MOVE_HUB_MOTOR, IOType.TECHNIC_LARGE_MOTOR,
+               IOType.TECHNIC_XL_MOTOR, IOType.SPIKE_MEDIUM_MOTOR, IOType.SPIKE_LARGE_MOTOR):
+    for _mode, _format in _MOTOR_MODES:
+        if _mode < 0x03 or _motor > IOType.MOVE_HUB_MOTOR:
+            MODE_FORMATS[(_motor, _mode)] = _format
+
+
+def header(data):
+    """
+    parse the common header of a message
+
+    :param data: message bytes
+    :returns: (length, hub id, message type, offset of the payload)
+    """
+    length = data[0]
+    offset = 1
+    if length & 0x80:
+        length = (length & 0x7F) | (data[1] << 7)
+        offset = 2
+    return length, data[offset], data[offset + 1], offset + 2
+
+
+class Dispatcher:
+    """
+    Table driven dispatch of incoming messages by message type
+    """
+
+    def __init__(self):
+        """
+        create instance of Dispatcher
+        """
+        self.__table = [None] * 256
+        self.__unknown = None
+        self.dispatched = 0
+        self.dropped = 0
+
+    def on(self, message_type, callback):
+        """
+        register the callback of a message type, replaces the previous one
+
+        :param message_type: message type, use MessageType class
+        :param callback: callback function, contains message bytes and payload offset, None to remove
+        :returns: nothing
+        """
+        self.__table[message_type] = callback
+
+    def on_unknown(self, callback):
+        """
+        create a callback for messages without a registered callback
+
+        :param callback: callback function, contains message bytes and payload offset
+        :returns: nothing
+        """
+        self.__unknown = callback
+
+    def dispatch(self, data):
+        """
+        call the callback of the message type, the header is parsed without allocation
+
+        :param data: message bytes
+        :returns: True if a callback handled the message
+        """
+        if len(data) < _HEADER_SIZE:
+            self.dropped += 1
+            return False
+        offset = 1
+        if data[0] & 0x80:
+            offset = 2
+            if len(data) < _HEADER_SIZE + 1:
+                self.dropped += 1
+                return False
+        callback = self.__table[data[offset + 1]]
+        if callback is None:
+            callback = self.__unknown
+            if callback is None:
+                self.dropped += 1
+                return False
+        self.dispatched += 1
+        callback(data, offset + 2)
+        return True
+
+
+class PortValues:
+    """
+    Decoder of port value (single and combined) messages, every subscribed port has
+    a precomputed struct format and a handler, no parsing of the message per value
+    """
+
+    def __init__(self, dispatcher):
+        """
+        create instance of PortValues, registers at the dispatcher
+
+        :param dispatcher: Dispatcher of the incoming messages
+        """
+        # port -> [handler, format, single value, (parts, (format, size) per combined dataset pointer), size of format]
+        self.__ports = {}
+        self.decoded = 0
+        self.dropped = 0
+        dispatcher.on(MessageType.PORT_VALUE, self.__on_value)
+        dispatcher.on(MessageType.PORT_VALUE_COMBINED, self.__on_combined)
+
+    def add(self, port, fmt, handler):
+        """
+        decode the values of a port with a struct format
+
+        :param port: port id
+        :param fmt: struct format of the values of the mode
+        :param handler: callback function, contains port and value, a tuple if the mode has several values
+        :returns: nothing
+        """
+        size = struct.calcsize(fmt)
+        self.__ports[port] = [handler, fmt, len(struct.unpack_from(fmt, bytes(size))) == 1, None, size]
+
+    def add_combined(self, port, formats, handler):
+        """
+        decode the combined values of a port, one struct format per mode dataset
+
+        :param port: port id
+        :param formats: struct formats in the order of the mode datasets
+        :param handler: callback function, contains port and tuple of all values
+        :returns: nothing
+        """
+        self.__ports[port] = [handler, None, False, (tuple(fmt.lstrip("<") for fmt in formats), {}), 0]
+
+    def remove(self, port):
+        """
+        stop decoding the values of a port
+
+        :param port: port id
+        :returns: nothing
+        """
+        self.__ports.pop(port, None)
+
+    def clear(self):
+        """
+        stop decoding the values of all ports
+
+        :returns: nothing
+        """
+        self.__ports.clear()
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __on_value(self, data, offset):
+        # a message shorter than its format is dropped, unpacking it would raise in the irq
+        if len(data) <= offset:
+            self.dropped += 1
+            return
+        entry = self.__ports.get(data[offset])
+        if entry is None or entry[1] is None or len(data) < offset + 1 + entry[4]:
+            self.dropped += 1
+            return
+        values = struct.unpack_from(entry[1], data, offset + 1)
+        self.decoded += 1
+        entry[0](data[offset], values[0] if entry[2] else values)
+
+    def __on_combined(self, data, offset):
+        if len(data) < offset + 3:
+            self.dropped += 1
+            return
+        entry = self.__ports.get(data[offset])
+        if entry is None or entry[3] is None:
+            self.dropped += 1
+            return
+        # the dataset pointer selects the values in the message, its format is built once
+        pointer = data[offset + 1] | data[offset + 2] << 8
+        parts, cache = entry[3]
+        layout = cache.get(pointer)
+        if layout is None:
+            fmt = "<" + "".join(part for index, part in enumerate(parts) if pointer & (1 << index))
+            layout = (fmt, struct.calcsize(fmt))
+            cache[pointer] = layout
+        if len(data) < offset + 3 + layout[1]:
+            self.dropped += 1
+            return
+        self.decoded += 1
+        entry[0](data[offset], struct.unpack_from(layout[0], data, offset + 3))
+
+
+class Encoder:
+    """
+    Encoder of outgoing messages, every message type has its own preallocated
+    buffer which is overwritten by the next message of the same type, copy it
+    with bytes() to keep it
+    """
+
+    def __init__(self, hub_id=0x00):
+        """
+        create instance of Encoder
+
+        :param hub_id: hub id of the messages, always 0x00 for now
+        """
+        self.__hub_id = hub_id
+        self.__port_input_format_setup = self.__buffer(10)
+        self.__start_speed = self.__buffer(9)
+        self.__start_power = self.__buffer(8)
+        self.__goto_absolute_position = self.__buffer(14)
+        self.__write_direct_mode_data = self.__buffer(8)
+        self.__hub_property = self.__buffer(5)
+        self.__hub_alert = self.__buffer(5)
+        self.__combined_setup = bytearray(6 + _COMBINED_MAX_MODES)
+
+    def port_input_format_setup(self, port, mode, delta=1, notify=True):
+        """
+        port input format setup (single), subscribes to the values of a mode
+
+        :param port: port id
+        :param mode: mode of the attached device
+        :param delta: change of the value which triggers a notification
+        :param notify: enable notifications
+        :returns: message buffer
+        """
+        buffer = self.__port_input_format_setup
+        struct.pack_into(_PORT_INPUT_FORMAT_SETUP, buffer, 1, self.__hub_id,
+                         MessageType.PORT_INPUT_FORMAT_SETUP, port, mode, delta, 1 if notify else 0)
+        return buffer
+
+    def start_speed(self, port, speed, max_power=100, use_profile=0,
+                    startup=PortOutput.IMMEDIATELY | PortOutput.FEEDBACK):
+        """
+        port output command start speed
+
+        :param port: port id
+        :param speed: speed in % from -100 to 100, 0 brakes
+        :param max_power: maximum power in %
+        :param use_profile: acceleration and deceleration profile
+        :param startup: startup and completion information, use PortOutput class
+        :returns: message buffer
+        """
+        buffer = self.__start_speed
+        struct.pack_into(_START_SPEED, buffer, 1, self.__hub_id, MessageType.PORT_OUTPUT_COMMAND, port, startup,
+                         PortOutput.START_SPEED, speed, max_power, use_profile)
+        return buffer
+
+    def start_power(self, port, power, startup=PortOutput.IMMEDIATELY | PortOutput.FEEDBACK):
+        """
+        port output command start power, sent as direct mode data of mode 0
+
+        :param port: port id
+        :param power: power in % from -100 to 100, 0 floats, 127 brakes
+        :param startup: startup and completion information, use PortOutput class
+        :returns: message buffer
+        """
+        buffer = self.__start_power
+        struct.pack_into(_START_POWER, buffer, 1, self.__hub_id, MessageType.PORT_OUTPUT_COMMAND, port, startup,
+                         PortOutput.WRITE_DIRECT_MODE_DATA, 0x00, power)
+        return buffer
+
+    def goto_absolute_position(self, port, position, speed, max_power=100, end_state=PortOutput.BRAKE,
+                               use_profile=0, startup=PortOutput.IMMEDIATELY | PortOutput.FEEDBACK):
+        """
+        port output command go to absolute position
+
+        :param port: port id
+        :param position: absolute position in degrees
+        :param speed: speed in % from 0 to 100
+        :param max_power: maximum power in %
+        :param end_state: state after the move, use PortOutput class
+        :param use_profile: acceleration and deceleration profile
+        :param startup: startup and completion information, use PortOutput class
+        :returns: message buffer
+        """
+        buffer = self.__goto_absolute_position
+        struct.pack_into(_GOTO_ABSOLUTE_POSITION, buffer, 1, self.__hub_id, MessageType.PORT_OUTPUT_COMMAND, port,
+                         startup, PortOutput.GOTO_ABSOLUTE_POSITION, position, speed, max_power, end_state, use_profile)
+        return buffer
+
+    def write_direct_mode_data(self, port, mode, value, startup=PortOutput.IMMEDIATELY | PortOutput.FEEDBACK):
+        """
+        port output command write direct mode data with a one byte value, like the color of a led
+
+        :param port: port id
+        :param mode: mode of the attached device
+        :param value: value from 0 to 255
+        :param startup: startup and completion information, use PortOutput class
+        :returns: message buffer
+        """
+        buffer = self.__write_direct_mode_data
+        struct.pack_into(_WRITE_DIRECT_MODE_DATA, buffer, 1, self.__hub_id, MessageType.PORT_OUTPUT_COMMAND, port,
+                         startup, PortOutput.WRITE_DIRECT_MODE_DATA, mode, value)
+        return buffer
+
+    def hub_property(self, prop, operation):
+        """
+        hub property message without payload
+
+        :param prop: property, use HubProperty class
+        :param operation: operation, use HubProperty class
+        :returns: message buffer
+        """
+        buffer = self.__hub_property
+        struct.pack_into(_HUB_MESSAGE, buffer, 1, self.__hub_id, MessageType.HUB_PROPERTIES, prop, operation)
+        return buffer
+
+    def hub_alert(self, alert, operation):
+        """
+        hub alert message
+
+        :param alert: alert, use HubAlert class
+        :param operation: operation, use HubAlert class
+        :returns: message buffer
+        """
+        buffer = self.__hub_alert
+        struct.pack_into(_HUB_MESSAGE, buffer, 1, self.__hub_id, MessageType.HUB_ALERTS, alert, operation)
+        return buffer
+
+    def port_input_format_setup_combined(self, port, subcommand, mode_datasets=()):
+        """
+        port input format setup (combined), sets up the values of several modes in one notification
+
+        :param port: port id
+        :param subcommand: sub command, use CombinedSetup class
+        :param mode_datasets: mode << 4 | dataset per value, only for SET_MODE_DATASET
+        :returns: message buffer, the combination index is always 0
+        """
+        count = len(mode_datasets)
+        if count > _COMBINED_MAX_MODES:
+            raise ValueError("at most %d mode datasets" % _COMBINED_MAX_MODES)
+        size = 5 + (count + 1 if subcommand == CombinedSetup.SET_MODE_DATASET else 0)
+        buffer = memoryview(self.__combined_setup)[:size]
+        buffer[0] = size
+        struct.pack_into(_COMBINED_SETUP, buffer, 1, self.__hub_id, MessageType.PORT_INPUT_FORMAT_SETUP_COMBINED,
+                         port, subcommand)
+        if size > 5:
+            buffer[5] = 0x00
+            buffer[6:size] = bytes(mode_datasets)
+        return buffer
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __buffer(self, size):
+        # the length byte of a message type never changes
+        buffer = bytearray(size)
+        buffer[0] = size
+        return buffer
@@ -0,0 +1,374 @@
+from micropython import const, schedule
+import ubluetooth
+import struct
+from utime import ticks_us, ticks_diff, sleep_us
+from remote.control import _manager
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Capture and replay of the BLE events of a session.
+Every event of the radio is stored as a fixed size
+record (ticks_us, event code, conn handle, payload),
+records are collected in RAM and appended to the file
+in batches. A trace is fed back into the library at
+the original or an accelerated speed, also on a host.
+"""
+
+# file header: magic, version, record size
+_MAGIC = b'PUTR'
+_VERSION = const(2)
+_FILE_HEADER = "<4sBB2x"
+_FILE_HEADER_SIZE = const(8)
+
+# record header: ticks_us, event code, conn handle, flags, payload length,
+# the conn handle is only set with the flag, a failed connect reports 0xFFFF
+_RECORD_HEADER = "<IHHBB"
+_RECORD_HEADER_SIZE = const(10)
+_HAS_CONNECTION = const(0x01)
+
+_IRQ_SCAN_RESULT = const(1 << 4)
+_IRQ_SCAN_COMPLETE = const(1 << 5)
+_IRQ_PERIPHERAL_CONNECT = const(1 << 6)
+_IRQ_PERIPHERAL_DISCONNECT = const(1 << 7)
+_IRQ_GATTC_SERVICE_RESULT = const(1 << 8)
+_IRQ_GATTC_CHARACTERISTIC_RESULT = const(1 << 9)
+_IRQ_GATTC_READ_RESULT = const(1 << 11)
+_IRQ_GATTC_WRITE_STATUS = const(1 << 12)
+_IRQ_GATTC_NOTIFY = const(1 << 13)
+
+# payload of the events after the conn handle: fixed fields, kind of the tail, size of the fixed fields
+_TAIL_NONE = const(0)
+_TAIL_BYTES = const(1)
+_TAIL_UUID = const(2)
+_PAYLOADS = {
+    _IRQ_SCAN_RESULT: ("<B6sBb", _TAIL_BYTES, 9),
+    _IRQ_SCAN_COMPLETE: ("", _TAIL_NONE, 0),
+    _IRQ_PERIPHERAL_CONNECT: ("<B6s", _TAIL_NONE, 7),
+    _IRQ_PERIPHERAL_DISCONNECT: ("<B6s", _TAIL_NONE, 7),
+    _IRQ_GATTC_SERVICE_RESULT: ("<HH", _TAIL_UUID, 4),
+    _IRQ_GATTC_CHARACTERISTIC_RESULT: ("<HHB", _TAIL_UUID, 5),
+    _IRQ_GATTC_READ_RESULT: ("<H", _TAIL_BYTES, 2),
+    _IRQ_GATTC_WRITE_STATUS: ("<HH", _TAIL_NONE, 4),
+    _IRQ_GATTC_NOTIFY: ("<H", _TAIL_BYTES, 2),
+}
+
+# record sizes, the header and the largest fixed fields up to the size byte of the file header
+_MIN_RECORD_SIZE = const(19)
+_MAX_RECORD_SIZE = const(255)
+
+
+def record(path, ble=None, batch=32, size=50):
+    """
+    record the events of a radio into a trace file, replaces an existing file
+
+    :param path: trace file
+    :param ble: BLE object of the remotes and hubs, default is ubluetooth.BLE()
+    :param batch: records kept in RAM before they are appended to the file
+    :param size: record size in bytes, 19 to 255, longer payloads are truncated
+    :returns: TraceRecorder, stop it with stop()
+    """
+    recorder = TraceRecorder(path, batch, size)
+    recorder.start(_manager(ble))
+    return recorder
+
+
+class TraceRecorder:
+    """
+    Records events into two preallocated batches, a full batch is appended
+    to the file from micropython.schedule while the other one fills
+    """
+
+    def __init__(self, path, batch=32, size=50):
+        """
+        create instance of TraceRecorder, writes the file header
+
+        :param path: trace file
+        :param batch: records kept in RAM before they are appended to the file
+        :param size: record size in bytes, 19 to 255, longer payloads are truncated
+        """
+        if size > _MAX_RECORD_SIZE or size < _MIN_RECORD_SIZE:
+            raise ValueError("record size must be %d to %d" % (_MIN_RECORD_SIZE, _MAX_RECORD_SIZE))
+        self.__path = path
+        self.__size = size
+        self.__batch = batch
+        self.__buffers = (bytearray(batch * size), bytearray(batch * size))
+        self.__active = 0
+        self.__count = 0
+        self.__pending = None
+        self.__flush_callback = self.__flush_pending
+        self.__manager = None
+        with open(path, 'wb') as f:
+            f.write(struct.pack(_FILE_HEADER, _MAGIC, _VERSION, size))
+
+        # instrumentation
+        self.recorded = 0
+        self.dropped = 0
+        self.truncated = 0
+        self.appends = 0
+
+    def start(self, manager):
+        """
+        start recording the events of a connection manager
+
+        :param manager: _PoweredUPManager of the radio
+        :returns: nothing
+        """
+        self.__manager = manager
+        manager.trace(self)
+
+    def stop(self):
+        """
+        stop recording and append the remaining records
+
+        :returns: nothing
+        """
+        if self.__manager:
+            self.__manager.trace(None)
+            self.__manager = None
+        self.flush()
+
+    def put(self, event, data):
+        """
+        add an event, called in the irq, does not allocate for notifications
+
+        :param event: irq event code
+        :param data: irq event data
+        :returns: True if the event was recorded
+        """
+        layout = _PAYLOADS.get(event)
+        if layout is None:
+            return False
+        if self.__count == self.__batch and not self.__swap():
+            self.dropped += 1
+            return False
+
+        buffer = self.__buffers[self.__active]
+        offset = self.__count * self.__size
+        payload = offset + _RECORD_HEADER_SIZE
+        conn_handle = None
+        tail = None
+        if event == _IRQ_GATTC_NOTIFY or event == _IRQ_GATTC_READ_RESULT:
+            conn_handle, value_handle, tail = data
+            struct.pack_into("<H", buffer, payload, value_handle)
+        elif event == _IRQ_SCAN_RESULT:
+            addr_type, addr, adv_type, rssi, tail = data
+            self.__address(buffer, payload, addr_type, addr)
+            struct.pack_into("<Bb", buffer, payload + 7, adv_type, rssi)
+        elif event == _IRQ_PERIPHERAL_CONNECT or event == _IRQ_PERIPHERAL_DISCONNECT:
+            conn_handle, addr_type, addr = data
+            self.__address(buffer, payload, addr_type, addr)
+        elif event == _IRQ_GATTC_SERVICE_RESULT:
+            conn_handle, start_handle, end_handle, tail = data
+            struct.pack_into("<HH", buffer, payload, start_handle, end_handle)
+        elif event == _IRQ_GATTC_CHARACTERISTIC_RESULT:
+            conn_handle, def_handle, value_handle, properties, tail = data
+            struct.pack_into("<HHB", buffer, payload, def_handle, value_handle, properties)
+        elif event == _IRQ_GATTC_WRITE_STATUS:
+            conn_handle, value_handle, status = data
+            struct.pack_into("<HH", buffer, payload, value_handle, status)
+
+        length = layout[2]
+        if tail is not None:
+            if layout[1] == _TAIL_UUID:
+                # only while discovering, the allocation does not matter
+                tail = bytes(tail)
+            room = self.__size - _RECORD_HEADER_SIZE - length
+            count = len(tail)
+            if count > room:
+                count = room
+                self.truncated += 1
+            # byte wise copy, slicing would allocate
+            start = payload + length
+            for i in range(count):
+                buffer[start + i] = tail[i]
+            length += count
+        if conn_handle is None:
+            struct.pack_into(_RECORD_HEADER, buffer, offset, ticks_us(), event, 0, 0, length)
+        else:
+            struct.pack_into(_RECORD_HEADER, buffer, offset, ticks_us(), event, conn_handle, _HAS_CONNECTION, length)
+        self.__count += 1
+        self.recorded += 1
+        return True
+
+    def flush(self, _=None):
+        """
+        append the recorded events to the file
+
+        :returns: nothing
+        """
+        self.__flush_pending()
+        if self.__count:
+            self.__append(self.__buffers[self.__active], self.__count)
+            self.__count = 0
+
+    def stats(self):
+        """
+        statistics of the recorder
+
+        :returns: dict with recorded, dropped and truncated events and file appends
+        """
+        return {"recorded": self.recorded, "dropped": self.dropped,
+                "truncated": self.truncated, "appends": self.appends}
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __swap(self):
+        # the full batch is written from micropython.schedule, the other one continues
+        swapped = self.__pending is None
+        if swapped:
+            self.__pending = self.__active
+            self.__active ^= 1
+            self.__count = 0
+        try:
+            schedule(self.__flush_callback, None)
+        except RuntimeError:
+            pass
+        return swapped
+
+    def __address(self, buffer, offset, addr_type, addr):
+        buffer[offset] = addr_type
+        for i in range(6):
+            buffer[offset + 1 + i] = addr[i]
+
+    def __flush_pending(self, _=None):
+        if self.__pending is None:
+            return
+        self.__append(self.__buffers[self.__pending], self.__batch)
+        self.__pending = None
+
+    def __append(self, buffer, count):
+        with open(self.__path, 'ab') as f:
+            f.write(memoryview(buffer)[:count * self.__size])
+        self.appends += 1
+
+
+class TracePlayer:
+    """
+    Reads a trace file and feeds its events into the irq handler of a radio
+    """
+
+    def __init__(self, path):
+        """
+        create instance of TracePlayer, reads the file header
+
+        :param path: trace file
+        """
+        self.__path = path
+        with open(path, 'rb') as f:
+            magic, version, size = struct.unpack(_FILE_HEADER, f.read(_FILE_HEADER_SIZE))
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("no trace file")
+        self.__size = size
+
+    def __iter__(self):
+        """
+        events of the trace
+
+        :returns: iterator of (ticks_us, event code, event data)
+        """
+        with open(self.__path, 'rb') as f:
+            f.read(_FILE_HEADER_SIZE)
+            while True:
+                record = f.read(self.__size)
+                if len(record) < self.__size:
+                    return
+                yield self.__decode(record)
+
+    def play(self, ble, speed=1):
+        """
+        feed the events into the irq handler of a radio
+
+        :param ble: radio with the registered handler, a ReplayBLE
+        :param speed: 1 is the original speed, 10 ten times faster, 0 as fast as possible
+        :returns: number of events
+        """
+        count = 0
+        previous = None
+        offset = 0
+        played = 0
+        now = ticks_us()
+        for ticks, event, data in self:
+            if previous is not None:
+                # summed from record to record, the ticks wrap in a long trace
+                offset += ticks_diff(ticks, previous)
+            previous = ticks
+            if speed:
+                # the offset of the event in the trace, scaled by the speed, against the time played so far
+                current = ticks_us()
+                played += ticks_diff(current, now)
+                now = current
+                wait = int(offset / speed) - played
+                if wait > 0:
+                    sleep_us(wait)
+            ble.handler(event, data)
+            count += 1
+        return count
+
+    """
+    private functions
+    -----------------
+    """
+
+    def __decode(self, record):
+        ticks, event, conn_handle, flags, length = struct.unpack_from(_RECORD_HEADER, record)
+        fmt, tail, size = _PAYLOADS[event]
+        fields = struct.unpack_from(fmt, record, _RECORD_HEADER_SIZE) if fmt else ()
+        if flags & _HAS_CONNECTION:
+            fields = (conn_handle,) + fields
+        if tail != _TAIL_NONE:
+            data = record[_RECORD_HEADER_SIZE + size:_RECORD_HEADER_SIZE + length]
+            fields += (ubluetooth.UUID(data) if tail == _TAIL_UUID else memoryview(data),)
+        if event == _IRQ_SCAN_RESULT:
+            # the address is in the middle of the fixed fields
+            fields = fields[:1] + (memoryview(fields[1]),) + fields[2:]
+        return ticks, event, fields
+
+
+class ReplayBLE:
+    """
+    Radio without a radio for the replay, commands of the library are counted,
+    the events come from TracePlayer.play
+    """
+
+    def __init__(self):
+        """
+        create instance of ReplayBLE
+        """
+        self.handler = None
+        self.commands = 0
+
+    def active(self, active=None):
+        return True
+
+    def config(self, name):
+        return b'\x00' * 6 if name == 'mac' else None
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def gap_scan(self, *args):
+        self.commands += 1
+
+    def gap_connect(self, *args):
+        self.commands += 1
+
+    def gap_disconnect(self, conn_handle):
+        self.commands += 1
+        return True
+
+    def gattc_discover_services(self, conn_handle):
+        self.commands += 1
+
+    def gattc_discover_characteristics(self, *args):
+        self.commands += 1
+
+    def gattc_read(self, conn_handle, value_handle):
+        self.commands += 1
+
+    def gattc_write(self, *args):
+        self.commands += 1
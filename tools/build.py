@@ -0,0 +1,438 @@
+import ast
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+"""
+LEGO(R) SPIKE PRIME + POWERED UP
+--------------------------------
+
+Build of the precompiled library variants:
+
+minimal   PoweredUPRemote and its scheduler, without debug output, company names and docstrings
+full      all modules without debug output and docstrings
+debug     all modules as they are, with remote/debug
+
+The sources of a variant are stripped on the host: the build features
+of remote/control are turned off and the code behind them removed, then
+docstrings, unused top level definitions and unused methods of private
+classes. The stripped sources are written to <out>/<variant>/remote and
+compiled with mpy-cross, use the mpy-cross of the hub firmware (1.12 for
+the ubluetooth api of the library). The report lists the source and
+bytecode size per module and the heap of the import and of a connected
+remote, measured with the host stand-ins in a fresh interpreter. A use
+of an underscore const above its definition fails the build.
+
+python3 tools/build.py [--variant minimal] [--mpy-cross path] [--out dist]
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALL_MODULES = ("control", "lwp3", "hub", "buttons", "aio", "trace", "companies")
+
+# variant -> (modules, kept names of remote/control or None for all, features turned off, strip)
+VARIANTS = {
+    "minimal": (("control",), ("PoweredUPRemote", "PoweredUPButtons", "PoweredUPColors", "PoweredUPScheduler"),
+                ("_DEBUG", "_COMPANY_NAMES"), True),
+    "full": (ALL_MODULES, None, ("_DEBUG",), True),
+    "debug": (ALL_MODULES + ("debug",), None, (), False),
+}
+
+
+class _Features(ast.NodeTransformer):
+    """
+    Replaces the features turned off by False and removes the code behind them
+    """
+
+    def __init__(self, disabled):
+        self.__disabled = disabled
+
+    def visit_Name(self, node):
+        if node.id in self.__disabled and isinstance(node.ctx, ast.Load):
+            return ast.copy_location(ast.Constant(False), node)
+        return node
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.And):
+            return node
+        values = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                if not value.value:
+                    return ast.copy_location(ast.Constant(False), node)
+            else:
+                values.append(value)
+        if not values:
+            return ast.copy_location(ast.Constant(True), node)
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        if isinstance(node.test, ast.Constant):
+            return node.body if node.test.value else node.orelse
+        return node
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.test, ast.Constant):
+            return node.body if node.test.value else node.orelse
+        return node
+
+
+def _is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def _strip_docstrings(tree):
+    """
+    remove the docstrings and the string statements like the private functions headers
+
+    :param tree: module ast
+    :returns: nothing
+    """
+    for node in ast.walk(tree):
+        for field in ("body", "orelse", "finalbody"):
+            body = getattr(node, field, None)
+            if isinstance(body, list) and body and isinstance(body[0], ast.stmt):
+                setattr(node, field, [statement for statement in body if not _is_docstring(statement)])
+
+
+def _fill_empty(tree):
+    """
+    put a pass into the blocks which lost all statements
+
+    :param tree: module ast
+    :returns: nothing
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.If, ast.For, ast.While, ast.With, ast.Try,
+                             ast.ExceptHandler)) and not node.body:
+            node.body = [ast.Pass()]
+
+
+def _names(node):
+    """
+    names a node loads or declares global
+
+    :param node: ast node
+    :returns: set of names
+    """
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            names.add(child.id)
+        elif isinstance(child, ast.Global):
+            names.update(child.names)
+    return names
+
+
+def _attributes(trees):
+    """
+    attribute names used by the modules
+
+    :param trees: module asts
+    :returns: set of names
+    """
+    return {node.attr for tree in trees for node in ast.walk(tree) if isinstance(node, ast.Attribute)}
+
+
+def _defined(node):
+    # name of a top level definition, None for statements which always stay
+    if isinstance(node, (ast.ClassDef, ast.FunctionDef)):
+        return node.name
+    if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+        return node.targets[0].id
+    return None
+
+
+def _prune_definitions(tree, roots):
+    """
+    remove the top level definitions which are not reachable from the roots
+
+    :param tree: module ast
+    :param roots: names to keep
+    :returns: removed names
+    """
+    definitions = {}
+    for node in tree.body:
+        name = _defined(node)
+        if name:
+            definitions.setdefault(name, []).append(node)
+    reachable = set()
+    pending = list(roots)
+    for node in tree.body:
+        if not _defined(node):
+            pending.extend(_names(node))
+    while pending:
+        name = pending.pop()
+        if name in reachable or name not in definitions:
+            continue
+        reachable.add(name)
+        for node in definitions[name]:
+            pending.extend(_names(node))
+    tree.body = [node for node in tree.body if not _defined(node) or _defined(node) in reachable]
+    return sorted(set(definitions) - reachable)
+
+
+def _prune_methods(trees):
+    """
+    remove unused methods: private ones of all classes, all of private classes,
+    dunder and decorated methods stay
+
+    :param trees: module asts, a method is used if any module accesses it as attribute
+    :returns: removed Class.method names
+    """
+    removed = []
+    changed = True
+    while changed:
+        changed = False
+        used = _attributes(trees)
+        for tree in trees:
+            for cls in tree.body:
+                if not isinstance(cls, ast.ClassDef):
+                    continue
+                body = []
+                for node in cls.body:
+                    if isinstance(node, ast.FunctionDef) and not node.decorator_list and \
+                            not (node.name.startswith("__") and node.name.endswith("__")) and \
+                            (cls.name.startswith("_") or node.name.startswith("__")) and node.name not in used:
+                        removed.append("%s.%s" % (cls.name, node.name))
+                        changed = True
+                    else:
+                        body.append(node)
+                cls.body = body
+    return removed
+
+
+def _imported(trees, module):
+    """
+    names the modules import from a module of the library
+
+    :param trees: module asts
+    :param module: module name like control
+    :returns: set of names
+    """
+    names = set()
+    for tree in trees:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.module == "remote." + module:
+                names.update(alias.name for alias in node.names)
+    return names
+
+
+def strip(variant):
+    """
+    stripped sources of a variant
+
+    :param variant: name of the variant
+    :returns: (dict of module -> source, list of removed names)
+    """
+    modules, roots, disabled, strip_code = VARIANTS[variant]
+    sources = {}
+    for module in modules:
+        with open(os.path.join(ROOT, "remote", module + ".py")) as f:
+            sources[module] = f.read()
+    if not strip_code:
+        return sources, []
+
+    trees = {}
+    for module, source in sources.items():
+        tree = _Features(set(disabled)).visit(ast.parse(source))
+        _strip_docstrings(tree)
+        trees[module] = tree
+
+    removed = []
+    for module, tree in trees.items():
+        # the public names, or the given ones of remote/control, and the names other modules import
+        keep = set(roots) if roots is not None and module == "control" else \
+            {name for name in map(_defined, tree.body) if name and not name.startswith("_")}
+        keep.update(_imported([other for name, other in trees.items() if name != module], module))
+        removed += ["%s.%s" % (module, name) for name in _prune_definitions(tree, keep)]
+    removed += _prune_methods(list(trees.values()))
+
+    for module, tree in trees.items():
+        _fill_empty(tree)
+        source = ast.unparse(ast.fix_missing_locations(tree)) + "\n"
+        # the stripped source must still compile
+        compile(source, module, "exec")
+        sources[module] = source
+    return sources, removed
+
+
+def _check_consts(source, name):
+    """
+    fail on underscore consts loaded before their definition, mpy-cross only folds
+    the consts it has seen, a use above the definition is a global load which is a
+    NameError on the hub because underscore consts are not stored as globals
+
+    :param source: module source
+    :param name: module name in the error
+    :returns: nothing
+    """
+    tree = ast.parse(source)
+    defined = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and node.targets[0].id.startswith("_") and isinstance(node.value, ast.Call) \
+                and isinstance(node.value.func, ast.Name) and node.value.func.id == "const":
+            defined.setdefault(node.targets[0].id, node.lineno)
+    early = sorted((node.lineno, node.id) for node in ast.walk(tree)
+                   if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+                   and node.lineno < defined.get(node.id, 0))
+    if early:
+        raise RuntimeError("consts of %s used before their definition: %s" %
+                           (name, ", ".join("%s in line %d" % (const, line) for line, const in early)))
+
+
+def _mpy_cross(path=None):
+    """
+    command of mpy-cross: the given path, the mpy_cross package or mpy-cross on the PATH
+
+    :param path: path of mpy-cross
+    :returns: command list or None
+    """
+    if path:
+        return [path]
+    try:
+        import mpy_cross
+        return [mpy_cross.mpy_cross]
+    except ImportError:
+        pass
+    found = shutil.which("mpy-cross")
+    return [found] if found else None
+
+
+def compile_mpy(command, source, target, name):
+    """
+    compile a source with mpy-cross
+
+    :param command: mpy-cross command
+    :param source: path of the source
+    :param target: path of the .mpy
+    :param name: source name in tracebacks
+    :returns: size of the .mpy in bytes
+    """
+    result = subprocess.run(command + ["-s", name, "-o", target, source], stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode:
+        raise RuntimeError("mpy-cross failed for %s: %s" % (name, result.stdout.strip()))
+    return os.path.getsize(target)
+
+
+def measure():
+    """
+    heap of the import and of a connected remote, runs in the interpreter of a variant
+
+    :returns: dict with the retained bytes
+    """
+    import gc
+    import tracemalloc
+    tracemalloc.start()
+    import blesim
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    import remote.control as control
+    gc.collect()
+    imported = tracemalloc.get_traced_memory()[0]
+    ble = blesim.BLE()
+    ble.add(blesim.remote())
+    remote = control.PoweredUPRemote(ble=ble)
+    done = []
+    remote.on_connect(lambda: done.append(True))
+    remote.connect()
+    ble.run()
+    if not done:
+        raise AssertionError("remote not connected")
+    gc.collect()
+    connected = tracemalloc.get_traced_memory()[0]
+    return {"import": imported - before, "remote": connected - before}
+
+
+def build(variant, out, command):
+    """
+    build a variant
+
+    :param variant: name of the variant
+    :param out: output directory
+    :param command: mpy-cross command or None to only write the sources
+    :returns: report of the variant
+    """
+    sources, removed = strip(variant)
+    directory = os.path.join(out, variant, "remote")
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    modules = {}
+    for module, source in sources.items():
+        _check_consts(source, "remote/%s.py" % module)
+        path = os.path.join(directory, module + ".py")
+        with open(path, "w") as f:
+            f.write(source)
+        modules[module] = {"source": os.path.getsize(os.path.join(ROOT, "remote", module + ".py")),
+                           "stripped": len(source.encode()),
+                           "mpy": compile_mpy(command, path, path[:-3] + ".mpy", "remote/%s.py" % module)
+                           if command else None}
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join((os.path.join(out, variant), os.path.join(ROOT, "host"))))
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure"], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode:
+        raise RuntimeError("variant %s does not run: %s" % (variant, result.stdout.strip()))
+    return {"modules": modules, "removed": removed, "heap": json.loads(result.stdout)}
+
+
+def report(results):
+    """
+    print the sizes and the heap per variant
+
+    :param results: dict of variant -> report
+    :returns: nothing
+    """
+    for variant, result in results.items():
+        print("%s (heap: import %d bytes, connected remote %d bytes, host)" %
+              (variant, result["heap"]["import"], result["heap"]["remote"]))
+        totals = [0, 0, 0]
+        for module, sizes in result["modules"].items():
+            mpy = sizes["mpy"]
+            print("  %-10s source %6d  stripped %6d  mpy %6s" % (module, sizes["source"], sizes["stripped"],
+                                                              mpy if mpy is not None else "-"))
+            totals[0] += sizes["source"]
+            totals[1] += sizes["stripped"]
+            totals[2] += mpy or 0
+        print("  %-10s source %6d  stripped %6d  mpy %6s" % ("total", totals[0], totals[1], totals[2] or "-"))
+        if result["removed"]:
+            print("  removed: %s" % ", ".join(result["removed"]))
+
+
+def run(args=()):
+    """
+    build the variants and print the report, it is also stored as report.json in the output directory
+
+    :param args: command line arguments
+    :returns: nothing
+    """
+    options = {"--variant": None, "--mpy-cross": None, "--out": os.path.join(ROOT, "dist")}
+    for index, arg in enumerate(args):
+        if arg in options and index + 1 < len(args):
+            options[arg] = args[index + 1]
+    command = _mpy_cross(options["--mpy-cross"])
+    if not command:
+        print("mpy-cross not found, only the stripped sources are written")
+    variants = [options["--variant"]] if options["--variant"] else list(VARIANTS)
+    results = {variant: build(variant, options["--out"], command) for variant in variants}
+    with open(os.path.join(options["--out"], "report.json"), "w") as f:
+        json.dump(results, f, indent=1)
+    report(results)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--measure"]:
+        print(json.dumps(measure()))
+    else:
+        run(sys.argv[1:])